@@ -0,0 +1,573 @@
+"""
+Simple timing benchmarks of GUNG. Run it with the names of the benchmarks to run (or without arguments to run all
+of them), i.e.:
+
+    python benchmarks.py bulk_build
+"""
+import gc
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+import time
+from cStringIO import StringIO
+
+from gung.qt.qt_core import QRect
+from gung.qt.qt_core import QRectF
+from gung.qt.qt_core import Qt
+from gung.qt.qt_gui import QBrush
+from gung.qt.qt_gui import QColor
+from gung.qt.qt_gui import QImage
+from gung.qt.qt_gui import QPainter
+from gung.qt.qt_gui import QPen
+from gung.qt.qt_widgets import QApplication
+from gung.qt.qt_widgets import QGraphicsItem
+from gung.qt.qt_widgets import QGraphicsView
+
+from gung.config import GungConfig, get_settings
+from gung.gungcommand import GungMoveCommand
+from gung.gungjournal import GungJournal
+from gung.gungscene import GungScene
+from gung.gungview import GungGraphicsView, versionString
+from gung.gungnode import GungItem, GungNode, GungAttribute, GungPlug, GungInPlug, GungOutPlug, GungGroup, GungEdge
+from gung.gungbinary import read_binary, write_binary
+from gung.gungmodel import GungModel, NodeRecord
+from gung.gungserializer import serializers
+
+
+def build_graph(scene, node_count, plug_count):
+    """
+    Fills the scene with a grid of nodes, each having plug_count attributes with one plug.
+    The last out plug of every node is connected with the first in plug of the next node.
+
+        :param GungScene scene:
+        :param int node_count:
+        :param int plug_count:
+        :rtype: list of GungNode
+    """
+    nodes = []
+    upstream_plug = None
+    for i in range(node_count):
+        node = GungNode("node%i" % i, None, scene)
+        node.setPos((i % 100) * 150.0, (i / 100) * 150.0)
+        out_plug = None
+        for j in range(plug_count):
+            a = GungAttribute(node, scene)
+            if j % 2:
+                out_plug = GungOutPlug(a, scene)
+            else:
+                plug = GungInPlug(a, scene)
+                if j == 0 and upstream_plug is not None:
+                    scene.create_edge_call(upstream_plug, plug)
+            a.rearrange_plugs()
+        node.rearrange_attributes()
+        upstream_plug = out_plug
+        nodes.append(node)
+    return nodes
+
+
+def timed(label, function, *args, **kwargs):
+    start = time.time()
+    result = function(*args, **kwargs)
+    print "%-50s %8.3f s" % (label, time.time() - start)
+    return result
+
+
+def get_memory():
+    """
+    Returns the resident set size of the process in bytes (None where /proc is not available) and the number
+    of the objects tracked by the garbage collector.
+    """
+    gc.collect()
+    try:
+        with open("/proc/self/statm") as statm:
+            rss = int(statm.read().split()[1]) * mmap.PAGESIZE
+    except EnvironmentError:
+        rss = None
+    return rss, len(gc.get_objects())
+
+
+def measured(label, count, function, *args, **kwargs):
+    """
+    Calls the function and prints the memory and the objects it has left behind per node (or per the unit passed
+    as a keyword argument). Returns the result of the function and the bytes per node (or None).
+    """
+    unit = kwargs.pop("unit", "node")
+    rss, objects = get_memory()
+    result = function(*args, **kwargs)
+    rss_after, objects_after = get_memory()
+    per_unit = None if rss is None else (rss_after - rss) / float(count)
+    print "%-50s %8s bytes, %6.1f objects per %s" % (label, "n/a" if per_unit is None else "%i" % per_unit,
+                                                        (objects_after - objects) / float(count), unit)
+    return result, per_unit
+
+
+def bench_bulk_build(node_count=10000, plug_count=5):
+    """
+    Compares the creation of a graph item by item with the creation inside of GungScene.bulk_build().
+    """
+    scene = GungScene()
+    timed("item by item: %i nodes, %i plugs each" % (node_count, plug_count),
+          build_graph, scene, node_count, plug_count)
+
+    scene = GungScene()
+
+    def bulk():
+        with scene.bulk_build():
+            build_graph(scene, node_count, plug_count)
+    timed("bulk_build: %i nodes, %i plugs each" % (node_count, plug_count), bulk)
+
+
+def build_model(model, node_count, plug_count):
+    """
+    Same graph as build_graph, made of the records of a headless GungModel.
+
+        :param GungModel model:
+        :param int node_count:
+        :param int plug_count:
+    """
+    upstream_plug = None
+    for i in range(node_count):
+        node = model.add_node("node%i" % i, (i % 100) * 150.0, (i / 100) * 150.0)
+        out_plug = None
+        for j in range(plug_count):
+            a = model.add_attribute(node.node_id)
+            if j % 2:
+                out_plug = model.add_plug(a.node_id, "GungOutPlug")
+            else:
+                plug = model.add_plug(a.node_id, "GungInPlug")
+                if j == 0 and upstream_plug is not None:
+                    model.add_edge(upstream_plug.node_id, plug.node_id)
+        upstream_plug = out_plug
+
+
+def bench_model(node_count=10000, plug_count=5):
+    """
+    Compares building and loading the graph in the scene with building it in a headless GungModel.
+    """
+    model = GungModel()
+    timed("model: %i nodes, %i plugs each" % (node_count, plug_count), build_model, model, node_count, plug_count)
+    memory_model = GungModel()
+    _, model_memory = measured("model memory", node_count, build_model, memory_model, node_count, plug_count)
+    xml_string = timed("model as_xml().toxml()", lambda: model.as_xml().toxml())
+    timed("model write_xml (streamed)", model.write_xml, StringIO())
+    timed("model from_xml", GungModel().from_xml, xml_string)
+    timed("model load_xml (streamed)", GungModel().load_xml, StringIO(xml_string.encode("utf-8")))
+
+    scene = GungScene()
+
+    def bulk():
+        with scene.bulk_build():
+            build_graph(scene, node_count, plug_count)
+    timed("scene bulk_build: %i nodes, %i plugs each" % (node_count, plug_count), bulk)
+    # --- the items of the scene are the baseline, before the model they were the only form of the graph.
+    memory_scene = GungScene()
+    _, scene_memory = measured("scene memory (baseline)", node_count, build_graph, memory_scene, node_count,
+                               plug_count)
+    if model_memory and scene_memory:
+        print "%-50s %8.1f x" % ("scene / model memory", scene_memory / model_memory)
+    timed("scene as_xml().toxml()", lambda: scene.as_xml().toxml())
+    timed("scene write_xml (streamed)", scene.write_xml, StringIO())
+    timed("scene from_xml", GungScene().from_xml, xml_string)
+    timed("scene load_xml (streamed)", GungScene().load_xml, StringIO(xml_string.encode("utf-8")))
+
+
+def bench_binary(node_count=10000, plug_count=4):
+    """
+    Compares saving and loading a graph of about 100k items in xml and in the binary format.
+    """
+    model = GungModel()
+    build_model(model, node_count, plug_count)
+    print "%i items" % len(model)
+
+    xml_file = StringIO()
+    timed("model write_xml", model.write_xml, xml_file)
+    binary_file = StringIO()
+    timed("model write_binary", write_binary, model, binary_file)
+    print "xml: %i bytes, binary: %i bytes" % (len(xml_file.getvalue()), len(binary_file.getvalue()))
+
+    timed("model load_xml", GungModel().load_xml, StringIO(xml_file.getvalue()))
+    timed("model read_binary", read_binary, GungModel(), StringIO(binary_file.getvalue()))
+    timed("scene load_xml", GungScene().load_xml, StringIO(xml_file.getvalue()))
+    timed("scene load_binary", GungScene().load_binary, StringIO(binary_file.getvalue()))
+
+
+def bench_lazy_groups(node_count=10000, plug_count=4):
+    """
+    Compares loading the whole binary file into the scene with loading only the frames of the groups (every row
+    of the graph is a group), then loads the groups near the viewport.
+    """
+    model = GungModel()
+    build_model(model, node_count, plug_count)
+    groups = {}
+    for record in list(model.get_children()):
+        if isinstance(record, NodeRecord):
+            if record.pos_y not in groups:
+                groups[record.pos_y] = model.add_group()
+            model.set_parent(record.node_id, groups[record.pos_y].node_id)
+    binary_file = StringIO()
+    write_binary(model, binary_file)
+    print "%i items" % len(model)
+
+    timed("scene load_binary", GungScene().load_binary, StringIO(binary_file.getvalue()))
+    scene = GungScene()
+    timed("scene load_binary, lazy groups", scene.load_binary, StringIO(binary_file.getvalue()), lazy_groups=True)
+    timed("update_viewport: %i nodes" % len(scene.get_nodes()), scene.update_viewport, QRectF(0, 0, 1920, 1080))
+    print "%i nodes loaded" % len(scene.get_nodes())
+
+
+def bench_serializers(node_count=10000, plug_count=4):
+    """
+    Saves and loads the same graph with every registered serializer and with the minidom document of as_xml.
+    """
+    model = GungModel()
+    build_model(model, node_count, plug_count)
+    print "%i items" % len(model)
+
+    xml_string = timed("minidom write", lambda: model.as_xml().toxml().encode("utf-8"))
+    timed("minidom read", GungModel().from_xml, xml_string)
+    for name, serializer in serializers.items():
+        model_file = StringIO()
+        timed("%s write" % name, serializer.write, model, model_file)
+        timed("%s read (%i bytes)" % (name, len(model_file.getvalue())), serializer.read, GungModel(),
+              StringIO(model_file.getvalue()))
+
+
+def bench_virtualization(node_count=50000, plug_count=5, pan_count=100):
+    """
+    Compares loading a big model into the regular and the virtualized scene, then pans the virtualized one.
+    """
+    model = GungModel()
+    build_model(model, node_count, plug_count)
+
+    scene = GungScene()
+    timed("load_model: %i nodes, %i plugs each" % (node_count, plug_count), scene.load_model, model)
+
+    scene = GungScene()
+
+    def load():
+        scene.set_virtualized(True)
+        scene.load_model(model)
+        scene.update_viewport(QRectF(0, 0, 1920, 1080))
+    timed("virtualized load_model: %i nodes, %i plugs each" % (node_count, plug_count), load)
+
+    def pan():
+        for i in range(pan_count):
+            scene.update_viewport(QRectF(i * 150.0, i * 50.0, 1920, 1080))
+    timed("virtualized pan: %i steps" % pan_count, pan)
+
+
+def render_scene(scene, width=1920, height=1080, repeat=10):
+    """
+    Renders the whole scene fitted in the image of provided size (just like zoom_to_all in the view) repeat times.
+    """
+    image = QImage(width, height, QImage.Format_ARGB32)
+    painter = QPainter(image)
+    source = scene.itemsBoundingRect()
+    for _ in range(repeat):
+        scene.render(painter, QRectF(0, 0, width, height), source)
+    painter.end()
+
+
+def bench_level_of_detail(node_count=10000, plug_count=5):
+    """
+    Compares the repaint of a zoomed out graph with and without the level of detail thresholds.
+    """
+    scene = GungScene()
+    with scene.bulk_build():
+        build_graph(scene, node_count, plug_count)
+
+    thresholds = get_settings().level_of_detail
+    scene.override_settings(level_of_detail=dict.fromkeys(thresholds._fields, 0.0))
+    timed("render without level of detail: %i nodes" % node_count, render_scene, scene)
+    scene.override_settings(level_of_detail=thresholds._asdict())
+    timed("render with level of detail: %i nodes" % node_count, render_scene, scene)
+
+
+def bench_edge_layer(node_count=10000, plug_count=5):
+    """
+    Compares the repaint of a graph with every edge painting itself and with the edges painted by the edge layer.
+    """
+    scene = GungScene()
+    with scene.bulk_build():
+        build_graph(scene, node_count, plug_count)
+
+    timed("render edge items: %i edges" % len(scene.get_edges()), render_scene, scene)
+    timed("set_batched_edges", scene.set_batched_edges, True)
+    timed("render edge layer: %i edges" % len(scene.get_edges()), render_scene, scene)
+
+
+def get_item_styles(item):
+    """
+    Returns the pens and brushes (and the colors kept along with them) that the item created for itself before
+    they were shared through gung.gungstyle, it's the baseline of bench_styles.
+
+        :param GungItem item:
+        :rtype: list
+    """
+    settings = get_settings()
+    if isinstance(item, GungNode):
+        node_color = QColor(*settings.node.node_color)
+        return [node_color, QBrush(node_color), QBrush(Qt.darkGray),
+                QPen(QColor(*settings.node.selected_edge_color)), QPen(QColor(40, 40, 40)),
+                QPen(QColor(*settings.node.unselected_edge_color)), QPen(QColor(*settings.node.text_color))]
+    if isinstance(item, GungPlug):
+        plug_color = QColor(150, 255, 150)
+        return [QPen(plug_color.lighter()), QBrush(plug_color), QBrush(plug_color.lighter())]
+    if isinstance(item, GungGroup):
+        group_color = QColor(*settings.group.group_background)
+        return [group_color, QBrush(group_color)]
+    if isinstance(item, GungEdge):
+        return [QPen(QColor(0, 0, 0))]
+    return []
+
+
+def bench_styles(node_count=10000, plug_count=5):
+    """
+    Compares the construction time and the memory per item of a graph whose items create their own pens and
+    brushes (the baseline, see get_item_styles) with the one whose items share them through the style registry.
+    """
+    # --- the node, its attributes and plugs and the edge to the previous node
+    item_count = node_count * (2 + 2 * plug_count) - 1
+
+    def build(item_styles):
+        scene = GungScene()
+        with scene.bulk_build():
+            build_graph(scene, node_count, plug_count)
+        if item_styles:
+            for item in scene.items():
+                if isinstance(item, GungItem):
+                    item.item_styles = get_item_styles(item)
+        return scene
+
+    timed("build with per-item styles (baseline): %i items" % item_count, build, True)
+    timed("build with shared styles: %i items" % item_count, build, False)
+    baseline, baseline_memory = measured("per-item styles (baseline) memory", item_count, build, True, unit="item")
+    scene, memory = measured("shared styles memory", item_count, build, False, unit="item")
+    if baseline_memory and memory:
+        print "%-50s %8i bytes per item" % ("saved by the shared styles", baseline_memory - memory)
+
+    items = [x for x in scene.items() if isinstance(x, GungItem)]
+    pens = set(id(x.get_pen()) for x in items if not isinstance(x, GungAttribute))
+    brushes = set(id(x.get_brush()) for x in items if not isinstance(x, (GungAttribute, GungEdge)))
+    print "%i items use %i pens and %i brushes" % (len(items), len(pens), len(brushes))
+
+
+def bench_settings(lookup_count=100000, node_count=10000, plug_count=5):
+    """
+    Compares reading a setting from the config parser with reading it from the settings snapshot, then builds
+    a graph which reads the settings in every constructor and plug rearrange.
+    """
+    parser = GungConfig()
+
+    def parse():
+        for _ in xrange(lookup_count):
+            parser.getfloat("Node", "MinimalWidth")
+    timed("config.getfloat: %i lookups" % lookup_count, parse)
+
+    def snapshot():
+        settings = get_settings()
+        for _ in xrange(lookup_count):
+            settings.node.minimal_width
+    timed("settings snapshot: %i lookups" % lookup_count, snapshot)
+
+    timed("item by item: %i nodes, %i plugs each" % (node_count, plug_count),
+          build_graph, GungScene(), node_count, plug_count)
+
+
+class BaselineGraphicsView(GungGraphicsView):
+    """
+    The view with the background drawn as before the pixmap caching: every repaint draws the cross and the version
+    text over the whole viewport again and every scroll repaints the whole viewport. Kept as the reference for
+    bench_background.
+    """
+    def __init__(self, parent=None):
+        GungGraphicsView.__init__(self, parent)
+        self.setViewportUpdateMode(QGraphicsView.FullViewportUpdate)
+
+    def scrollContentsBy(self, dx, dy):
+        return QGraphicsView.scrollContentsBy(self, dx, dy)
+
+    def drawBackground(self, painter, rect):
+        painter.setFont(self.font)
+        painter.setPen(self.text_pen)
+        painter.setBrush(self.text_brush)
+        painter.drawLine(0, 0, 100, 0)
+        painter.drawLine(0, 0, 0, 100)
+        painter.setWorldMatrixEnabled(False)
+
+        image = QImage()
+
+        w = image.size().width()
+        h = image.size().height()
+        r = QRect(1, self.height() - h - 5, w, h)
+        painter.drawImage(r, image)
+
+        painter.drawLine(self.width() / 2, 0, self.width() / 2, self.height())
+        painter.drawLine(0, self.height() / 2, self.width(), self.height() / 2)
+
+        painter.drawText(w + 2, self.height() - 6, versionString)
+
+        return QGraphicsView.drawBackground(self, painter, rect)
+
+
+def bench_background(node_count=1000, plug_count=5, pan_count=100, zoom_count=100):
+    """
+    Compares the times of the scroll and wheel zoom driven repaints of the view with the background drawn as before
+    (see BaselineGraphicsView) and with the cached background, which repaints only the overlay after a scroll and
+    tiles the grid from a pixmap of two cells.
+    """
+    scene = GungScene()
+    with scene.bulk_build():
+        build_graph(scene, node_count, plug_count)
+
+    def pan(view):
+        scroll_bar = view.horizontalScrollBar()
+        viewport = view.viewport()
+        start = scroll_bar.value()
+        for i in range(pan_count):
+            # --- 5 pixels per frame, going back every 20 frames to stay within the scroll range
+            scroll_bar.setValue(start + 5 * (i % 20))
+            viewport.repaint()
+
+    def zoom(view):
+        viewport = view.viewport()
+        for i in range(zoom_count):
+            # --- the steps of the mouse wheel (see GungGraphicsView.wheelEvent), 10 in and then 10 out
+            view.zoom_start_transform = view.transform()
+            view.zoom_start = viewport.rect().center()
+            view.zoom(1.1 if i % 20 < 10 else 1.0 / 1.1)
+            viewport.repaint()
+
+    for label, view_class, grid_visible in (("baseline", BaselineGraphicsView, False),
+                                            ("cached", GungGraphicsView, False),
+                                            ("cached with grid", GungGraphicsView, True)):
+        view = view_class()
+        view.resize(1920, 1080)
+        view.setScene(scene)
+        view.set_grid_visible(grid_visible)
+        view.show()
+        view.horizontalScrollBar().setValue(view.horizontalScrollBar().maximum() / 2)
+        QApplication.processEvents()
+        timed("pan %s: %i frames" % (label, pan_count), pan, view)
+        timed("zoom %s: %i frames" % (label, zoom_count), zoom, view)
+        view.close()
+
+
+def bench_item_cache(node_count=1000, frame_count=50):
+    """
+    Counts the paint calls of the nodes while the view pans and the nodes are dragged, without and with
+    the device coordinate cache.
+    """
+    for cache_mode in (QGraphicsItem.NoCache, QGraphicsItem.DeviceCoordinateCache):
+        class CountedNode(GungNode):
+            paint_count = 0
+
+            def paint(self, painter, option, widget=None):
+                CountedNode.paint_count += 1
+                return GungNode.paint(self, painter, option, widget)
+        CountedNode.cache_mode = cache_mode
+
+        scene = GungScene()
+        with scene.bulk_build():
+            nodes = [CountedNode("node%i" % i, None, scene) for i in range(node_count)]
+            for i, node in enumerate(nodes):
+                node.setPos((i % 20) * 150.0, (i / 20) * 150.0)
+        view = GungGraphicsView()
+        view.resize(1920, 1080)
+        view.setScene(scene)
+        image = QImage(1920, 1080, QImage.Format_ARGB32)
+
+        def pan():
+            for _ in range(frame_count):
+                view.translate(5.0, 3.0)
+                view.render(image)
+
+        def drag():
+            for i in range(frame_count):
+                for node in nodes[:20]:
+                    node.moveBy(2.0, 1.0)
+                view.render(image)
+
+        for label, function in (("pan", pan), ("drag", drag)):
+            CountedNode.paint_count = 0
+            timed("%s with cache mode %s: %i frames" % (label, cache_mode, frame_count), function)
+            print "%i paint calls" % CountedNode.paint_count
+
+
+def bench_labels(node_count=1000, frame_count=50):
+    """
+    Paints the names of the nodes with QPainter.drawText and with the cached, elided labels of the nodes.
+    """
+    scene = GungScene()
+    with scene.bulk_build():
+        nodes = [GungNode("node_with_a_long_name%i" % i, None, scene) for i in range(node_count)]
+    image = QImage(200, 50, QImage.Format_ARGB32)
+
+    def paint(cached):
+        painter = QPainter(image)
+        for _ in range(frame_count):
+            for node in nodes:
+                if cached:
+                    node.paint_labels(painter)
+                else:
+                    painter.drawText(5, 15, node.properties['name'])
+        painter.end()
+    timed("drawText: %i nodes, %i frames" % (node_count, frame_count), paint, False)
+    timed("cached labels: %i nodes, %i frames" % (node_count, frame_count), paint, True)
+
+
+def bench_journal(node_count=10000, plug_count=4, move_count=100):
+    """
+    Compares saving the whole scene with journaling the moves of three nodes.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        scene = GungScene()
+        with scene.bulk_build():
+            nodes = build_graph(scene, node_count, plug_count)
+        journal = GungJournal(os.path.join(directory, "scene.json"), compact_after=0)
+        journal.attach(scene)
+        timed("full save: %i nodes" % node_count, journal.compact)
+
+        def move():
+            for i in range(move_count):
+                command = GungMoveCommand(scene)
+                for node in nodes[:3]:
+                    pos = node.pos()
+                    command.nodes[node.properties['node_id']] = [pos.x(), pos.y(), pos.x() + 1.0, pos.y()]
+                scene.undoStack.push(command)
+        timed("journaled moves of 3 nodes: %i commands" % move_count, move)
+        journal.detach()
+    finally:
+        shutil.rmtree(directory)
+
+
+BENCHMARKS = [
+    ("bulk_build", bench_bulk_build),
+    ("model", bench_model),
+    ("binary", bench_binary),
+    ("lazy_groups", bench_lazy_groups),
+    ("serializers", bench_serializers),
+    ("virtualization", bench_virtualization),
+    ("level_of_detail", bench_level_of_detail),
+    ("edge_layer", bench_edge_layer),
+    ("styles", bench_styles),
+    ("settings", bench_settings),
+    ("background", bench_background),
+    ("item_cache", bench_item_cache),
+    ("labels", bench_labels),
+    ("journal", bench_journal),
+]
+
+
+if __name__ == "__main__":
+    app = QApplication([])
+
+    selected = sys.argv[1:]
+    for name, benchmark in BENCHMARKS:
+        if selected and name not in selected:
+            continue
+        print "--- %s" % name
+        benchmark()
@@ -1,10 +1,14 @@
 import ConfigParser
 import os
+from collections import OrderedDict, namedtuple
+
+config_path = os.path.dirname(__file__) + os.path.sep + "gung.cfg"
 
 
 class GungConfig(object):
     """
-    Singleton class that holds the config of the whole Gung.
+    Singleton class that holds the config of the whole Gung. The items read the typed snapshot of it (see
+    get_settings) instead of parsing the strings of this one.
     """
     _instance = None
 
@@ -13,8 +17,151 @@ class GungConfig(object):
             GungConfig._instance = ConfigParser.ConfigParser()
 
             try:
-                GungConfig._instance.readfp(open(os.path.dirname(__file__) + os.path.sep + "gung.cfg", "r"))
+                GungConfig._instance.readfp(open(config_path, "r"))
             except ConfigParser.ParsingError, e:
                 print "Failed to read config file."
                 print e
         return GungConfig._instance
+
+
+def parse_color(value):
+    """
+    Returns the color stored in the config as "r,g,b". It's a tuple, so that the settings stay immutable and don't
+    need Qt (the headless GungModel reads them too), use QColor(*color) to paint with it.
+
+        :param str value:
+        :rtype: tuple of int
+    """
+    r, g, b = [int(x) for x in value.split(",")]
+    return r, g, b
+
+
+def parse_bool(value):
+    """
+    Returns the boolean stored in the config as "True", "yes", "on" or "1" (anything else is False).
+
+        :param str value:
+        :rtype: bool
+    """
+    return value.strip().lower() in ("true", "yes", "on", "1")
+
+
+# --- sections of gung.cfg that the settings are made of: section -> (attribute name of the section,
+# --- options as (option, attribute name, type, default value used when the option is missing)).
+settings_schema = OrderedDict([
+    ("Node", ("node", (("MinimalWidth", "minimal_width", float, 100.0),
+                       ("MinimalHeight", "minimal_height", float, 50.0),
+                       ("AttributesOffset", "attributes_offset", float, 20.0),
+                       ("NodeColor", "node_color", parse_color, "120,120,100"),
+                       ("SelectedEdgeColor", "selected_edge_color", parse_color, "255,255,255"),
+                       ("UnSelectedEdgeColor", "unselected_edge_color", parse_color, "58,57,57"),
+                       ("TextColor", "text_color", parse_color, "255,255,255")))),
+    ("Attribute", ("attribute", (("Height", "height", float, 80.0),))),
+    ("Resizer", ("resizer", (("Width", "width", float, 10.0),
+                             ("Height", "height", float, 10.0)))),
+    ("Group", ("group", (("GroupBackground", "group_background", parse_color, "255,255,0"),
+                         ("GroupOffset", "group_offset", float, 10.0)))),
+    ("View", ("view", (("UpdateMode", "update_mode", str, "Smart"),
+                       ("Grid", "grid", parse_bool, "False"),
+                       ("GridSpacing", "grid_spacing", float, 20.0),
+                       ("GridMinimalSpacing", "grid_minimal_spacing", float, 8.0),
+                       ("GridColor", "grid_color", parse_color, "160,160,160")))),
+    ("Virtualization", ("virtualization", (("Margin", "margin", float, 500.0),
+                                           ("CellSize", "cell_size", float, 1000.0),
+                                           ("PoolSize", "pool_size", int, 1000)))),
+    ("EdgeLayer", ("edge_layer", (("CellSize", "cell_size", float, 500.0),))),
+    ("Journal", ("journal", (("CompactAfter", "compact_after", int, 1000),))),
+    ("LevelOfDetail", ("level_of_detail", (("Text", "text", float, 0.5),
+                                           ("Antialiasing", "antialiasing", float, 0.5),
+                                           ("Plugs", "plugs", float, 0.35),
+                                           ("Curves", "curves", float, 0.25)))),
+])
+
+_section_classes = OrderedDict((name, namedtuple(section + "Settings", [x[1] for x in options]))
+                               for section, (name, options) in settings_schema.items())
+
+
+class GungSettings(namedtuple("GungSettings", _section_classes.keys())):
+    """
+    Frozen snapshot of the config with all the values already parsed, so reading a setting is just an attribute
+    lookup, i.e. settings.node.minimal_width. Every section is a named tuple too and the colors are (r, g, b) tuples.
+    """
+    __slots__ = ()
+
+    def override(self, overrides):
+        """
+        Returns a copy of these settings with some of the values replaced.
+
+            :param dict overrides: section attribute name -> {option attribute name: value},
+                i.e. {"node": {"minimal_width": 150.0}}
+            :rtype: GungSettings
+        """
+        sections = dict((name, getattr(self, name)._replace(**values)) for name, values in overrides.items())
+        return self._replace(**sections)
+
+
+def read_settings(parser):
+    """
+    Parses all the options of the schema from the config parser. The missing options get their default values.
+
+        :param ConfigParser.ConfigParser parser:
+        :rtype: GungSettings
+    """
+    sections = []
+    for section, (name, options) in settings_schema.items():
+        values = []
+        for option, _, value_type, default in options:
+            try:
+                value = parser.get(section, option)
+            except (ConfigParser.NoSectionError, ConfigParser.NoOptionError):
+                value = default
+            values.append(value_type(value) if isinstance(value, basestring) else value)
+        sections.append(_section_classes[name](*values))
+    return GungSettings(*sections)
+
+
+_settings = None
+_settings_listeners = []
+
+
+def get_settings():
+    """
+    Returns the current settings of Gung. The scenes can override some of them (see GungScene.override_settings).
+
+        :rtype: GungSettings
+    """
+    global _settings
+    if _settings is None:
+        _settings = read_settings(GungConfig())
+    return _settings
+
+
+def reload_settings(path=None):
+    """
+    Reads the config file again (or the provided one instead) and passes the new settings to the listeners,
+    so that the live scenes and items can be updated.
+
+        :param str path:
+        :rtype: GungSettings
+    """
+    global _settings
+    parser = GungConfig()
+    for section in parser.sections():
+        parser.remove_section(section)
+    with open(path or config_path, "r") as config_file:
+        parser.readfp(config_file)
+
+    _settings = read_settings(parser)
+    for listener in _settings_listeners:
+        listener(_settings)
+    return _settings
+
+
+def add_settings_listener(listener):
+    """
+    Registers the function to call with the new settings whenever they are reloaded. The listener is kept alive,
+    so don't pass the bound methods of the objects that should be collected.
+
+        :param listener: callable taking GungSettings
+    """
+    _settings_listeners.append(listener)
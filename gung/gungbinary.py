@@ -0,0 +1,464 @@
+"""
+Compact binary format of the GUNG graphs. It's much faster to write and read than the xml and a few times smaller,
+but the xml stays the interchange format (see GungScene.write_xml), since this one is bound to the record classes.
+
+The file is made of:
+
+    header       magic, version, number of the strings, of the records of every kind, of the extras and of the groups,
+                 bounding box of the graph (see BinaryHeader)
+    main block   records that are not inside of the top level groups
+    groups       for every top level group with children: its id, bounding box, offset of its block, ids of its plugs
+                 connected with the edges and ids of all its records (see BinaryGroup)
+    group blocks records inside of the groups, a block per group, so they can be loaded later (see read_binary_group)
+
+and every block is made of:
+
+    counts       number of the strings, of the records of every kind and of the extras
+    strings      offsets of the strings (count + 1 little endian uint32) followed by their utf-8 bytes
+    records      one section of fixed width records per kind (see record_kinds), every record is the element type
+                 (index of the string), the parent id and the fields of the kind packed with struct
+    extras       properties that the kind doesn't have fields for (custom properties and the fields of the record
+                 subclasses) as (node id, key, type, value) where the key and the value are indices of the strings
+
+Version 1 had no groups, the counts of its only block were in the header. Everything is little endian. The file is
+read through mmap, so only the parts being unpacked are copied.
+"""
+import mmap
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from contextlib import contextmanager
+
+from gungmodel import GungRecord, NodeRecord, AttributeRecord, PlugRecord, EdgeRecord, GroupRecord, record_classes
+
+MAGIC = "GUNB"
+VERSION = 2
+
+# --- record classes in order of their sections in the file, every record is stored in the section of the first
+# --- class it's an instance of, so the plain GungRecord has to be the last one.
+record_kinds = (NodeRecord, AttributeRecord, PlugRecord, EdgeRecord, GroupRecord, GungRecord)
+
+BinaryHeader = namedtuple("BinaryHeader", ["version", "string_count", "record_counts", "extra_count", "bounds",
+                                           "groups"])
+# --- bounds are (min x, min y, max x, max y) in the scene coordinates
+BinaryGroup = namedtuple("BinaryGroup", ["node_id", "bounds", "offset", "port_ids", "node_ids"])
+
+_prefix_struct = struct.Struct("<4sH")
+_header_structs = {
+    1: struct.Struct("<4sHHI%iIIdddd" % len(record_kinds)),
+    2: struct.Struct("<4sHHI%iIIIdddd" % len(record_kinds)),
+}
+_block_struct = struct.Struct("<I%iII" % len(record_kinds))
+_group_struct = struct.Struct("<iddddQII")
+_extra_struct = struct.Struct("<iIBI")
+
+# --- struct formats of the field types and type tags of the extras
+_field_formats = {bool: "?", int: "i", float: "d", basestring: "I"}
+_STRING, _INT, _FLOAT, _BOOL = range(4)
+
+
+class _RecordSection(object):
+    """
+    Layout of the records of one kind, made from the fields and the field types of its record class.
+    """
+
+    def __init__(self, record_class):
+        self.record_class = record_class
+        self.fields = record_class.fields
+        formats = []
+        # --- positions of the fields stored as indices of the strings
+        self.string_fields = []
+        for i, (field, field_type) in enumerate(zip(self.fields, record_class.field_types)):
+            if field_type not in _field_formats:
+                raise TypeError("Field %s of %s can't be stored." % (field, record_class.__name__))
+            field_format = _field_formats[field_type]
+            formats.append(field_format)
+            if field_format == "I":
+                self.string_fields.append(i)
+        self.struct = struct.Struct("<Ii" + "".join(formats))
+
+
+_sections = [_RecordSection(x) for x in record_kinds]
+
+
+def write_binary(model, target):
+    """
+    Writes the model to the file in the binary format. The content of every top level group is written in its own
+    block, so it can be loaded later (see read_binary).
+
+        :param gung.gungmodel.GungModel model:
+        :param target: path or file object
+    """
+    # --- top level group id -> ids of the records inside of it
+    group_ids = {}
+    for record in model.get_children():
+        if isinstance(record, GroupRecord) and model.get_child_ids(record.node_id):
+            group_ids[record.node_id] = set(_iter_descendant_ids(model, record.node_id))
+    owners = {}
+    for group_id, node_ids in group_ids.items():
+        for node_id in node_ids:
+            owners[node_id] = group_id
+
+    main_records = []
+    group_records = dict((x, []) for x in group_ids)
+    for record in model.iter_records():
+        group_id = owners.get(record.node_id)
+        (main_records if group_id is None else group_records[group_id]).append(record)
+
+    blocks = [_pack_block(main_records)]
+    groups = []
+    for record in model.get_children():
+        if record.node_id not in group_records:
+            continue
+        blocks.append(_pack_block(group_records[record.node_id]))
+        node_ids = [x.node_id for x in group_records[record.node_id]]
+        port_ids = [x for x in node_ids if model.get_plug_edge_ids(x)]
+        groups.append(BinaryGroup(record.node_id, _get_group_bounds(model, record), None, port_ids, node_ids))
+
+    bounds = _get_bounds(model, groups)
+    string_count = sum(x[1] for x in blocks)
+    record_counts = [sum(x[2][i] for x in blocks) for i in range(len(record_kinds))]
+    extra_count = sum(x[3] for x in blocks)
+    header = _header_structs[VERSION].pack(MAGIC, VERSION, 0, string_count,
+                                           *(record_counts + [extra_count, len(groups)] + list(bounds)))
+
+    table_size = sum(_group_struct.size + 4 * (len(x.port_ids) + len(x.node_ids)) for x in groups)
+    offset = len(header) + len(blocks[0][0]) + table_size
+    table = []
+    for group, block in zip(groups, blocks[1:]):
+        table.append(_group_struct.pack(group.node_id, *(list(group.bounds) + [offset, len(group.port_ids),
+                                                                               len(group.node_ids)])))
+        table.append(_pack_ids(group.port_ids + group.node_ids))
+        offset += len(block[0])
+
+    binary_file = open(target, "wb") if isinstance(target, basestring) else target
+    try:
+        binary_file.write(header)
+        binary_file.write(blocks[0][0])
+        binary_file.write("".join(table))
+        for block in blocks[1:]:
+            binary_file.write(block[0])
+    finally:
+        if binary_file is not target:
+            binary_file.close()
+
+
+def _iter_descendant_ids(model, node_id):
+    for child_id in model.get_child_ids(node_id):
+        yield child_id
+        for descendant_id in _iter_descendant_ids(model, child_id):
+            yield descendant_id
+
+
+def _pack_block(records):
+    """
+    Returns the block of the records as (packed block, number of the strings, numbers of the records of every kind,
+    number of the extras).
+    """
+    strings = {}
+
+    def get_string_index(value):
+        if isinstance(value, unicode):
+            value = value.encode("utf-8")
+        try:
+            return strings[value]
+        except KeyError:
+            index = strings[value] = len(strings)
+            return index
+
+    kind_records = [[] for _ in _sections]
+    for record in records:
+        for section_records, section in zip(kind_records, _sections):
+            if isinstance(record, section.record_class):
+                section_records.append(record)
+                break
+
+    packed_sections = []
+    extras = []
+    for section_records, section in zip(kind_records, _sections):
+        pack = section.struct.pack
+        packed = []
+        for record in section_records:
+            values = [getattr(record, x) for x in section.fields]
+            for i in section.string_fields:
+                values[i] = get_string_index(values[i])
+            packed.append(pack(get_string_index(record.element_type), record.parent_id, *values))
+
+            for key, value in record.items():
+                if key in section.fields:
+                    continue
+                if isinstance(value, bool):
+                    value_type, value = _BOOL, str(value)
+                elif isinstance(value, (int, long)):
+                    value_type, value = _INT, str(value)
+                elif isinstance(value, float):
+                    value_type, value = _FLOAT, repr(value)
+                else:
+                    value_type = _STRING
+                    value = value if isinstance(value, basestring) else str(value)
+                extras.append(_extra_struct.pack(record.node_id, get_string_index(key), value_type,
+                                                 get_string_index(value)))
+        packed_sections.append("".join(packed))
+
+    string_list = sorted(strings, key=strings.get)
+    offsets = array("I", [0])
+    for value in string_list:
+        offsets.append(offsets[-1] + len(value))
+    if sys.byteorder == "big":
+        offsets.byteswap()
+
+    counts = [len(x) for x in kind_records]
+    block = [_block_struct.pack(len(string_list), *(counts + [len(extras)])), offsets.tostring(),
+             "".join(string_list)] + packed_sections + extras
+    return "".join(block), len(string_list), counts, len(extras)
+
+
+def _pack_ids(node_ids):
+    ids = array("i", node_ids)
+    if sys.byteorder == "big":
+        ids.byteswap()
+    return ids.tostring()
+
+
+def _unpack_ids(buffer_, offset, count):
+    ids = array("i")
+    ids.fromstring(buffer_[offset:offset + count * ids.itemsize])
+    if sys.byteorder == "big":
+        ids.byteswap()
+    return ids.tolist()
+
+
+def _unite_bounds(bounds, rect):
+    if bounds is None:
+        return rect
+    return min(bounds[0], rect[0]), min(bounds[1], rect[1]), max(bounds[2], rect[2]), max(bounds[3], rect[3])
+
+
+def _get_group_bounds(model, group):
+    """
+    Returns the bounds of the nodes inside of the group, in the scene coordinates.
+    """
+    bounds = None
+    pending = [(group.node_id, group.pos_x, group.pos_y)]
+    while pending:
+        node_id, x, y = pending.pop()
+        for record in model.get_children(node_id):
+            if isinstance(record, NodeRecord):
+                rect = (x + record.pos_x, y + record.pos_y, x + record.pos_x + record.node_width,
+                        y + record.pos_y + record.node_height)
+                bounds = _unite_bounds(bounds, rect)
+            elif isinstance(record, GroupRecord):
+                pending.append((record.node_id, x + record.pos_x, y + record.pos_y))
+    return bounds or (group.pos_x, group.pos_y, group.pos_x, group.pos_y)
+
+
+def _get_bounds(model, groups):
+    bounds = None
+    for record in model.get_children():
+        if isinstance(record, NodeRecord):
+            rect = (record.pos_x, record.pos_y, record.pos_x + record.node_width, record.pos_y + record.node_height)
+            bounds = _unite_bounds(bounds, rect)
+    for group in groups:
+        bounds = _unite_bounds(bounds, group.bounds)
+    return bounds or (0.0, 0.0, 0.0, 0.0)
+
+
+def read_binary_header(source):
+    """
+    Returns the header of the binary file, i.e. to check the bounds of the graph without loading it.
+
+        :param source: path or file object
+        :rtype: BinaryHeader
+    """
+    with _open_buffer(source) as buffer_:
+        return _read_header(buffer_)[0]
+
+
+@contextmanager
+def _open_buffer(source):
+    """
+    Context manager returning the whole content of the file, mapped to the memory if it's a real file.
+    """
+    binary_file = open(source, "rb") if isinstance(source, basestring) else source
+    try:
+        try:
+            buffer_ = mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, EnvironmentError, ValueError):
+            # --- not a real file (i.e. StringIO) or an empty one
+            binary_file.seek(0)
+            buffer_ = binary_file.read()
+        try:
+            yield buffer_
+        finally:
+            if isinstance(buffer_, mmap.mmap):
+                buffer_.close()
+    finally:
+        if binary_file is not source:
+            binary_file.close()
+
+
+def _read_header(buffer_):
+    """
+    Returns the header of the file and the offset of its main block.
+    """
+    if len(buffer_) < _prefix_struct.size:
+        raise ValueError("The file is too short to be a binary Gung graph.")
+    magic, version = _prefix_struct.unpack_from(buffer_)
+    if magic != MAGIC:
+        raise ValueError("The file is not a binary Gung graph.")
+    if version not in _header_structs:
+        raise ValueError("Version %i of the binary Gung graph is not supported (the latest one is %i)."
+                         % (version, VERSION))
+    header_struct = _header_structs[version]
+    if len(buffer_) < header_struct.size:
+        raise ValueError("The file is too short to be a binary Gung graph.")
+
+    values = header_struct.unpack_from(buffer_)
+    kind_count = len(record_kinds)
+    record_counts = values[4:4 + kind_count]
+    extra_count = values[4 + kind_count]
+    if version == 1:
+        return BinaryHeader(version, values[3], record_counts, extra_count, values[-4:], ()), header_struct.size
+
+    # --- the table of the groups follows the main block
+    offset = _skip_block(buffer_, header_struct.size)
+    groups = []
+    for _ in xrange(values[5 + kind_count]):
+        group_values = _group_struct.unpack_from(buffer_, offset)
+        offset += _group_struct.size
+        port_count, id_count = group_values[-2:]
+        ids = _unpack_ids(buffer_, offset, port_count + id_count)
+        offset += 4 * len(ids)
+        groups.append(BinaryGroup(group_values[0], group_values[1:5], group_values[5], ids[:port_count],
+                                  ids[port_count:]))
+    header = BinaryHeader(version, values[3], record_counts, extra_count, values[-4:], tuple(groups))
+    return header, header_struct.size
+
+
+def read_binary(model, source, lazy_groups=False):
+    """
+    Adds the content of the binary file to the model. The ids stored in the file are kept, so the model SHOULD be
+    empty.
+
+        :param gung.gungmodel.GungModel model:
+        :param source: path or file object
+        :param bool lazy_groups: if True, the records inside of the top level groups are not loaded, use
+            read_binary_group with the groups of the returned header to load them later. Their ids are claimed
+            in the model anyway.
+        :rtype: BinaryHeader
+    """
+    with _open_buffer(source) as buffer_:
+        header, offset = _read_header(buffer_)
+        if header.version == 1:
+            _read_records(model, buffer_, offset, header.string_count, header.record_counts, header.extra_count)
+        else:
+            _read_block(model, buffer_, offset)
+        if not lazy_groups:
+            for group in header.groups:
+                _read_block(model, buffer_, group.offset)
+
+    for record in model.iter_records(EdgeRecord):
+        model.connect(record)
+    used_ids = model.records.keys()
+    if lazy_groups:
+        for group in header.groups:
+            used_ids.extend(group.node_ids)
+    model.id_allocator.seed(used_ids)
+    return header
+
+
+def read_binary_group(model, source, group):
+    """
+    Adds the records inside of the group, skipped by read_binary with lazy_groups, to the model.
+
+        :param gung.gungmodel.GungModel model:
+        :param source: path or file object read by read_binary
+        :param BinaryGroup group: one of the groups of the header returned by read_binary
+    """
+    with _open_buffer(source) as buffer_:
+        _read_block(model, buffer_, group.offset)
+
+
+def _skip_block(buffer_, offset):
+    values = _block_struct.unpack_from(buffer_, offset)
+    string_count, record_counts, extra_count = values[0], values[1:-1], values[-1]
+    offset += _block_struct.size
+    blob_size = _unpack_ids(buffer_, offset + 4 * string_count, 1)[0]
+    offset += 4 * (string_count + 1) + blob_size
+    offset += sum(count * section.struct.size for count, section in zip(record_counts, _sections))
+    return offset + extra_count * _extra_struct.size
+
+
+def _read_block(model, buffer_, offset):
+    values = _block_struct.unpack_from(buffer_, offset)
+    return _read_records(model, buffer_, offset + _block_struct.size, values[0], values[1:-1], values[-1])
+
+
+def _read_records(model, buffer_, offset, string_count, record_counts, extra_count):
+    """
+    Reads the strings, the records and the extras of a block starting at the offset and returns the offset of
+    its end.
+    """
+    offsets = array("I")
+    offsets.fromstring(buffer_[offset:offset + (string_count + 1) * offsets.itemsize])
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    offset += len(offsets) * offsets.itemsize
+    blob = buffer_[offset:offset + offsets[-1]]
+    strings = [blob[offsets[i]:offsets[i + 1]] for i in xrange(string_count)]
+    offset += offsets[-1]
+    try:
+        blob.decode("ascii")
+    except UnicodeDecodeError:
+        # --- only the strings with other than ascii characters are decoded, the ascii ones stay str
+        strings = [_decode_string(x) for x in strings]
+
+    add = model.add
+    for count, section in zip(record_counts, _sections):
+        unpack_from = section.struct.unpack_from
+        size = section.struct.size
+        fields = section.fields
+        string_fields = section.string_fields
+        kind_class = section.record_class
+        for record_offset in xrange(offset, offset + count * size, size):
+            values = unpack_from(buffer_, record_offset)
+            element_type = strings[values[0]]
+            parent_id = values[1]
+            values = values[2:]
+            if string_fields:
+                values = list(values)
+                for i in string_fields:
+                    values[i] = strings[values[i]]
+
+            record_class = record_classes.get(element_type, kind_class)
+            if record_class is kind_class:
+                # --- every slot is about to be set, so the defaults set by __init__ are skipped
+                record = record_class.__new__(record_class)
+                record.element_type = element_type
+                record.parent_id = parent_id
+                record.extra = None
+            else:
+                record = record_class(element_type, -1, parent_id)
+            for field, value in zip(fields, values):
+                setattr(record, field, value)
+            add(record)
+        offset += count * size
+
+    convert = {_STRING: lambda x: x, _INT: int, _FLOAT: float, _BOOL: lambda x: x == "True"}
+    end = offset + extra_count * _extra_struct.size
+    for extra_offset in xrange(offset, end, _extra_struct.size):
+        node_id, key, value_type, value = _extra_struct.unpack_from(buffer_, extra_offset)
+        model.records[node_id][strings[key]] = convert[value_type](strings[value])
+    return end
+
+
+def _decode_string(value):
+    """
+    Returns the utf-8 encoded string as unicode if it has other than ascii characters.
+    """
+    try:
+        value.decode("ascii")
+    except UnicodeDecodeError:
+        return value.decode("utf-8")
+    return value
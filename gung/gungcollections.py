@@ -0,0 +1,98 @@
+class OrderedSet(object):
+    """
+    Set that remembers the order in which the elements have been added. Adding, removing and membership tests are
+    done in a constant time.
+
+    The elements are kept in a list. Most of the sets in a graph (children of a record, edges of a plug) hold just
+    a few elements, so they're searched in the list and only the ones that grow bigger than index_threshold get
+    a dictionary of the positions of their elements. The removed elements of the indexed sets leave holes in the
+    list, which is compacted once they take half of it.
+    """
+    __slots__ = ('_items', '_index', '_holes')
+
+    # --- size of the set above which the positions of the elements are indexed
+    index_threshold = 8
+
+    def __init__(self, iterable=()):
+        self._items = []
+        self._index = None
+        self._holes = 0
+        for element in iterable:
+            self.add(element)
+
+    def add(self, element):
+        if self._index is None:
+            if element in self._items:
+                return
+            self._items.append(element)
+            if len(self._items) > self.index_threshold:
+                self._index = dict((x, i) for i, x in enumerate(self._items))
+        elif element not in self._index:
+            self._index[element] = len(self._items)
+            self._items.append(element)
+
+    def discard(self, element):
+        if self._index is None:
+            if element in self._items:
+                self._items.remove(element)
+            return
+        position = self._index.pop(element, None)
+        if position is None:
+            return
+        self._items[position] = _hole
+        self._holes += 1
+        if self._holes * 2 > len(self._items):
+            self._compact()
+
+    def remove(self, element):
+        if element not in self:
+            raise KeyError(element)
+        self.discard(element)
+
+    def pop(self, last=True):
+        """
+        Removes and returns the most recently added element (or the oldest one if last is False).
+        """
+        if not len(self):
+            raise KeyError("pop from an empty set")
+        element = next(reversed(self) if last else iter(self))
+        self.discard(element)
+        return element
+
+    def clear(self):
+        self._items = []
+        self._index = None
+        self._holes = 0
+
+    def _compact(self):
+        self._items = [x for x in self._items if x is not _hole]
+        self._holes = 0
+        if len(self._items) > self.index_threshold:
+            self._index = dict((x, i) for i, x in enumerate(self._items))
+        else:
+            self._index = None
+
+    def __contains__(self, element):
+        if self._index is None:
+            return element in self._items
+        return element in self._index
+
+    def __iter__(self):
+        if not self._holes:
+            return iter(self._items)
+        return (x for x in self._items if x is not _hole)
+
+    def __reversed__(self):
+        if not self._holes:
+            return reversed(self._items)
+        return (x for x in reversed(self._items) if x is not _hole)
+
+    def __len__(self):
+        return len(self._items) - self._holes
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self))
+
+
+# --- placeholder of the removed elements of the indexed OrderedSet
+_hole = object()
@@ -1,11 +1,15 @@
 
 from qt.qt_widgets import QUndoCommand
 
+from gungcollections import OrderedSet
+
 from gungnode import GungEdge
 from gungnode import GungGroup
 
 
 class GungMoveCommand(QUndoCommand):
+    journal_subtrees = False
+
     def __init__(self, scene):
         """
         This dictionary has to hold the id's as the keys and positions as values.
@@ -19,9 +23,16 @@ class GungMoveCommand(QUndoCommand):
         self.nodes = {}
         self.scene = scene
 
+    def journal_ids(self):
+        """
+        Returns the ids of the records changed by this command. The journal (see gung.gungjournal) writes them after
+        the command is done or undone, with all their descendants if journal_subtrees is True.
+        """
+        return self.nodes.keys()
+
     def undo(self, *args, **kwargs):
         for n in self.nodes.keys():
-            gung_node = self.scene.get_item_by_id(n)
+            gung_node = self.scene.materialize(n)
             gung_node.setX(self.nodes[n][0])
             gung_node.setY(self.nodes[n][1])
             gung_node.properties['pos_x'] = self.nodes[n][0]
@@ -30,7 +41,7 @@ class GungMoveCommand(QUndoCommand):
 
     def redo(self, *args, **kwargs):
         for n in self.nodes.keys():
-            gung_node = self.scene.get_item_by_id(n)
+            gung_node = self.scene.materialize(n)
             gung_node.setX(self.nodes[n][2])
             gung_node.setY(self.nodes[n][3])
             gung_node.properties['pos_x'] = self.nodes[n][2]
@@ -42,13 +53,20 @@ class GungDeleteItemsCommand(QUndoCommand):
     """
     Removes items provided to the constructor.
     """
+    journal_subtrees = True
+
     def __init__(self, scene, nodes):
         QUndoCommand.__init__(self)
         self.scene = scene
         self.nodes = [x for x in nodes]
+        # --- the virtualized scene recycles the items, so redo looks them up by the ids.
+        self.node_ids = [x.properties['node_id'] for x in nodes]
 
         self.edges = []
 
+    def journal_ids(self):
+        return self.node_ids + [x.properties['node_id'] for x in self.edges]
+
     def undo(self, *args, **kwargs):
         for n in self.nodes:
             self.scene.addItem(n)
@@ -58,9 +76,17 @@ class GungDeleteItemsCommand(QUndoCommand):
             e.reconnect_edge()
 
     def redo(self, *args, **kwargs):
-        edges_to_delete = []
+        self.nodes = [self.scene.materialize(x) for x in self.node_ids]
+        for node_id in self.node_ids:
+            for edge_id in self.scene.model.get_node_edge_ids(node_id):
+                self.scene.materialize(edge_id)
+
+        # --- an edge between two of the deleted nodes is listed by both of them
+        edges_to_delete = OrderedSet()
         for n in self.nodes:
-            edges_to_delete += n.get_all_edges()
+            for edge in n.get_all_edges():
+                edges_to_delete.add(edge)
+        edges_to_delete = list(edges_to_delete)
 
         for edge in edges_to_delete:
             edge.disconnect_edge()
@@ -77,6 +103,8 @@ class GungCreateEdgeCommand(QUndoCommand):
     """
     Creates an edge between two plugs provided in the constructor.
     """
+    journal_subtrees = False
+
     def __init__(self, scene, from_node, to_node):
         QUndoCommand.__init__(self)
         self.from_node_id = int(from_node.properties['node_id'])
@@ -85,10 +113,15 @@ class GungCreateEdgeCommand(QUndoCommand):
         self.created_edge_id = -1
         self.deleted_edge = None
 
+    def journal_ids(self):
+        return [self.created_edge_id]
+
     def undo(self, *args, **kwargs):
         self.scene.remove_edge(self.created_edge_id)
 
     def redo(self, *args, **kwargs):
+        self.scene.materialize(self.from_node_id)
+        self.scene.materialize(self.to_node_id)
         e = GungEdge(int(self.from_node_id), int(self.to_node_id), parent=None, scene=self.scene)
         e.reconnect_edge()
         self.created_edge_id = int(e.properties['node_id'])
@@ -98,6 +131,8 @@ class GungDeleteEdgeCommand(QUndoCommand):
     """
     Deletes an edge with the id passed in constructor.
     """
+    journal_subtrees = False
+
     def __init__(self, scene, edge_id):
         QUndoCommand.__init__(self)
 
@@ -110,7 +145,12 @@ class GungDeleteEdgeCommand(QUndoCommand):
         self.scene = scene
         self.deleted_edge_id = edge_id
 
+    def journal_ids(self):
+        return [self.deleted_edge_id]
+
     def undo(self, *args, **kwargs):
+        self.scene.materialize(self.from_node_id)
+        self.scene.materialize(self.to_node_id)
         e = GungEdge(int(self.from_node_id), int(self.to_node_id), parent=None, scene=self.scene)
         e.reconnect_edge()
         self.deleted_edge_id = int(e.properties['node_id'])
@@ -123,6 +163,9 @@ class GungResizeNodeCommand(QUndoCommand):
     """
     Resizes the node.
     """
+    # --- resizing the node changes its attributes too
+    journal_subtrees = True
+
     def __init__(self, scene, node_id, width, height, previous_width, previous_height):
         QUndoCommand.__init__(self)
         self.nodeId = int(node_id)
@@ -132,13 +175,16 @@ class GungResizeNodeCommand(QUndoCommand):
         self.previousHeight = float(previous_height)
         self.scene = scene
 
+    def journal_ids(self):
+        return [self.nodeId]
+
     def undo(self, *args, **kwargs):
-        node = self.scene.get_item_by_id(self.nodeId)
+        node = self.scene.materialize(self.nodeId)
         node.resizer.setX(self.previousWidth)
         node.resizer.setY(self.previousHeight)
 
     def redo(self, *args, **kwargs):
-        node = self.scene.get_item_by_id(self.nodeId)
+        node = self.scene.materialize(self.nodeId)
         node.resizer.setX(self.width)
         node.resizer.setY(self.height)
 
@@ -147,6 +193,8 @@ class GungCreateGroupCommand(QUndoCommand):
     """
     Creates the group of a gung nodes.
     """
+    journal_subtrees = False
+
     def __init__(self, scene, node_ids):
         QUndoCommand.__init__(self)
         self.group = None
@@ -155,22 +203,27 @@ class GungCreateGroupCommand(QUndoCommand):
 
         self.group_id = -1
 
+    def journal_ids(self):
+        return [self.group_id] + self.nodeIds
+
     def undo(self, *args, **kwargs):
         nodes = []
         for nid in self.nodeIds:
-            node = self.scene.get_item_by_id(nid)
+            node = self.scene.materialize(nid)
             nodes.append(node)
             node.setParentItem(None)
 
         group = self.scene.get_item_by_id(self.group_id)
         self.scene.removeItem(group)
+        # --- redo creates a new group, so this id will not be used again.
+        self.scene.id_allocator.release(self.group_id)
 
     def redo(self, *args, **kwargs):
         if not len(self.nodeIds):
             return
         group = GungGroup(None, self.scene)
         for nodeId in self.nodeIds:
-            node = self.scene.get_item_by_id(nodeId)
+            node = self.scene.materialize(nodeId)
             node.setParentItem(group)
 
         group.update_bounding_rect()
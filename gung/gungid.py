@@ -0,0 +1,84 @@
+class GungIdAllocator(object):
+    """
+    Hands out the unique ids for the items of a GungScene. The ids are taken from a monotonic high-water mark or
+    from a list of ids that have been released, so every call is done in a constant time.
+    """
+
+    def __init__(self):
+        self._next_id = 0
+        self._free_ids = []
+        self._free_set = set()
+
+    def allocate(self):
+        """
+        Returns an id that is not used yet and marks it as used.
+
+            :rtype: int
+        """
+        while self._free_ids:
+            node_id = self._free_ids.pop()
+            # --- ids claimed after being released are still on the list, skip them.
+            if node_id in self._free_set:
+                self._free_set.discard(node_id)
+                return node_id
+
+        node_id = self._next_id
+        self._next_id += 1
+        return node_id
+
+    def reserve(self, count):
+        """
+        Marks a contiguous range of ids as used and returns it. Use it when you're about to create many items at
+        once and pass the ids to their constructors.
+
+            :param int count: number of ids to reserve.
+            :rtype: list of int
+        """
+        start = self._next_id
+        self._next_id += count
+        return range(start, self._next_id)
+
+    def claim(self, node_id):
+        """
+        Marks the provided id as used. The ids between the high-water mark and the claimed id are skipped and
+        they won't be handed out until the allocator is re-seeded.
+
+            :param int node_id:
+        """
+        if node_id >= self._next_id:
+            self._next_id = node_id + 1
+        else:
+            self._free_set.discard(node_id)
+
+    def release(self, node_id):
+        """
+        Gives the id back to the allocator so that it can be handed out again. Release only the ids of items that
+        will never come back to the scene (i.e. an edge deleted by the undo command is recreated with a new id).
+
+            :param int node_id:
+        """
+        if node_id >= self._next_id or node_id in self._free_set:
+            return
+        self._free_set.add(node_id)
+        self._free_ids.append(node_id)
+
+    def seed(self, used_ids):
+        """
+        Resets the allocator so that it will hand out only ids that are not on the provided list. The unused ids
+        below the highest of them will be reused first, starting with the lowest one.
+
+            :param used_ids: iterable of ids that are in use.
+        """
+        used = set(used_ids)
+        self._next_id = max(used) + 1 if used else 0
+        self._free_ids = [x for x in xrange(self._next_id - 1, -1, -1) if x not in used]
+        self._free_set = set(self._free_ids)
+
+    def is_used(self, node_id):
+        """
+        Returns True if the id has been handed out or claimed and not released since.
+
+            :param int node_id:
+            :rtype: bool
+        """
+        return node_id < self._next_id and node_id not in self._free_set
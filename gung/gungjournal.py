@@ -0,0 +1,204 @@
+"""
+Incremental saving of the GUNG scenes. The journal keeps the file of the scene (the snapshot) and an append-only
+file of the changes made by the undo stack of the scene next to it, so saving costs as much as the change and not
+as the whole scene. The journal is folded into a new snapshot (compacted) once it gets long and it's replayed when
+the scene is loaded again, i.e. after a crash.
+"""
+import json
+import os
+
+from config import get_settings
+from gungcollections import OrderedSet
+from gungmodel import GungModel, EdgeRecord
+from gungserializer import get_serializer, record_to_row, record_from_row
+
+
+class GungJournal(object):
+    """
+    Journal of the scene saved in the file at path, its entries are written to path + ".journal". Every entry is
+    a line of json with the records changed by a command ("put") and the ids of the removed ones ("remove"),
+    so replaying the entries again gives the same result.
+    """
+
+    def __init__(self, path, serializer="json", compact_after=None):
+        """
+            :param str path: path of the snapshot of the scene.
+            :param str serializer: name of the serializer of the snapshot (see gung.gungserializer).
+            :param int compact_after: number of entries that triggers the compaction, taken from the settings
+                if not provided (0 turns it off).
+        """
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.serializer = serializer
+        self.compact_after = get_settings().journal.compact_after if compact_after is None else compact_after
+        self.entry_count = 0
+
+        self.scene = None
+        self._journal_file = None
+        self._undo_index = 0
+
+    def load(self, scene):
+        """
+        Fills the empty scene with the snapshot and the changes from the journal (left by a crash) and starts
+        journaling it. The recovered changes are compacted into the snapshot right away.
+
+            :param gung.gungscene.GungScene scene:
+            :rtype: int
+            :returns: number of the recovered entries.
+        """
+        model = GungModel()
+        if os.path.exists(self.path):
+            get_serializer(self.serializer).read(model, self.path)
+        recovered = self.replay(model)
+        scene.load_model(model)
+
+        self.attach(scene)
+        if recovered or os.path.exists(self.journal_path):
+            # --- the last entry may be broken by the crash, so the journal can't be appended to.
+            self.compact()
+        return recovered
+
+    def replay(self, model):
+        """
+        Applies the entries of the journal to the model (loaded from the snapshot). An entry broken by a crash ends
+        the replay.
+
+            :param GungModel model:
+            :rtype: int
+            :returns: number of the applied entries.
+        """
+        if not os.path.exists(self.journal_path):
+            return 0
+
+        count = 0
+        with open(self.journal_path, "rb") as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                self._apply_entry(model, entry)
+                count += 1
+        model.id_allocator.seed(model.records.keys())
+        return count
+
+    @staticmethod
+    def _apply_entry(model, entry):
+        for row in entry["put"]:
+            record = record_from_row(row)
+            current = model.get(record.node_id)
+            if current is None:
+                model.add(record)
+                if isinstance(record, EdgeRecord):
+                    model.connect(record)
+                continue
+            if current.parent_id != record.parent_id:
+                model.set_parent(record.node_id, record.parent_id)
+            current.update(record)
+
+        for node_id in entry["remove"]:
+            model.remove_tree(node_id)
+
+    def attach(self, scene):
+        """
+        Starts writing the changes made by the undo stack of the scene. Compact the journal first if the snapshot
+        doesn't hold the current content of the scene.
+
+            :param gung.gungscene.GungScene scene:
+        """
+        self.detach()
+        self.scene = scene
+        self._undo_index = scene.undoStack.index()
+        self._journal_file = open(self.journal_path, "ab")
+        scene.undoStack.indexChanged.connect(self._undo_index_changed)
+
+    def detach(self):
+        """
+        Stops journaling the scene. The journal stays on the disk, so call compact before if the snapshot should be
+        up to date.
+        """
+        if self.scene is None:
+            return
+        self.scene.undoStack.indexChanged.disconnect(self._undo_index_changed)
+        self._journal_file.close()
+        self._journal_file = None
+        self.scene = None
+
+    def _undo_index_changed(self, index):
+        stack = self.scene.undoStack
+        first, last = sorted((self._undo_index, index))
+        self._undo_index = index
+
+        # --- the records are written as they are after all the commands, so the order of the ids doesn't matter.
+        node_ids = OrderedSet()
+        subtree_ids = OrderedSet()
+        for i in range(first, last):
+            command = stack.command(i)
+            if command is None or not hasattr(command, "journal_ids"):
+                # --- the stack has been cleared or the command doesn't change the records
+                continue
+            for node_id in command.journal_ids():
+                (subtree_ids if command.journal_subtrees else node_ids).add(node_id)
+
+        if len(node_ids) or len(subtree_ids):
+            self.write_entry(node_ids, subtree_ids)
+
+    def write_entry(self, node_ids, subtree_ids=()):
+        """
+        Appends the current state of the records to the journal, the ones that aren't in the model anymore are
+        written as removed. Call it for the changes made without the undo stack.
+
+            :param node_ids: ids of the changed records.
+            :param subtree_ids: ids of the changed records that are written with all their descendants.
+        """
+        model = self.scene.model
+        rows = []
+        removed_ids = []
+        written_ids = set()
+
+        def put(record, subtree):
+            if record.node_id in written_ids:
+                return
+            written_ids.add(record.node_id)
+            rows.append(record_to_row(record))
+            if subtree:
+                for child in model.get_children(record.node_id):
+                    put(child, True)
+
+        for ids, subtree in ((subtree_ids, True), (node_ids, False)):
+            for node_id in ids:
+                record = model.get(node_id)
+                if record is None:
+                    removed_ids.append(node_id)
+                else:
+                    put(record, subtree)
+
+        self._journal_file.write(json.dumps({"put": rows, "remove": removed_ids}, separators=(",", ":")) + "\n")
+        self._journal_file.flush()
+        self.entry_count += 1
+
+        if self.compact_after and self.entry_count >= self.compact_after:
+            self.compact()
+
+    def sync(self):
+        """
+        Makes sure that the written entries are on the disk, i.e. when the user saves the scene.
+        """
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+
+    def compact(self):
+        """
+        Writes the current content of the scene as the new snapshot and empties the journal. The snapshot is written
+        next to the old one first, so a crash can't leave a broken one behind.
+        """
+        temp_path = self.path + ".tmp"
+        self.scene.save(temp_path, self.serializer)
+        if os.name == "nt" and os.path.exists(self.path):
+            # --- rename doesn't replace the files on Windows
+            os.remove(self.path)
+        os.rename(temp_path, self.path)
+
+        self._journal_file.close()
+        self._journal_file = open(self.journal_path, "wb")
+        self.entry_count = 0
@@ -0,0 +1,848 @@
+"""
+Headless data model of a GUNG graph. It doesn't need Qt at all, so it can be used to build, inspect and save the graphs
+on a server or in the tests without creating a QApplication. Every GungScene keeps its content in a GungModel too
+(GungItem.properties is the record of the item), so the scene is a projection of the model.
+"""
+import xml.dom.minidom as xmldom
+import xml.etree.cElementTree as ElementTree
+from contextlib import contextmanager
+from cStringIO import StringIO
+
+from config import get_settings, parse_bool
+from gungcollections import OrderedSet
+from gungid import GungIdAllocator
+
+
+class GungRecord(object):
+    """
+    Plain data of a single GUNG item. The record behaves like a dictionary of the item properties, but keeps
+    the properties declared in fields in slots. Any other property is kept in the extra dictionary.
+    Subclasses extend fields and __slots__ with their own properties and field_types with their types (see
+    property_types), which tell how the fields are read from the files and written to them (see get_record_schema).
+    """
+    __slots__ = ('element_type', 'parent_id', 'extra', 'node_id', 'pos_x', 'pos_y')
+    fields = ('node_id', 'pos_x', 'pos_y')
+    field_types = (int, float, float)
+
+    def __init__(self, element_type="GungNode", node_id=-1, parent_id=-1):
+        self.element_type = element_type
+        self.parent_id = parent_id
+        self.extra = None
+        self.node_id = node_id
+        self.pos_x = 0.0
+        self.pos_y = 0.0
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            return getattr(self, key)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.fields:
+            setattr(self, key, value)
+            return
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.fields:
+            raise KeyError("Property %s of %s can't be removed." % (key, self.__class__.__name__))
+        if self.extra is None or key not in self.extra:
+            raise KeyError(key)
+        del self.extra[key]
+
+    def __contains__(self, key):
+        return key in self.fields or (self.extra is not None and key in self.extra)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.fields) + (len(self.extra) if self.extra else 0)
+
+    def __repr__(self):
+        return "%s(%s, %r)" % (self.__class__.__name__, self.element_type, dict(self.items()))
+
+    def keys(self):
+        keys = list(self.fields)
+        if self.extra:
+            keys.extend(self.extra.keys())
+        return keys
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, values):
+        for k, value in values.items():
+            self[k] = value
+
+    def copy(self):
+        """
+        Returns the properties as a plain dictionary.
+
+            :rtype: dict
+        """
+        return dict(self.items())
+
+
+class NodeRecord(GungRecord):
+    __slots__ = ('name', 'node_width', 'node_height', 'min_width', 'min_height', 'attributes_offset')
+    fields = GungRecord.fields + __slots__
+    field_types = GungRecord.field_types + (basestring, float, float, float, float, float)
+
+    def __init__(self, element_type="GungNode", node_id=-1, parent_id=-1):
+        GungRecord.__init__(self, element_type, node_id, parent_id)
+        self.name = ""
+        self.node_width = 0.0
+        self.node_height = 0.0
+        self.min_width = 0.0
+        self.min_height = 0.0
+        self.attributes_offset = 0.0
+
+
+class AttributeRecord(GungRecord):
+    __slots__ = ('attr_height', 'edge_offset', 'inverted')
+    fields = GungRecord.fields + __slots__
+    field_types = GungRecord.field_types + (float, float, bool)
+
+    def __init__(self, element_type="GungAttribute", node_id=-1, parent_id=-1):
+        GungRecord.__init__(self, element_type, node_id, parent_id)
+        self.attr_height = 0.0
+        self.edge_offset = 0.0
+        self.inverted = False
+
+
+class PlugRecord(GungRecord):
+    __slots__ = ('plug_width', 'plug_height')
+    fields = GungRecord.fields + __slots__
+    field_types = GungRecord.field_types + (float, float)
+
+    def __init__(self, element_type="GungPlug", node_id=-1, parent_id=-1):
+        GungRecord.__init__(self, element_type, node_id, parent_id)
+        self.plug_width = 14.0
+        self.plug_height = 14.0
+
+
+class EdgeRecord(GungRecord):
+    __slots__ = ('item_from_id', 'item_to_id')
+    fields = GungRecord.fields + __slots__
+    field_types = GungRecord.field_types + (int, int)
+
+    def __init__(self, element_type="GungEdge", node_id=-1, parent_id=-1):
+        GungRecord.__init__(self, element_type, node_id, parent_id)
+        self.item_from_id = -1
+        self.item_to_id = -1
+
+
+class GroupRecord(GungRecord):
+    __slots__ = ()
+
+    def __init__(self, element_type="GungGroup", node_id=-1, parent_id=-1):
+        GungRecord.__init__(self, element_type, node_id, parent_id)
+
+
+# --- element type -> record class used for it by the headless loader
+record_classes = {
+    "GungNode": NodeRecord,
+    "GungAttribute": AttributeRecord,
+    "GungPlug": PlugRecord,
+    "GungInPlug": PlugRecord,
+    "GungOutPlug": PlugRecord,
+    "GungEdge": EdgeRecord,
+    "GungGroup": GroupRecord,
+}
+
+
+def register_record_class(element_type, record_class):
+    """
+    Tells the headless loader which record class to use for the elements of the provided type. Use it for your own
+    item types, the elements of unknown types are skipped while loading. The item classes decorated with
+    gung.gungnode.register_item_class are registered here too.
+
+        :param str element_type:
+        :param type record_class: GungRecord subclass
+    """
+    record_classes[element_type] = record_class
+
+
+def decode_bool(value):
+    """
+    Returns the bool written as "True" or "False" (anything parse_bool accepts), bool("False") would be True.
+
+        :param value: str or bool
+        :rtype: bool
+    """
+    if isinstance(value, basestring):
+        return parse_bool(value)
+    return bool(value)
+
+
+def decode_string(value):
+    """
+    Returns the string property, str and unicode are kept as they are.
+
+        :rtype: str or unicode
+    """
+    return value if isinstance(value, basestring) else str(value)
+
+
+def encode_value(value):
+    """
+    Returns the value of the property as the string written to the files. The floats are written with all their
+    digits, so they're read back the same.
+
+        :rtype: str or unicode
+    """
+    if isinstance(value, basestring):
+        return value
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# --- type of the fields -> (decoder of the values read from the files, encoder of the values written to them).
+# --- The decoders take the strings or the values of the right type already.
+property_types = {
+    bool: (decode_bool, str),
+    int: (int, str),
+    long: (long, str),
+    float: (float, repr),
+    basestring: (decode_string, decode_string),
+}
+
+
+def register_property_type(field_type, decoder, encoder):
+    """
+    Makes the fields of the provided type usable in the field_types of the records. Register your types before
+    the records using them are loaded.
+
+        :param type field_type:
+        :param decoder: callable returning the value of the field from its string (or the value itself)
+        :param encoder: callable returning the string written to the files
+    """
+    property_types[field_type] = (decoder, encoder)
+    _record_schemas.clear()
+
+
+class RecordSchema(object):
+    """
+    Decoder and encoder tables of the fields of a record class, compiled once from its field_types. Use
+    get_record_schema to get the one of a class.
+    """
+
+    def __init__(self, record_class):
+        if len(record_class.fields) != len(record_class.field_types):
+            raise ValueError("Fields and field_types of %s don't match." % record_class.__name__)
+        self.record_class = record_class
+        self.decoders = {}
+        self.encoders = {}
+        for field, field_type in zip(record_class.fields, record_class.field_types):
+            if field_type not in property_types:
+                raise ValueError("Unknown property type: %s" % field_type)
+            self.decoders[field], self.encoders[field] = property_types[field_type]
+
+    def decode(self, key, value):
+        """
+        Returns the value of the property read from a file. The properties other than the fields are kept as they are.
+
+            :param str key:
+            :param value: str or the value itself
+        """
+        decoder = self.decoders.get(key)
+        return value if decoder is None else decoder(value)
+
+    def encode(self, record):
+        """
+        Returns the properties of the record as the strings written to the files, i.e. as the xml attributes.
+
+            :param GungRecord record:
+            :rtype: dict
+        """
+        encoders = self.encoders
+        return dict((k, encoders[k](value) if k in encoders else encode_value(value)) for k, value in record.items())
+
+
+# --- record class -> its RecordSchema
+_record_schemas = {}
+
+
+def get_record_schema(record_class):
+    """
+    Returns the schema compiled for the record class.
+
+        :param type record_class: GungRecord subclass
+        :rtype: RecordSchema
+    """
+    schema = _record_schemas.get(record_class)
+    if schema is None:
+        schema = _record_schemas[record_class] = RecordSchema(record_class)
+    return schema
+
+
+def iter_xml_elements(source, progress=None):
+    """
+    Parses the xml incrementally and yields ("start", element) when an element inside the root one is opened (its
+    attributes are already read, the children not yet) and ("end", element) when it's closed. The elements are
+    cleared once closed, so the whole document is never held in memory.
+
+        :param source: path or file object of the xml
+        :param progress: callable taking the fraction (0.0 - 1.0) of the file read so far
+    """
+    xml_file = open(source, "rb") if isinstance(source, basestring) else source
+    try:
+        size = _get_remaining_size(xml_file)
+        position = -1
+        depth = 0
+        root = None
+        for event, element in ElementTree.iterparse(xml_file, ("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 1:
+                    root = element
+                    continue
+            else:
+                depth -= 1
+                if depth == 0:
+                    continue
+
+            yield event, element
+
+            if event == "end":
+                element.clear()
+                if depth == 1:
+                    # --- the closed top level elements are dropped by the root too.
+                    root.clear()
+
+            if progress is not None and size and xml_file.tell() != position:
+                # --- the parser reads the file in chunks, so the position changes only once per chunk.
+                position = xml_file.tell()
+                progress(min(position / float(size), 1.0))
+    finally:
+        if xml_file is not source:
+            xml_file.close()
+
+    if progress is not None:
+        progress(1.0)
+
+
+def _get_remaining_size(xml_file):
+    try:
+        position = xml_file.tell()
+        xml_file.seek(0, 2)
+        size = xml_file.tell()
+        xml_file.seek(position)
+    except (AttributeError, IOError):
+        # --- not seekable (i.e. a pipe), so the progress is reported only at the end
+        return None
+    return size
+
+
+def as_xml_file(xml_string):
+    """
+    Returns the file object reading the xml string (i.e. the one returned by toxml) for iter_xml_elements.
+
+        :param xml_string: str or unicode
+    """
+    if isinstance(xml_string, unicode):
+        xml_string = xml_string.encode("utf-8")
+    return StringIO(xml_string)
+
+
+class GungXmlWriter(object):
+    """
+    Writes the xml elements straight to the file in the same format as toxml of the minidom documents (attributes
+    sorted by their names, elements without children closed with "/>"), so the graphs can be saved without building
+    their documents in memory.
+    """
+
+    def __init__(self, xml_file):
+        self.xml_file = xml_file
+        # --- tags of the open elements and whether the start tag of the last one still misses its ">"
+        self._tags = []
+        self._start_tag_open = False
+
+    def start_element(self, tag, attributes):
+        """
+        Writes the start tag of the element. Its children are the elements started before end_element is called.
+
+            :param str tag:
+            :param dict attributes: attribute name -> value string
+        """
+        write = self.xml_file.write
+        if self._start_tag_open:
+            write(">")
+        write("<" + tag)
+        for name in sorted(attributes):
+            value = attributes[name]
+            if isinstance(value, unicode):
+                value = value.encode("utf-8")
+            write(' %s="%s"' % (name, value.replace("&", "&amp;").replace("<", "&lt;")
+                                .replace("\"", "&quot;").replace(">", "&gt;")))
+        self._tags.append(tag)
+        self._start_tag_open = True
+
+    def end_element(self):
+        """
+        Writes the end tag of the last started element.
+        """
+        tag = self._tags.pop()
+        if self._start_tag_open:
+            self.xml_file.write("/>")
+            self._start_tag_open = False
+        else:
+            self.xml_file.write("</%s>" % tag)
+
+    @contextmanager
+    def element(self, tag, attributes):
+        """
+        Context manager writing the start tag of the element on enter and its end tag on exit.
+
+            :param str tag:
+            :param dict attributes: attribute name -> value string
+        """
+        self.start_element(tag, attributes)
+        yield
+        self.end_element()
+
+    @contextmanager
+    def document(self, root_tag):
+        """
+        Context manager writing the xml declaration and the root element of the document.
+
+            :param str root_tag:
+        """
+        self.xml_file.write('<?xml version="1.0" ?>')
+        with self.element(root_tag, {}):
+            yield
+
+
+@contextmanager
+def open_xml_writer(target):
+    """
+    Context manager returning GungXmlWriter writing to the file. The file is closed on exit if it's been opened here.
+
+        :param target: path or file object
+    """
+    xml_file = open(target, "wb") if isinstance(target, basestring) else target
+    try:
+        yield GungXmlWriter(xml_file)
+    finally:
+        if xml_file is not target:
+            xml_file.close()
+
+
+class GungModel(object):
+    """
+    Graph made of GungRecords. Records are indexed by their ids, the hierarchy and the connections are kept as
+    integer-indexed adjacency, so the model can be queried without touching any of the records.
+    """
+
+    def __init__(self):
+        self.id_allocator = GungIdAllocator()
+        self.records = {}
+        # --- ids of the records in order of adding them (OrderedDict of the records would cost ~100 bytes more each)
+        self._order = OrderedSet()
+        # --- parent id (-1 for the top level) -> ids of child records
+        self._children = {}
+        # --- (item_from_id, item_to_id) -> edge id and plug id -> ids of edges connected to the plug
+        self._connections = {}
+        self._adjacency = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, node_id):
+        return node_id in self.records
+
+    def get(self, node_id):
+        """
+        Returns the record with provided id or None.
+
+            :param int node_id:
+            :rtype: GungRecord or None
+        """
+        return self.records.get(node_id)
+
+    def iter_records(self, record_class=None):
+        """
+        Iterates the records of the model (only the instances of record_class if provided) in order of adding them.
+
+            :param type record_class:
+        """
+        records = self.records
+        for node_id in self._order:
+            record = records[node_id]
+            if record_class is None or isinstance(record, record_class):
+                yield record
+
+    def add(self, record):
+        """
+        Adds the record to the model. Its id is marked as used.
+
+            :param GungRecord record:
+        """
+        self.records[record.node_id] = record
+        self._order.add(record.node_id)
+        self.id_allocator.claim(record.node_id)
+        self._get_child_ids(record.parent_id).add(record.node_id)
+
+    def create(self, record_class, element_type, parent_id=-1, node_id=None):
+        """
+        Creates a new record with a new id (unless provided) and adds it to the model.
+
+            :param type record_class: GungRecord subclass
+            :param str element_type:
+            :param int parent_id:
+            :param int node_id:
+            :rtype: GungRecord
+        """
+        if node_id is None:
+            node_id = self.id_allocator.allocate()
+        record = record_class(element_type, node_id, parent_id)
+        self.add(record)
+        return record
+
+    def remove(self, node_id):
+        """
+        Removes the record from the model (but not its children) and returns it. The id is not released, since
+        the record may come back (i.e. by the undo).
+
+            :param int node_id:
+            :rtype: GungRecord or None
+        """
+        record = self.records.pop(node_id, None)
+        if record is None:
+            return None
+        self._order.discard(node_id)
+        siblings = self._children.get(record.parent_id)
+        if siblings is not None:
+            siblings.discard(node_id)
+            if not siblings:
+                del self._children[record.parent_id]
+        if isinstance(record, EdgeRecord):
+            self.disconnect(record)
+        return record
+
+    def remove_tree(self, node_id):
+        """
+        Removes the record together with all its descendants and the edges connected to them. Their ids are released.
+
+            :param int node_id:
+        """
+        for child_id in list(self._children.get(node_id, ())):
+            self.remove_tree(child_id)
+        for edge_id in list(self._adjacency.get(node_id, ())):
+            self.remove(edge_id)
+            self.id_allocator.release(edge_id)
+        if self.remove(node_id) is not None:
+            self.id_allocator.release(node_id)
+
+    def reindex(self, record, previous_id):
+        """
+        Moves the record in the model after its node_id has been changed.
+
+            :param GungRecord record:
+            :param int previous_id:
+        """
+        if self.records.get(previous_id) is record:
+            del self.records[previous_id]
+            self._order.discard(previous_id)
+            self.id_allocator.release(previous_id)
+            siblings = self._children.get(record.parent_id)
+            if siblings is not None:
+                siblings.discard(previous_id)
+        child_ids = self._children.pop(previous_id, None)
+        if child_ids is not None:
+            self._children[record.node_id] = child_ids
+            for child_id in child_ids:
+                child = self.records.get(child_id)
+                if child is not None:
+                    child.parent_id = record.node_id
+        self.add(record)
+
+    def set_parent(self, node_id, parent_id):
+        """
+        Moves the record with provided id under the new parent (-1 for the top level).
+
+            :param int node_id:
+            :param int parent_id:
+        """
+        record = self.records[node_id]
+        siblings = self._children.get(record.parent_id)
+        if siblings is not None:
+            siblings.discard(node_id)
+            if not siblings:
+                del self._children[record.parent_id]
+        record.parent_id = parent_id
+        self._get_child_ids(parent_id).add(node_id)
+
+    def get_child_ids(self, node_id=-1):
+        """
+        Returns the ids of the children of the record with provided id (-1 for the top level records).
+
+            :param int node_id:
+            :rtype: list of int
+        """
+        return list(self._children.get(node_id, ()))
+
+    def get_children(self, node_id=-1):
+        """
+        Returns the child records of the record with provided id (-1 for the top level records).
+
+            :param int node_id:
+            :rtype: list of GungRecord
+        """
+        return [self.records[x] for x in self._children.get(node_id, ()) if x in self.records]
+
+    def get_top_level_id(self, node_id):
+        """
+        Returns the id of the top level record that the record with provided id belongs to (i.e. the node of a plug).
+
+            :param int node_id:
+            :rtype: int
+        """
+        record = self.records.get(node_id)
+        while record is not None and record.parent_id != -1:
+            node_id = record.parent_id
+            record = self.records.get(node_id)
+        return node_id
+
+    def get_node_edge_ids(self, node_id):
+        """
+        Returns the ids of the edges connected to any of the plugs under the record with provided id.
+
+            :param int node_id:
+            :rtype: list of int
+        """
+        result = OrderedSet()
+        pending = [node_id]
+        while pending:
+            current_id = pending.pop()
+            for edge_id in self._adjacency.get(current_id, ()):
+                result.add(edge_id)
+            pending.extend(self._children.get(current_id, ()))
+        return list(result)
+
+    def _get_child_ids(self, parent_id):
+        child_ids = self._children.get(parent_id)
+        if child_ids is None:
+            child_ids = self._children[parent_id] = OrderedSet()
+        return child_ids
+
+    def connect(self, edge_record):
+        """
+        Registers the connection made by the edge record.
+
+            :param EdgeRecord edge_record:
+        """
+        from_id = edge_record.item_from_id
+        to_id = edge_record.item_to_id
+        if from_id == -1 or to_id == -1:
+            return
+        self._connections[(from_id, to_id)] = edge_record.node_id
+        for plug_id in (from_id, to_id):
+            edge_ids = self._adjacency.get(plug_id)
+            if edge_ids is None:
+                edge_ids = self._adjacency[plug_id] = OrderedSet()
+            edge_ids.add(edge_record.node_id)
+
+    def disconnect(self, edge_record):
+        """
+        Forgets the connection made by the edge record.
+
+            :param EdgeRecord edge_record:
+        """
+        key = (edge_record.item_from_id, edge_record.item_to_id)
+        if self._connections.get(key) == edge_record.node_id:
+            del self._connections[key]
+        for plug_id in key:
+            edge_ids = self._adjacency.get(plug_id)
+            if edge_ids is None:
+                continue
+            edge_ids.discard(edge_record.node_id)
+            if not edge_ids:
+                del self._adjacency[plug_id]
+
+    def has_connection(self, plug_a_id, plug_b_id):
+        """
+        Returns True if there's an edge between the plugs with provided ids (no matter in which direction).
+
+            :param int plug_a_id:
+            :param int plug_b_id:
+            :rtype: bool
+        """
+        return (plug_a_id, plug_b_id) in self._connections or (plug_b_id, plug_a_id) in self._connections
+
+    def get_edge_between(self, from_id, to_id):
+        """
+        Returns the id of the edge going from the plug from_id to the plug to_id or None if there's no such edge.
+
+            :param int from_id:
+            :param int to_id:
+            :rtype: int or None
+        """
+        return self._connections.get((from_id, to_id))
+
+    def get_plug_edge_ids(self, plug_id):
+        """
+        Returns the ids of the edges connected to the plug in order of connecting them.
+
+            :param int plug_id:
+            :rtype: list of int
+        """
+        return list(self._adjacency.get(plug_id, ()))
+
+    def add_node(self, name="", pos_x=0.0, pos_y=0.0, element_type="GungNode", parent_id=-1):
+        """
+        Creates a node record with the same defaults as a new GungNode.
+
+            :rtype: NodeRecord
+        """
+        record = self.create(NodeRecord, element_type, parent_id)
+        record.name = name
+        record.pos_x = float(pos_x)
+        record.pos_y = float(pos_y)
+        settings = get_settings().node
+        record.node_width = record.min_width = settings.minimal_width
+        record.node_height = record.min_height = settings.minimal_height
+        record.attributes_offset = settings.attributes_offset
+        return record
+
+    def add_attribute(self, node_id, element_type="GungAttribute"):
+        """
+        Creates an attribute record under the node with provided id.
+
+            :rtype: AttributeRecord
+        """
+        record = self.create(AttributeRecord, element_type, node_id)
+        record.attr_height = get_settings().attribute.height
+        return record
+
+    def add_plug(self, attribute_id, element_type="GungInPlug"):
+        """
+        Creates a plug record under the attribute with provided id.
+
+            :rtype: PlugRecord
+        """
+        return self.create(PlugRecord, element_type, attribute_id)
+
+    def add_edge(self, from_id, to_id, element_type="GungEdge"):
+        """
+        Creates an edge record going from the plug from_id to the plug to_id and registers the connection.
+
+            :rtype: EdgeRecord
+        """
+        record = self.create(EdgeRecord, element_type)
+        record.item_from_id = from_id
+        record.item_to_id = to_id
+        self.connect(record)
+        return record
+
+    def add_group(self, element_type="GungGroup"):
+        """
+        Creates an empty group record. Use set_parent to put nodes inside of it.
+
+            :rtype: GroupRecord
+        """
+        return self.create(GroupRecord, element_type)
+
+    def as_xml(self):
+        """
+        Returns the model as an xml document in the same format as GungScene.as_xml.
+        """
+        impl = xmldom.getDOMImplementation()
+        doc = impl.createDocument(None, "GungGraph", None)
+
+        for record in self.get_children():
+            if not isinstance(record, NodeRecord):
+                continue
+            doc.documentElement.appendChild(self._record_as_xml(doc, record))
+
+        for record in self.iter_records(EdgeRecord):
+            doc.documentElement.appendChild(self._record_as_xml(doc, record))
+        return doc
+
+    def write_xml(self, target):
+        """
+        Writes the model to the file in the same format as as_xml, but element by element, so the document is never
+        held in memory. The output is the same as the utf-8 encoded toxml of as_xml.
+
+            :param target: path or file object
+        """
+        with open_xml_writer(target) as writer:
+            with writer.document("GungGraph"):
+                for record in self.get_children():
+                    if not isinstance(record, NodeRecord):
+                        continue
+                    self._write_record(writer, record)
+
+                for record in self.iter_records(EdgeRecord):
+                    self._write_record(writer, record)
+
+    def _write_record(self, writer, record):
+        with writer.element(record.element_type, get_record_schema(record.__class__).encode(record)):
+            for child in self.get_children(record.node_id):
+                self._write_record(writer, child)
+
+    def _record_as_xml(self, document, record):
+        element = document.createElement(record.element_type)
+        for k, value in get_record_schema(record.__class__).encode(record).items():
+            element.setAttribute(k, value)
+        for child in self.get_children(record.node_id):
+            element.appendChild(self._record_as_xml(document, child))
+        return element
+
+    def from_xml(self, xml_string):
+        """
+        Parses XML string written by GungScene.as_xml (or GungModel.as_xml) and adds its content to the model. The
+        ids stored in the xml are kept, so the model SHOULD be empty.
+
+            :param str xml_string: string to parse (must be a valid xml).
+        """
+        self.load_xml(as_xml_file(xml_string))
+
+    def load_xml(self, source, progress=None):
+        """
+        Reads the xml written by GungScene.as_xml (or GungModel.as_xml) from the file and adds its content to the
+        model. The file is parsed incrementally, so it's never held in memory as a whole. The ids stored in the xml
+        are kept, so the model SHOULD be empty.
+
+            :param source: path or file object of the xml
+            :param progress: callable taking the fraction (0.0 - 1.0) of the file read so far
+        """
+        # --- ids of the records of the open elements, None for the skipped ones
+        parent_ids = []
+        for event, element in iter_xml_elements(source, progress):
+            if event == "end":
+                parent_ids.pop()
+                continue
+
+            parent_id = parent_ids[-1] if parent_ids else -1
+            if parent_id is None or element.tag not in record_classes:
+                # --- unknown element, it's skipped with all its children
+                parent_ids.append(None)
+                continue
+            parent_ids.append(self._record_from_xml(element, parent_id).node_id)
+
+        for record in self.iter_records(EdgeRecord):
+            self.connect(record)
+
+        self.id_allocator.seed(self.records.keys())
+
+    def _record_from_xml(self, element, parent_id):
+        record = record_classes[element.tag](element.tag, -1, parent_id)
+        decode = get_record_schema(record.__class__).decode
+        for k, value in element.attrib.items():
+            record[k] = decode(k, value)
+        self.add(record)
+        return record
@@ -1,9 +1,12 @@
-import inspect
-import sys
 from xml.dom import Node
 
-from config import GungConfig, ConfigParser
+from config import get_settings, add_settings_listener
+from gungcollections import OrderedSet
+from gungmodel import GungRecord, NodeRecord, AttributeRecord, PlugRecord, EdgeRecord, GroupRecord
+from gungmodel import get_record_schema, property_types, register_record_class
+from gungstyle import styles
 from qt.qt_widgets import QGraphicsItem
+from qt.qt_widgets import QStyleOptionGraphicsItem
 from .qt.qt_core import QPoint
 from .qt.qt_core import QPointF
 from .qt.qt_core import QRectF
@@ -11,19 +14,72 @@ from .qt.qt_core import QSize
 from .qt.qt_core import Qt
 from .qt.qt_gui import QBrush
 from .qt.qt_gui import QColor
+from .qt.qt_gui import QFontMetricsF
 from .qt.qt_gui import QPainter
 from .qt.qt_gui import QPainterPath
+from .qt.qt_gui import QPainterPathStroker
 from .qt.qt_gui import QPen
+from .qt.qt_gui import QStaticText
+from .qt.qt_gui import QTransform
 
-config = GungConfig()
+
+def get_level_of_detail(painter):
+    """
+    Returns the level of detail of the item painted by the painter: 1.0 at 100% zoom, less when zoomed out.
+    Compare it with the thresholds of the scene (scene.settings.level_of_detail) to skip the details that can't be seen.
+
+        :param QPainter painter:
+        :rtype: float
+    """
+    return QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+
+
+def get_pen_margin(*pens):
+    """
+    Returns how far outside of the stroked shape the widest of the provided pens can paint. Add it to the bounding
+    rects, so that the view can repaint only the parts of the viewport that have changed. Cosmetic pens (width 0)
+    are one pixel wide.
+
+        :param QPen pens:
+        :rtype: float
+    """
+    return max([pen.widthF() for pen in pens] + [1.0]) / 2.0
+
+
+# --- element type -> GungItem class created for it by the loaders (see register_item_class)
+item_classes = {}
+
+
+def register_item_class(item_class):
+    """
+    Class decorator that makes the items of the class loadable from the files by the scenes and the records of its
+    element type loadable by the headless GungModel. Decorate your own item classes with it, wherever they're
+    defined, before loading the graphs using them:
+
+        @register_item_class
+        class MyNode(GungNode):
+            element_type = "MyNode"
+            record_class = MyNodeRecord
+
+    The class registered last for an element type replaces the previous one.
+
+        :param type item_class: GungItem subclass declaring its own element_type
+        :rtype: type
+    """
+    if 'element_type' not in item_class.__dict__:
+        raise ValueError("Item class %s doesn't declare its element_type." % item_class.__name__)
+    item_classes[item_class.element_type] = item_class
+    register_record_class(item_class.element_type, item_class.record_class)
+    return item_class
 
 
 def get_gung_node_classes():
-    gung_classes = {}
-    for name, obj in inspect.getmembers(sys.modules[__name__], inspect.isclass):
-        if 'element_type' in obj.__dict__.keys():
-            gung_classes[name] = obj
-    return gung_classes
+    """
+    Returns the registered item classes by their element types (see register_item_class).
+
+        :rtype: dict
+    """
+    return item_classes
 
 
 class GungNodeResizer(QGraphicsItem):
@@ -41,13 +97,9 @@ class GungNodeResizer(QGraphicsItem):
         self.setFlag(QGraphicsItem.ItemIsSelectable)
         self.storedPos = QPointF()
 
-        self.itemWidth = config.getfloat("Resizer", "Width")
-        self.itemHeight = config.getfloat("Resizer", "Height")
-
-        self.pen = QPen(QColor(0, 0, 0))
-        self.brush = QBrush(QColor(50, 50, 50))
-        self.disabledPen = QPen(QColor(40, 40, 40))
-        self.disabled_brush = QBrush(QColor(50, 50, 50))
+        settings = self.scene().settings.resizer
+        self.itemWidth = settings.width
+        self.itemHeight = settings.height
 
         self.sizePoint = QPoint(self.itemWidth, self.itemHeight)
 
@@ -75,18 +127,22 @@ class GungNodeResizer(QGraphicsItem):
             :param option:
             :param widget:
         """
+        if get_level_of_detail(painter) < self.scene().settings.level_of_detail.plugs:
+            return
+
         painter.setRenderHint(QPainter.Antialiasing)
         # draw body of a node
         if self.parentItem().isSelected():
-            painter.setPen(self.parentItem().selectedPen)
+            painter.setPen(self.parentItem().get_pen("selected"))
         else:
-            painter.setPen(self.parentItem().unselectedPen)
+            painter.setPen(self.parentItem().get_pen())
 
+        registry = self.parentItem().get_styles()
         if self.flags() & QGraphicsItem.ItemIsMovable:
-            painter.setBrush(self.brush)
+            painter.setBrush(registry.get_brush(self.__class__))
         else:
-            painter.setPen(self.disabledPen)
-            painter.setBrush(self.disabled_brush)
+            painter.setPen(registry.get_pen(self.__class__, "disabled"))
+            painter.setBrush(registry.get_brush(self.__class__, "disabled"))
 
         painter.drawPolygon([QPoint(0, 0),
                              QPoint(-self.itemWidth, 0),
@@ -94,7 +150,17 @@ class GungNodeResizer(QGraphicsItem):
                             Qt.OddEvenFill)
 
     def boundingRect(self):
-        return QRectF(-self.itemWidth, -self.itemHeight, self.itemWidth, self.itemHeight)
+        margin = get_pen_margin(self.parentItem().get_styles().get_pen(self.__class__, "disabled"),
+                                self.parentItem().get_pen("selected"),
+                                self.parentItem().get_pen())
+        return QRectF(-self.itemWidth, -self.itemHeight, self.itemWidth, self.itemHeight).adjusted(-margin, -margin,
+                                                                                                 margin, margin)
+
+    def settings_changed(self):
+        settings = self.scene().settings.resizer
+        self.prepareGeometryChange()
+        self.itemWidth = settings.width
+        self.itemHeight = settings.height
 
     def itemChange(self, change, value):
         """
@@ -122,41 +188,44 @@ class GungNodeResizer(QGraphicsItem):
         return QGraphicsItem.itemChange(self, change, value)
 
 
-items = []
-
-
 class GungItem(QGraphicsItem):
     """
     Base class for all GUNG scene items. Inside the constructor it will try to obtain the unique id for this item
     that will be used later in every important operation (especially during the connection of the plugs, undo/redo,
     save/load). The utility items like resizer are not considered as a GUNG items.
+
+    Items are owned by the scene they belong to (its id index keeps them alive) or, once removed, by whatever holds
+    them afterwards (i.e. the undo command that can bring them back). Nothing else keeps a reference to them.
+
+    The properties of an item are kept in a record (see gung.gungmodel) that the scene adds to its GungModel,
+    so the item is just a view of that record. Override record_class if your item declares its own properties.
     """
     element_type = "GungNode"
+    record_class = GungRecord
+
+    # --- cache mode of the items of the class, i.e. set it to QGraphicsItem.DeviceCoordinateCache in your subclass
+    # --- of GungNode or GungGroup, so that they are not repainted while the view pans or they're dragged around.
+    # --- Everything that changes the look of an item calls update(), which invalidates the cache.
+    cache_mode = QGraphicsItem.NoCache
 
     def __init__(self, parent=None, scene=None, node_id=None):
         QGraphicsItem.__init__(self, parent)
-        scene.addItem(self)
-        # self.self_target = self  # This keeps the reference to the object so it
-        # won't get collected by garbage collector
-        # later on: How idiotic this was...
-
-        # keep this item in a list to avoid collecting it by the garbage collector
-        items.append(self)
+        if self.cache_mode != QGraphicsItem.NoCache:
+            self.setCacheMode(self.cache_mode)
 
         self.id_ = None
         self._is_enabled = True
 
-        self.properties = dict()
-
-        self.properties['pos_x'] = 0.0
-        self.properties['pos_y'] = 0.0
-
         if node_id is None:
-            node_id = self.scene().get_new_id()
+            node_id = scene.get_new_id()
 
-        self.properties["node_id"] = node_id
+        self.properties = self.record_class(self.element_type, node_id)
         self.parent_ = parent
 
+        # --- the id has to be known before the item enters the scene, so that the scene can index it.
+        scene.addItem(self)
+        scene.register_item(self)
+
     def as_xml(self, document):
         """
         Returns this item and all its sub items as an xml element.
@@ -167,8 +236,8 @@ class GungItem(QGraphicsItem):
 
         self.properties["posX"] = self.pos().x()
 
-        for p in self.properties.keys():
-            element.setAttribute(p, str(self.properties[p]))
+        for p, value in get_record_schema(self.properties.__class__).encode(self.properties).items():
+            element.setAttribute(p, value)
 
         for item in self.childItems():
             if not isinstance(item, GungItem):
@@ -178,29 +247,85 @@ class GungItem(QGraphicsItem):
 
         return element
 
+    def write_xml(self, writer):
+        """
+        Writes this item and all its sub items with the streaming writer, in the same format as as_xml.
+
+            :param gung.gungmodel.GungXmlWriter writer:
+        """
+        self.properties["posX"] = self.pos().x()
+
+        with writer.element(self.element_type, get_record_schema(self.properties.__class__).encode(self.properties)):
+            for item in self.childItems():
+                if isinstance(item, GungItem):
+                    item.write_xml(writer)
+
     def from_xml(self, xmlnode):
         """
         Deserializes a gung item from the provided xml node. The attributes stored in the xml will be loaded on self.
 
             :param xmlnode:
         """
-        for k in xmlnode.attributes.keys():
-            if k not in self.properties.keys():
-                continue
-            self.properties[k] = type(self.properties[k])(xmlnode.attributes[k].value)
-
-        self.setX(self.properties['pos_x'])
-        self.setY(self.properties['pos_y'])
+        self.load_properties(dict((k, xmlnode.attributes[k].value) for k in xmlnode.attributes.keys()))
 
-        classes = get_gung_node_classes()
         for node in xmlnode.childNodes:
             if not node.nodeType == Node.ELEMENT_NODE:
                 continue
-            if node.tagName not in classes.keys():
+            if node.tagName not in item_classes:
                 continue
-            gn = classes[node.tagName](parent=self, scene=self.scene())
+            gn = item_classes[node.tagName](parent=self, scene=self.scene())
             gn.from_xml(node)
 
+        self.finish_loading()
+
+    def load_properties(self, values):
+        """
+        Sets the properties of this item from the provided dictionary (i.e. attributes of an xml element or a record of
+        a headless GungModel). The fields are decoded with the schema of the record class (see
+        gung.gungmodel.get_record_schema), the other properties are converted to the types of the current ones and
+        the ones that this item doesn't have are skipped.
+
+            :param values: dictionary or GungRecord
+        """
+        properties = self.properties
+        previous_id = properties.node_id
+        decoders = get_record_schema(properties.__class__).decoders
+        for k, value in values.items():
+            decoder = decoders.get(k)
+            if decoder is not None:
+                setattr(properties, k, decoder(value))
+            elif properties.extra is not None and k in properties.extra:
+                current = properties.extra[k]
+                decoder = property_types.get(type(current), (type(current), None))[0]
+                properties.extra[k] = decoder(value)
+
+        if properties.node_id != previous_id:
+            self.scene().reindex_item(self, previous_id)
+
+        self.setX(properties.pos_x)
+        self.setY(properties.pos_y)
+        self.update()
+
+    def finish_loading(self):
+        """
+        Called when this item and all its children have been loaded. Override it to update the item with the loaded
+        properties.
+        """
+        pass
+
+    def bind_record(self, record):
+        """
+        Makes this item a view of another record. The virtualized scene uses it to recycle the items (see
+        GungScene.set_virtualized), so override it if your item keeps any state derived from its properties.
+
+            :param gung.gungmodel.GungRecord record:
+        """
+        self.properties = record
+        self.setSelected(False)
+        self.setPos(record.pos_x, record.pos_y)
+        # --- the item shows another record now, so its cache is outdated.
+        self.update()
+
     def set_enabled(self, state):
         self._is_enabled = state
         self.update()
@@ -220,15 +345,51 @@ class GungItem(QGraphicsItem):
     def is_enabled(self):
         return self._is_enabled
 
-    @staticmethod
-    def get_color_config(section, option):
-        try:
-            node_color = config.get(section, option)
-            r, g, b = [int(x) for x in node_color.split(",")]
-        except ConfigParser.NoSectionError, ConfigParser.NoOptionError:
-            print "Failed to get the color option", section, option
-            r, g, b = (0, 0, 0,)
-        return QColor(r, g, b, )
+    def set_node_id(self, node_id):
+        """
+        Changes the id of this item keeping the id index of the scene up to date.
+
+            :param int node_id:
+        """
+        previous_id = self.properties['node_id']
+        self.properties['node_id'] = node_id
+        if self.scene() is not None:
+            self.scene().reindex_item(self, previous_id)
+
+    def get_styles(self):
+        """
+        Returns the style registry of the scene of this item, which has the styles made of its settings, or the shared
+        one if the item is not in a scene.
+
+            :rtype: gung.gungstyle.GungStyleRegistry
+        """
+        scene = self.scene()
+        return styles if scene is None else scene.styles
+
+    def get_pen(self, state="default"):
+        """
+        Returns the shared pen registered for the class of this item in the provided state (see gung.gungstyle).
+
+            :param str state:
+            :rtype: QPen
+        """
+        return self.get_styles().get_pen(self.__class__, state)
+
+    def get_brush(self, state="default"):
+        """
+        Returns the shared brush registered for the class of this item in the provided state (see gung.gungstyle).
+
+            :param str state:
+            :rtype: QBrush
+        """
+        return self.get_styles().get_brush(self.__class__, state)
+
+    def settings_changed(self):
+        """
+        Called by the scene when its settings have changed (see GungScene.override_settings). Override it if your item
+        keeps anything derived from them.
+        """
+        self.update()
 
     def itemChange(self, change, value):
         """
@@ -242,47 +403,65 @@ class GungItem(QGraphicsItem):
         """
         if change == QGraphicsItem.ItemPositionHasChanged:
             # --- inform the scene that this item has moved.
-            if isinstance(self.parent_, GungGroup):
+            if isinstance(self.parent_, GungGroup) and self.scene() is not None \
+                    and not self.scene().defer_layout(self.parent_):
                 self.parent_.update_bounding_rect()
+        elif change == QGraphicsItem.ItemSceneChange:
+            # --- the item is leaving its scene (or its parent does), so drop it from the id index.
+            # --- The properties are missing only if this is called from inside of the constructor.
+            if self.scene() is not None and hasattr(self, 'properties'):
+                self.scene().unregister_item(self)
+        elif change == QGraphicsItem.ItemSceneHasChanged:
+            if self.scene() is not None and hasattr(self, 'properties'):
+                self.scene().register_item(self)
 
         return QGraphicsItem.itemChange(self, change, value)
 
     def setParentItem(self, parent_item):
         self.parent_ = parent_item
         QGraphicsItem.setParentItem(self, parent_item)
+        if self.scene() is not None:
+            self.scene().reparent_item(self)
 
 
+@register_item_class
 class GungNode(GungItem):
     """
     Base class of the graphical node. Inherit this to get some specific look of your nodes.
     """
     element_type = "GungNode"
+    record_class = NodeRecord
     resizerClass = GungNodeResizer
 
-    def __init__(self, name="", parent=None, scene=None):
-        GungItem.__init__(self, parent=parent, scene=scene)
+    # --- read-only names of the shared styles (see gung.gungstyle) that the items used to create for themselves
+    nodeColor = property(lambda self: self.get_brush().color())
+    lightGrayBrush = property(lambda self: self.get_brush())
+    darkGrayBrush = property(lambda self: self.get_brush("dark"))
+    selectedPen = property(lambda self: self.get_pen("selected"))
+    disabledPen = property(lambda self: self.get_pen("disabled"))
+    unselectedPen = property(lambda self: self.get_pen())
+    textPen = property(lambda self: self.get_pen("text"))
+
+    def __init__(self, name="", parent=None, scene=None, node_id=None):
+        GungItem.__init__(self, parent=parent, scene=scene, node_id=node_id)
 
         self.resizer = None
 
+        settings = self.scene().settings.node
         self.properties['name'] = name
-        self.properties['node_width'] = config.getfloat("Node", "MinimalWidth")
-        self.properties['node_height'] = config.getfloat("Node", "MinimalHeight")
-        self.properties['min_width'] = config.getfloat("Node", "MinimalWidth")
-        self.properties['min_height'] = config.getfloat("Node", "MinimalHeight")
-
-        self.properties['attributes_offset'] = config.getfloat("Node", "AttributesOffset")
+        self.properties['node_width'] = settings.minimal_width
+        self.properties['node_height'] = settings.minimal_height
+        self.properties['min_width'] = settings.minimal_width
+        self.properties['min_height'] = settings.minimal_height
 
-        self.bboxW = config.getfloat("Node", "MinimalWidth")
-        self.bboxH = config.getfloat("Node", "MinimalHeight")
+        self.properties['attributes_offset'] = settings.attributes_offset
 
-        self.nodeColor = self.get_color_config("Node", "NodeColor")
-        self.lightGrayBrush = QBrush(self.nodeColor)
-        self.darkGrayBrush = QBrush(Qt.darkGray)
+        self.bboxW = settings.minimal_width
+        self.bboxH = settings.minimal_height
+        self.bounding_rect = QRectF(0, 0, self.bboxW, self.bboxH)
 
-        self.selectedPen = QPen(self.get_color_config("Node", "SelectedEdgeColor"))
-        self.disabledPen = QPen(QColor(40, 40, 40))
-        self.unselectedPen = QPen(self.get_color_config("Node", "UnSelectedEdgeColor"))
-        self.textPen = QPen(self.get_color_config("Node", "TextColor"))
+        # --- label name -> (key, QStaticText, ascent) of the laid out labels (see get_label)
+        self._labels = {}
 
         # self.node_font = QFont("Arial", 7)
 
@@ -299,9 +478,19 @@ class GungNode(GungItem):
 
         self.parent_ = parent
 
+    def set_name(self, name):
+        """
+        Renames this node.
+
+            :param str name:
+        """
+        self.properties['name'] = name
+        self.update()
+
     def request_minimum_width(self, minimum_width):
-        if minimum_width < config.getfloat("Node", "MinimalWidth"):
-            minimum_width = config.getfloat("Node", "MinimalWidth")
+        minimal_width = self.scene().settings.node.minimal_width
+        if minimum_width < minimal_width:
+            minimum_width = minimal_width
 
         if self.properties['min_width'] < minimum_width:
             self.properties['min_width'] = minimum_width
@@ -322,10 +511,18 @@ class GungNode(GungItem):
         self.resizer.setY(self.properties['node_height'])
 
     def update_bbox(self):
+        """
+        Updates the bounding rect after the size of this node has changed. Call prepareGeometryChange before.
+        """
         self.bboxW = self.properties['node_width']
         self.bboxH = self.properties['node_height']
+        margin = get_pen_margin(self.get_pen("selected"), self.get_pen(), self.get_pen("disabled"))
+        self.bounding_rect = QRectF(0, 0, self.bboxW, self.bboxH).adjusted(-margin, -margin, margin, margin)
 
     def rearrange_attributes(self):
+        if self.scene().defer_layout(self):
+            return
+
         current_height = -1
         for child_item in self.childItems():
             if not isinstance(child_item, GungAttribute):
@@ -367,11 +564,21 @@ class GungNode(GungItem):
         """
         return QGraphicsItem.mousePressEvent(self, event)
 
-    def from_xml(self, xmlnode):
-        GungItem.from_xml(self, xmlnode)
+    def finish_loading(self):
         self.resizer.setX(self.properties['node_width'])
         self.resizer.setY(self.properties['node_height'])
 
+    def bind_record(self, record):
+        GungItem.bind_record(self, record)
+        self.prepareGeometryChange()
+        self.update_bbox()
+
+    def settings_changed(self):
+        # --- the pens could have changed their widths.
+        self.prepareGeometryChange()
+        self.update_bbox()
+        self.resizer.settings_changed()
+
     def set_size(self, size):
         """
         Sets an attributes in properties dict, updates bounding box and calls the rearrangement
@@ -381,12 +588,15 @@ class GungNode(GungItem):
             :param QSize size:
         """
         size_x = size.x() if size.x() >= self.properties['min_width'] else self.properties['min_width']
-        self.properties['node_width'] = size_x
         size_y = size.y() if size.y() >= self.properties['min_height'] else self.properties['min_height']
-        self.properties['node_height'] = size_y
-        self.update()
 
+        # --- the attributes are as wide as the node, so their geometry changes too.
         self.prepareGeometryChange()
+        for child_item in self.childItems():
+            if isinstance(child_item, GungAttribute):
+                child_item.prepareGeometryChange()
+        self.properties['node_width'] = size_x
+        self.properties['node_height'] = size_y
         self.update_bbox()
 
         self.rearrange_attributes()
@@ -397,6 +607,8 @@ class GungNode(GungItem):
         self.resizer.setFlag(QGraphicsItem.ItemIsSelectable, state)
         self.setFlag(QGraphicsItem.ItemIsMovable, state)
         self.setFlag(QGraphicsItem.ItemIsSelectable, state)
+        # --- the resizer looks different when it can't be moved.
+        self.resizer.update()
 
     def set_disabled(self, state):
         super(GungNode, self).set_disabled(state)
@@ -404,6 +616,8 @@ class GungNode(GungItem):
         self.resizer.setFlag(QGraphicsItem.ItemIsSelectable, not state)
         self.setFlag(QGraphicsItem.ItemIsMovable, not state)
         self.setFlag(QGraphicsItem.ItemIsSelectable, not state)
+        # --- the resizer looks different when it can't be moved.
+        self.resizer.update()
 
     def paint(self, painter, option, widget=None):
         """
@@ -414,23 +628,82 @@ class GungNode(GungItem):
             :param option:
             :param widget:
         """
+        lod = get_level_of_detail(painter)
+        thresholds = self.scene().settings.level_of_detail
+        if lod < thresholds.antialiasing:
+            # --- the node is just a few pixels big, so a filled rect is all that can be seen.
+            brush = self.get_brush("selected") if self.isSelected() else self.get_brush()
+            painter.fillRect(QRectF(0, 0, self.properties['node_width'], self.properties['node_height']), brush)
+            return
+
         painter.setRenderHint(QPainter.Antialiasing)
 
         # --- Distinguish the selected nodes from the unselected ones.
         if self.isSelected():
-            painter.setPen(self.selectedPen)
+            painter.setPen(self.get_pen("selected"))
         else:
-            painter.setPen(self.unselectedPen)
+            painter.setPen(self.get_pen())
 
-        painter.setBrush(self.nodeColor)
+        painter.setBrush(self.get_brush())
         painter.drawRect(0, 0, self.properties['node_width'], self.properties['node_height'])
 
+        if lod < thresholds.text:
+            return
+
         # --- Draw name of the node
-        painter.setPen(self.textPen)
-        painter.drawText(5, 15, self.properties['name'])
+        painter.setPen(self.get_pen("text"))
+        self.paint_labels(painter)
+
+    def paint_labels(self, painter):
+        """
+        Draws the labels of this node, which is just its name. Override it and call draw_label to add more of them.
+
+            :param QPainter painter:
+        """
+        self.draw_label(painter, "name", self.properties['name'], QPointF(5, 15), self.properties['node_width'] - 10)
+
+    def draw_label(self, painter, label, text, pos, width):
+        """
+        Draws the text just like painter.drawText(pos, text) does, but elided to the width and laid out only when
+        the text, the font of the painter or the width have changed (see get_label).
+
+            :param QPainter painter:
+            :param str label: name under which the laid out text is cached.
+            :param str text:
+            :param QPointF pos: left end of the baseline of the text.
+            :param float width:
+        """
+        static_text, ascent = self._get_label_entry(label, text, painter.font(), width)
+        painter.drawStaticText(QPointF(pos.x(), pos.y() - ascent), static_text)
+
+    def get_label(self, label, text, font, width):
+        """
+        Returns the text elided to the width and laid out with the font. It's cached under the label name until
+        the text, the font or the width change.
+
+            :param str label:
+            :param str text:
+            :param QFont font:
+            :param float width:
+            :rtype: QStaticText
+        """
+        return self._get_label_entry(label, text, font, width)[0]
+
+    def _get_label_entry(self, label, text, font, width):
+        key = (text, font.key(), width)
+        entry = self._labels.get(label)
+        if entry is not None and entry[0] == key:
+            return entry[1:]
+
+        metrics = QFontMetricsF(font)
+        static_text = QStaticText(metrics.elidedText(text, Qt.ElideRight, width))
+        static_text.setTextFormat(Qt.PlainText)
+        static_text.prepare(QTransform(), font)
+        self._labels[label] = (key, static_text, metrics.ascent())
+        return static_text, metrics.ascent()
 
     def boundingRect(self):
-        return QRectF(0, 0, self.bboxW, self.bboxH)
+        return self.bounding_rect
 
     def itemChange(self, change, value):
         """
@@ -442,9 +715,10 @@ class GungNode(GungItem):
             :param value: defines a value of a change
             :rtype: QVariant
         """
-        if change == QGraphicsItem.ItemPositionHasChanged:
+        if change == QGraphicsItem.ItemPositionHasChanged and self.scene() is not None:
             # --- inform the scene that this item has moved.
-            self.scene().nodesHaveMoved = True
+            if not self.scene().defer_move(self):
+                self.scene().nodesHaveMoved = True
 
             # if isinstance(self.parent_, GungGroup):
             #     self.parent_.update_bounding_rect()
@@ -480,13 +754,15 @@ class GungNode(GungItem):
         return result
 
 
+@register_item_class
 class GungAttribute(GungItem):
     element_type = "GungAttribute"
+    record_class = AttributeRecord
 
-    def __init__(self, parent=None, scene=None):
-        GungItem.__init__(self, parent, scene)
+    def __init__(self, parent=None, scene=None, node_id=None):
+        GungItem.__init__(self, parent, scene, node_id)
 
-        self.properties['attr_height'] = config.getfloat("Attribute", "Height")
+        self.properties['attr_height'] = self.scene().settings.attribute.height
         self.properties['edge_offset'] = 0.0
         self.properties['inverted'] = False
 
@@ -504,6 +780,9 @@ class GungAttribute(GungItem):
         self.properties['inverted'] = inverted
 
     def rearrange_plugs(self):
+        if self.scene().defer_layout(self):
+            return
+
         plugs = []
         for child_item in self.childItems():
             if not isinstance(child_item, GungPlug):
@@ -559,12 +838,19 @@ class GungAttribute(GungItem):
         return QRectF(0, 0, self.parentItem().properties['node_width'], self.properties['attr_height'])
 
 
+@register_item_class
 class GungPlug(GungItem):
     element_type = "GungPlug"
+    record_class = PlugRecord
     acceptsConnections = "GungOutPlug"
 
-    def __init__(self, parent=None, scene=None):
-        GungItem.__init__(self, parent=parent, scene=scene)
+    # --- read-only names of the shared styles (see gung.gungstyle) that the items used to create for themselves
+    plugPen = property(lambda self: self.get_pen())
+    plugBrush = property(lambda self: self.get_brush())
+    highlightedPlugBrush = property(lambda self: self.get_brush("highlighted"))
+
+    def __init__(self, parent=None, scene=None, node_id=None):
+        GungItem.__init__(self, parent=parent, scene=scene, node_id=node_id)
 
         self._is_enabled = True
 
@@ -573,15 +859,11 @@ class GungPlug(GungItem):
 
         self.isHighlighted = False
 
-        plug_color = QColor(150, 255, 150)
+        self.edges = OrderedSet()
 
-        self.plugPen = QPen(plug_color.lighter())
-        self.plugBrush = QBrush(plug_color)
-        self.highlightedPlugBrush = QBrush(plug_color.lighter())
-
-        self.edges = []
-
-        self.setFlag(QGraphicsItem.ItemSendsScenePositionChanges)
+        # --- during the bulk build the edges are updated once at the end, so there's no need to track the position.
+        if not scene.defer_item_flag(self, QGraphicsItem.ItemSendsScenePositionChanges):
+            self.setFlag(QGraphicsItem.ItemSendsScenePositionChanges)
 
     def accepts_drop(self, plug_out):
         result = False
@@ -614,12 +896,15 @@ class GungPlug(GungItem):
             :param option:
             :param widget:
         """
-        painter.setPen(self.plugPen)
+        if get_level_of_detail(painter) < self.scene().settings.level_of_detail.plugs:
+            return
+
+        painter.setPen(self.get_pen())
 
         if self.isHighlighted:
-            painter.setBrush(self.highlightedPlugBrush)
+            painter.setBrush(self.get_brush("highlighted"))
         else:
-            painter.setBrush(self.plugBrush)
+            painter.setBrush(self.get_brush())
         # painter.drawRect(0, 0, self.properties['plug_width'], self.properties['plug_height'])
         painter.drawEllipse(1, 1, self.properties['plug_width'] - 1, self.properties['plug_height'] - 1)
 
@@ -628,7 +913,9 @@ class GungPlug(GungItem):
         self.update()
 
     def boundingRect(self, *args, **kwargs):
-        return QRectF(0, 0, self.properties['plug_width'], self.properties['plug_height'])
+        margin = get_pen_margin(self.get_pen())
+        return QRectF(0, 0, self.properties['plug_width'], self.properties['plug_height']).adjusted(-margin, -margin,
+                                                                                                 margin, margin)
 
     def itemChange(self, change, value):
         """
@@ -641,20 +928,25 @@ class GungPlug(GungItem):
             :return: QVariant
         """
 
-        if change == QGraphicsItem.ItemScenePositionHasChanged:
+        if change == QGraphicsItem.ItemScenePositionHasChanged and self.scene() is not None \
+                and not self.scene().is_bulk_building():
             for edge in self.edges:
                 if edge is None:
                     continue
                 if edge.item_to is self:
-                    edge.prepareGeometryChange()
                     edge.set_to_pos(self.mapToScene(self.boundingRect().center()))
                 if edge.item_from is self:
-                    edge.prepareGeometryChange()
                     edge.set_from_pos(self.mapToScene(self.boundingRect().center()))
 
-        return QGraphicsItem.itemChange(self, change, value)
+        return GungItem.itemChange(self, change, value)
+
+    def bind_record(self, record):
+        GungItem.bind_record(self, record)
+        self.edges.clear()
+        self.isHighlighted = False
 
 
+@register_item_class
 class GungInPlug(GungPlug):
     """
     This class represents all the plugs that will accept all incoming connections.
@@ -662,8 +954,8 @@ class GungInPlug(GungPlug):
     element_type = "GungInPlug"
     acceptsConnections = "GungOutPlug"
 
-    def __init__(self, parent=None, scene=None):
-        GungPlug.__init__(self, parent=parent, scene=scene)
+    def __init__(self, parent=None, scene=None, node_id=None):
+        GungPlug.__init__(self, parent=parent, scene=scene, node_id=node_id)
 
     def mousePressEvent(self, event):
         """
@@ -686,6 +978,7 @@ class GungInPlug(GungPlug):
         self.scene().delete_edge_call(edge_id=edge.properties['node_id'])
 
 
+@register_item_class
 class GungOutPlug(GungPlug):
     """
     This class represents all the plugs from which you'll be making connections.
@@ -693,31 +986,34 @@ class GungOutPlug(GungPlug):
     element_type = "GungOutPlug"
     acceptsConnections = "GungPlug,GungInPlug"
 
-    def __init__(self, parent=None, scene=None):
-        GungPlug.__init__(self, parent=parent, scene=scene)
+    def __init__(self, parent=None, scene=None, node_id=None):
+        GungPlug.__init__(self, parent=parent, scene=scene, node_id=node_id)
 
 
+@register_item_class
 class GungGroup(GungItem):
     """
     Visual grouping item. It creates an outline around the items that are its children so they can be organized and
     moved together.
     """
     element_type = "GungGroup"
+    record_class = GroupRecord
+
+    # --- read-only names of the shared styles (see gung.gungstyle) that the items used to create for themselves
+    group_color = property(lambda self: self.get_brush().color())
+    group_brush = property(lambda self: self.get_brush())
 
     def __init__(self, parent=None, scene=None, node_id=None):
         """
         Base class to inherit if you want to create your own groups.
         """
-        GungItem.__init__(self, parent, scene)
+        GungItem.__init__(self, parent, scene, node_id)
         self.rect = QRectF()
+        # --- edges ending at the plugs inside of this group while its content is not loaded (see
+        # --- GungScene.load_binary)
+        self.edges = OrderedSet()
 
-        self.group_color = self.get_color_config("Group", "GroupBackground")
-        self.group_brush = QBrush(self.group_color)
-
-        try:
-            self.offset = config.getfloat("Group", "GroupOffset")
-        except ConfigParser.NoOptionError, ConfigParser.NoSectionError:
-            self.offset = 10
+        self.offset = self.scene().settings.group.group_offset
 
         self.setFlag(QGraphicsItem.ItemIsMovable, True)
         self.setFlag(QGraphicsItem.ItemIsSelectable, True)
@@ -727,6 +1023,34 @@ class GungGroup(GungItem):
         # TODO: Double check if this is even needed.
         self._node_id = node_id
 
+    def settings_changed(self):
+        self.offset = self.scene().settings.group.group_offset
+        self.update_bounding_rect()
+
+    def set_unloaded_rect(self, rect):
+        """
+        Sets the frame of the group whose content is not loaded yet.
+
+            :param QRectF rect: bounds of the content in the coordinates of this group
+        """
+        self.prepareGeometryChange()
+        self.rect = rect.adjusted(-self.offset, -self.offset, self.offset, self.offset)
+        self.update()
+        for edge in self.edges:
+            self.update_edge(edge)
+
+    def update_edge(self, edge):
+        """
+        Moves the end of the edge that is attached to this group to its center.
+
+            :param GungEdge edge:
+        """
+        center = self.mapToScene(self.rect.center())
+        if edge.item_to is self:
+            edge.set_to_pos(center)
+        if edge.item_from is self:
+            edge.set_from_pos(center)
+
     def update_bounding_rect(self):
         rect = None
         if not self.childItems():  # return the last registered bounding box if the group has no children.
@@ -744,6 +1068,7 @@ class GungGroup(GungItem):
                 rect = QRectF(r)
                 continue
             rect = rect.united(r)
+        self.prepareGeometryChange()
         if rect is None:
             self.rect = QRectF()
         else:
@@ -751,42 +1076,60 @@ class GungGroup(GungItem):
         self.update()
 
     def paint(self, painter, option, widget=None):
-        painter.setBrush(self.group_brush)
+        painter.setBrush(self.get_brush())
         painter.drawRect(self.rect)
 
     def boundingRect(self):
-        return self.rect
+        if self.rect.isNull():
+            return self.rect
+        # --- the outline is drawn with the default pen.
+        margin = get_pen_margin()
+        return self.rect.adjusted(-margin, -margin, margin, margin)
 
     def mousePressEvent(self, event):
         self.scene().topZ += .0001
         self.setZValue(self.scene().topZ)
         return QGraphicsItem.mousePressEvent(self, event)
 
+    def mouseDoubleClickEvent(self, event):
+        self.scene().expand_group(self.properties['node_id'])
+        return QGraphicsItem.mouseDoubleClickEvent(self, event)
+
     def itemChange(self, change, value):
         """
         Called whenever a change happens to the instance of this class like move, click, resize ect.
         In this case used to register position changes of the nodes, so that they can be reverted using the
-        undo queue.
+        undo queue, and to move the ends of the edges attached to this group.
 
             :param change: defines a type of a change
             :param value: defines a value of a change
             :rtype: QVariant
         """
-        if change == QGraphicsItem.ItemPositionHasChanged:
+        if change == QGraphicsItem.ItemPositionHasChanged and self.scene() is not None:
             # --- inform the scene that this item has moved.
-            self.scene().nodesHaveMoved = True
+            if not self.scene().defer_move(self):
+                self.scene().nodesHaveMoved = True
 
             # if isinstance(self.parent_, GungGroup):
             #     self.parent_.update_bounding_rect()
+        elif change == QGraphicsItem.ItemScenePositionHasChanged and self.scene() is not None \
+                and not self.scene().is_bulk_building():
+            for edge in self.edges:
+                self.update_edge(edge)
 
         return GungItem.itemChange(self, change, value)
 
 
+@register_item_class
 class GungEdge(GungItem):
     element_type = "GungEdge"
+    record_class = EdgeRecord
 
-    def __init__(self, item_from_id=-1, item_to_id=-1, parent=None, scene=None):
-        GungItem.__init__(self, None, scene)
+    # --- read-only names of the shared styles (see gung.gungstyle) that the items used to create for themselves
+    edge_pen = property(lambda self: self.get_pen())
+
+    def __init__(self, item_from_id=-1, item_to_id=-1, parent=None, scene=None, node_id=None):
+        GungItem.__init__(self, None, scene, node_id)
 
         self.properties['item_from_id'] = item_from_id
         self.properties['item_to_id'] = item_to_id
@@ -794,81 +1137,204 @@ class GungEdge(GungItem):
         self.item_from = None
         self.item_to = None
 
-        item_from = self.scene().get_item_by_id(int(item_from_id))
-        item_to = self.scene().get_item_by_id(int(item_to_id))
-
-        if item_from and item_to:
-            self.from_pos = item_from.mapToScene(item_from.boundingRect().center())
-            self.to_pos = item_to.mapToScene(item_to.boundingRect().center())
-        else:
-            self.from_pos = QPointF()
-            self.to_pos = QPointF()
-
-        self.edge_pen = QPen(QColor(0, 0, 0))
         self.setZValue(self.scene().topEdgeZ)
         self.scene().topEdgeZ += .0001
+        self.setFlag(QGraphicsItem.ItemIsSelectable, True)
 
+        # --- geometry of the edge, rebuilt only when one of its ends moves (see set_positions)
+        self.from_pos = QPointF()
+        self.to_pos = QPointF()
+        self.path = QPainterPath()
+        self.shape_path = QPainterPath()
         self.bounding_rect = QRectF()
 
+        # --- True if the edge is painted and hit-tested by the edge layer of the scene (see set_batched)
+        self.batched = self.scene().edge_layer is not None
+        if self.batched:
+            self.setFlag(QGraphicsItem.ItemHasNoContents, True)
+
+        item_from = self.scene().get_item_by_id(int(item_from_id))
+        item_to = self.scene().get_item_by_id(int(item_to_id))
+
+        if item_from and item_to:
+            self.set_positions(item_from.mapToScene(item_from.boundingRect().center()),
+                               item_to.mapToScene(item_to.boundingRect().center()))
+
         self._parent = parent
 
     def reconnect_edge(self):
         if not self.properties['item_from_id'] == -1 \
                 and not self.properties['item_from_id'] == self.properties['node_id']:
-            self.item_from = self.scene().get_item_by_id(int(self.properties['item_from_id']))
+            self.item_from = self.scene().get_edge_end(int(self.properties['item_from_id']))
             if self.item_from is not None:
-                self.item_from.edges.append(self)
+                self.item_from.edges.add(self)
                 self.set_from_pos(self.item_from.mapToScene(self.item_from.boundingRect().center()))
         if not self.properties['item_to_id'] == -1 and not self.properties['item_to_id'] == self.properties['node_id']:
-            self.item_to = self.scene().get_item_by_id(int(self.properties['item_to_id']))
+            self.item_to = self.scene().get_edge_end(int(self.properties['item_to_id']))
             if self.item_to is not None:
-                self.item_to.edges.append(self)
+                self.item_to.edges.add(self)
                 self.set_to_pos(self.item_to.mapToScene(self.item_to.boundingRect().center()))
-        self.setFlag(QGraphicsItem.ItemHasNoContents, False)
+        self.scene().add_connection(self)
+        if self.batched:
+            self.scene().edge_layer.update_edge(self)
+        self.setFlag(QGraphicsItem.ItemHasNoContents, self.batched)
+
+    def bind_record(self, record):
+        GungItem.bind_record(self, record)
+        self.item_from = None
+        self.item_to = None
+        self.set_positions(QPointF(), QPointF())
+
+    def settings_changed(self):
+        # --- the width of the pen could have changed, so the geometry is rebuilt even though the ends stay in place.
+        self.path = QPainterPath()
+        self.set_positions(self.from_pos, self.to_pos)
 
     def disconnect_edge(self):
-        # TODO: Make it more loose coupled. Now it's a field for errors.
-        while self in self.item_from.edges:
-            self.item_from.edges.remove(self)
-        while self in self.item_to.edges:
-            self.item_to.edges.remove(self)
+        if self.item_from is not None:
+            self.item_from.edges.discard(self)
+        if self.item_to is not None:
+            self.item_to.edges.discard(self)
+        if self.scene() is not None:
+            self.scene().remove_connection(self)
         self.setFlag(QGraphicsItem.ItemHasNoContents, True)
 
+    def set_batched(self, state):
+        """
+        Hands the painting and the hit-testing of this edge over to the edge layer of the scene or takes them back
+        (see GungScene.set_batched_edges). The batched edge has no contents and no bounds of its own.
+
+            :param bool state:
+        """
+        self.prepareGeometryChange()
+        self.batched = state
+        self.setFlag(QGraphicsItem.ItemHasNoContents, state or self.item_from is None or self.item_to is None)
+        if state and self.scene() is not None:
+            self.scene().edge_layer.update_edge(self)
+
     def paint(self, painter, option, widget=None):
         if self.item_from is None or self.item_to is None:
             return
-        painter.setPen(self.edge_pen)
-        pos_start = self.item_from.mapToScene(QPointF()) + self.item_from.boundingRect().center()
-        pos_end = self.item_to.mapToScene(QPointF()) + self.item_to.boundingRect().center()
+        painter.setPen(self.get_pen("selected" if self.isSelected() else "default"))
 
-        knot_a = QPointF((pos_start.x() + pos_end.x()) / 2.0, pos_start.y())
-        knot_b = QPointF((pos_start.x() + pos_end.x()) / 2.0, pos_end.y())
-        path = QPainterPath()
-        path.moveTo(pos_start)
-        path.cubicTo(knot_a, knot_b, pos_end)
-        painter.drawPath(path)
+        if get_level_of_detail(painter) < self.scene().settings.level_of_detail.curves:
+            painter.drawLine(self.from_pos, self.to_pos)
+            return
 
-    def set_from_pos(self, point_from):
-        self.from_pos = QPointF(point_from)
+        painter.drawPath(self.path)
 
-        top_left_x = min(float(self.from_pos.x()), float(self.to_pos.x()))
-        top_left_y = min(float(self.from_pos.y()), float(self.to_pos.y()))
+    def update_position(self):
+        """
+        Moves the ends of this edge to the current positions of its plugs.
+        """
+        from_pos = self.from_pos
+        to_pos = self.to_pos
+        if self.item_from is not None:
+            from_pos = self.item_from.mapToScene(self.item_from.boundingRect().center())
+        if self.item_to is not None:
+            to_pos = self.item_to.mapToScene(self.item_to.boundingRect().center())
+        self.set_positions(from_pos, to_pos)
 
-        bottom_right_x = max(float(self.from_pos.x()), float(self.to_pos.x()))
-        bottom_right_y = max(float(self.from_pos.y()), float(self.to_pos.y()))
-        self.bounding_rect = QRectF(top_left_x, top_left_y, bottom_right_x - top_left_x,
-                                    bottom_right_y - top_left_y)
+    def set_from_pos(self, point_from):
+        self.set_positions(point_from, self.to_pos)
 
     def set_to_pos(self, point_to):
+        self.set_positions(self.from_pos, point_to)
+
+    def set_positions(self, point_from, point_to):
+        """
+        Moves the ends of this edge. The path, the shape and the bounding rect are rebuilt only if one of the ends has
+        actually changed, so paint just draws the cached path.
+
+            :param QPointF point_from: scene position of the start of the edge.
+            :param QPointF point_to: scene position of the end of the edge.
+        """
+        if point_from == self.from_pos and point_to == self.to_pos and not self.path.isEmpty():
+            return
+
+        self.prepareGeometryChange()
+        self.from_pos = QPointF(point_from)
         self.to_pos = QPointF(point_to)
 
-        top_left_x = min(float(self.from_pos.x()), float(self.to_pos.x()))
-        top_left_y = min(float(self.from_pos.y()), float(self.to_pos.y()))
+        knot_a = QPointF((self.from_pos.x() + self.to_pos.x()) / 2.0, self.from_pos.y())
+        knot_b = QPointF((self.from_pos.x() + self.to_pos.x()) / 2.0, self.to_pos.y())
+        self.path = QPainterPath()
+        self.path.moveTo(self.from_pos)
+        self.path.cubicTo(knot_a, knot_b, self.to_pos)
+
+        margin = get_pen_margin(self.get_pen(), self.get_pen("selected"))
+        stroker = QPainterPathStroker()
+        stroker.setWidth(margin * 2.0)
+        self.shape_path = stroker.createStroke(self.path)
 
-        bottom_right_x = max(float(self.from_pos.x()), float(self.to_pos.x()))
-        bottom_right_y = max(float(self.from_pos.y()), float(self.to_pos.y()))
-        self.bounding_rect = QRectF(top_left_x, top_left_y, bottom_right_x - top_left_x,
-                                    bottom_right_y - top_left_y)
+        self.bounding_rect = self.path.controlPointRect().adjusted(-margin, -margin, margin, margin)
+        if self.batched and self.scene() is not None:
+            self.scene().edge_layer.update_edge(self)
+
+    def itemChange(self, change, value):
+        """
+        Called whenever a change happens to the instance of this class like move, click, resize ect.
+        In this case used to repaint the batched edge in the edge layer when it's selected.
+
+            :param change: defines a type of a change
+            :param value: defines a value of a change
+            :rtype: QVariant
+        """
+        if change == QGraphicsItem.ItemSelectedHasChanged and self.batched and self.scene() is not None:
+            self.scene().edge_layer.update(self.bounding_rect)
+        return GungItem.itemChange(self, change, value)
 
     def boundingRect(self, *args, **kwargs):
+        if self.batched:
+            return QRectF()
         return self.bounding_rect
+
+    def shape(self):
+        if self.batched:
+            return QPainterPath()
+        return self.shape_path
+
+
+def register_default_styles(settings):
+    """
+    Registers the styles of the Gung items in gung.gungstyle.styles. Called again whenever the settings are reloaded.
+
+        :param gung.config.GungSettings settings:
+    """
+    styles.set_pen(GungNodeResizer, "disabled", QPen(QColor(40, 40, 40)))
+    styles.set_brush(GungNodeResizer, "default", QBrush(QColor(50, 50, 50)))
+    styles.set_brush(GungNodeResizer, "disabled", QBrush(QColor(50, 50, 50)))
+
+    styles.set_pen(GungNode, "disabled", QPen(QColor(40, 40, 40)))
+    styles.set_brush(GungNode, "dark", QBrush(Qt.darkGray))
+
+    styles.set_pen(GungPlug, "default", QPen(QColor(150, 255, 150).lighter()))
+    styles.set_brush(GungPlug, "default", QBrush(QColor(150, 255, 150)))
+    styles.set_brush(GungPlug, "highlighted", QBrush(QColor(150, 255, 150).lighter()))
+
+    styles.set_pen(GungEdge, "default", QPen(QColor(0, 0, 0)))
+
+    register_settings_styles(settings, styles)
+
+
+def register_settings_styles(settings, registry):
+    """
+    Registers the styles made of the colors from the settings in the registry. The scenes with their own settings
+    register them in their own registries (see GungScene.override_settings).
+
+        :param gung.config.GungSettings settings:
+        :param gung.gungstyle.GungStyleRegistry registry:
+    """
+    registry.set_pen(GungNode, "default", QPen(QColor(*settings.node.unselected_edge_color)))
+    registry.set_pen(GungNode, "selected", QPen(QColor(*settings.node.selected_edge_color)))
+    registry.set_pen(GungNode, "text", QPen(QColor(*settings.node.text_color)))
+    registry.set_brush(GungNode, "default", QBrush(QColor(*settings.node.node_color)))
+    registry.set_brush(GungNode, "selected", QBrush(QColor(*settings.node.selected_edge_color)))
+
+    registry.set_brush(GungGroup, "default", QBrush(QColor(*settings.group.group_background)))
+
+    registry.set_pen(GungEdge, "selected", QPen(QColor(*settings.node.selected_edge_color)))
+
+
+register_default_styles(get_settings())
+add_settings_listener(register_default_styles)
@@ -1,5 +1,7 @@
+import weakref
 import xml.dom.minidom as xmldom
-from xml.dom import Node
+from collections import OrderedDict
+from contextlib import contextmanager
 
 from .qt.qt_core import QPointF
 from .qt.qt_core import QRectF
@@ -8,6 +10,7 @@ from .qt.qt_core import Signal
 from .qt.qt_core import Slot
 from .qt.qt_gui import QColor
 from .qt.qt_gui import QMouseEvent
+from .qt.qt_gui import QPainterPath
 from .qt.qt_gui import QPen
 from .qt.qt_widgets import QGraphicsItem
 from .qt.qt_widgets import QGraphicsScene
@@ -19,15 +22,47 @@ from gungcommand import (GungCreateGroupCommand,
                          GungMoveCommand,
                          GungDeleteEdgeCommand)
 from gungcommand import GungResizeNodeCommand
-from gungnode import GungItem, GungPlug, GungNode, GungEdge, GungGroup, get_gung_node_classes
+from gungbinary import read_binary, read_binary_group
+from config import get_settings, add_settings_listener
+from gungserializer import get_serializer
+from gungmodel import GungModel, NodeRecord, EdgeRecord, as_xml_file, iter_xml_elements, open_xml_writer
+from gungnode import GungItem, GungPlug, GungNode, GungEdge, GungGroup, item_classes, get_pen_margin
+from gungnode import get_level_of_detail, register_settings_styles
+from gungspatial import GungSpatialIndex
+from gungstyle import GungStyleRegistry, styles
+
+def get_hit_rect(pos, tolerance):
+    """
+    Returns the square around the point that the shapes of the items hit by it intersect.
+
+        :param QPointF pos:
+        :param float tolerance: half of the side of the square
+        :rtype: QRectF
+    """
+    return QRectF(pos.x() - tolerance, pos.y() - tolerance, 2.0 * tolerance, 2.0 * tolerance)
+
+
+# --- live scenes, they are told about the reloaded settings (see GungScene.settings_changed)
+_scenes = weakref.WeakSet()
+# --- sections of the settings read by the views and the journals, which don't belong to a scene
+global_settings_sections = ("view", "journal")
 
 
 class GungScene(QGraphicsScene):
     draggingStarted = Signal(int)
+    # --- fraction (0.0 - 1.0) of the file read by load_xml so far
+    loadingProgress = Signal(float)
 
     def __init__(self, parent=None):
         QGraphicsScene.__init__(self, parent)
 
+        # --- settings of Gung with the overrides of this scene applied and the styles of the items made of them
+        # --- (see override_settings)
+        self._settings_overrides = {}
+        self.settings = get_settings()
+        self.styles = styles
+        _scenes.add(self)
+
         self.topZ = 0.0000
         self.topEdgeZ = 1.0000
         self.isDragging = False
@@ -40,26 +75,250 @@ class GungScene(QGraphicsScene):
         self.highlighted_plugs = []
         self.removedItems = []
 
-    def get_new_id(self):
+        # --- the content of the scene. Every GungItem is a view of a record of this model.
+        self.model = GungModel()
+        self.id_allocator = self.model.id_allocator
+
+        # --- id -> GungItem map, kept up to date by the items themselves (see GungItem.itemChange)
+        self._items_by_id = {}
+
+        # --- live registries of the most commonly iterated item types (id -> item, in order of registration),
+        # --- so that the whole-scene passes don't have to pull every item through self.items().
+        self._nodes = OrderedDict()
+        self._edges = OrderedDict()
+        self._plugs = OrderedDict()
+        self._groups = OrderedDict()
+
+        # --- state of the bulk_build() block
+        self._bulk_depth = 0
+        self._bulk_flushing = False
+        self._bulk_index_method = self.itemIndexMethod()
+        self._deferred_attributes = OrderedDict()
+        self._deferred_nodes = OrderedDict()
+        self._deferred_groups = OrderedDict()
+        self._deferred_moves = OrderedDict()
+        self._deferred_flags = []
+
+        # --- state of the viewport virtualization (see set_virtualized)
+        self.virtualized = False
+        self._node_index = GungSpatialIndex(self.settings.virtualization.cell_size)
+        self._edge_index = GungSpatialIndex(self.settings.virtualization.cell_size)
+        self._visible_rect = None
+        self._item_pool = {}
+        self._virtualizing = 0
+
+        # --- item that paints all the edges when they are batched (see set_batched_edges)
+        self.edge_layer = None
+
+        # --- groups loaded without their content (see load_binary), group id -> (BinaryGroup, source) and the ids
+        # --- of their plugs connected with the edges -> group id
+        self._unloaded_groups = {}
+        self._proxy_ids = {}
+
+    def clear(self):
+        """
+        Removes and destroys all the items of the scene together with the undo history that could bring them back.
+        The scene doesn't keep any references to the removed items afterwards, so they can be collected.
         """
-        Returns a first id number that's not yet used in the scene. You have to use it while creating a new scene item.
+        self.undoStack.clear()
+
+        self._items_by_id.clear()
+        for registry in (self._nodes, self._edges, self._plugs, self._groups):
+            registry.clear()
+        for deferred in (self._deferred_attributes, self._deferred_nodes, self._deferred_groups,
+                         self._deferred_moves):
+            deferred.clear()
+        self._deferred_flags = []
+        self.highlighted_plugs = []
+        self.isDragging = False
+        self.dragFrom = None
+        self._node_index.clear()
+        self._edge_index.clear()
+        self._item_pool = {}
+        self._unloaded_groups = {}
+        self._proxy_ids = {}
 
-            :rtype: int
+        QGraphicsScene.clear(self)
+
+        self.model = GungModel()
+        self.id_allocator = self.model.id_allocator
+        self.topZ = 0.0000
+        self.topEdgeZ = 1.0000
+        # --- the rubber edge and the edge layer have been destroyed together with the rest of the items.
+        self.draggingEdge = GungDragEdge()
+        self.addItem(self.draggingEdge)
+        if self.edge_layer is not None:
+            self.edge_layer = GungEdgeLayer(self.settings.edge_layer.cell_size)
+            self.addItem(self.edge_layer)
+
+    @contextmanager
+    def bulk_build(self):
         """
-        index = 0
-        current_ids = []
-        for item in self.items():
-            if not isinstance(item, GungItem):
-                continue
-            if 'node_id' not in item.properties.keys():
-                continue
+        Context manager to use while creating many items at once. Inside of the block the scene doesn't keep
+        its spatial index, plugs don't update their edges when they move and rearrange_attributes/rearrange_plugs
+        calls are only recorded. When the block exits the layout is done once per item that asked for it,
+        the edges are updated and the index is rebuilt. Moves done inside of the block are not put on the undo stack.
+
+            with scene.bulk_build():
+                for i in range(10000):
+                    node = GungNode("node%i" % i, None, scene)
+                    ...
+        """
+        self._bulk_depth += 1
+        if self._bulk_depth == 1:
+            self._bulk_index_method = self.itemIndexMethod()
+            self.setItemIndexMethod(QGraphicsScene.NoIndex)
+        try:
+            yield self
+        finally:
+            if self._bulk_depth == 1:
+                self._finish_bulk_build()
+            self._bulk_depth -= 1
+
+    def is_bulk_building(self):
+        """
+        Returns True inside of the bulk_build() block.
+
+            :rtype: bool
+        """
+        return self._bulk_depth > 0
+
+    def defer_layout(self, item):
+        """
+        Postpones the layout of a node, an attribute or a group until the end of the bulk build.
+        Returns False if the layout can't be postponed and the caller has to do it right away.
+
+            :param GungItem item:
+            :rtype: bool
+        """
+        if not self._bulk_depth:
+            return False
+        if isinstance(item, GungGroup):
+            # --- groups wait also for the layout done at the end of the bulk build.
+            deferred = self._deferred_groups
+        elif self._bulk_flushing:
+            return False
+        elif isinstance(item, GungNode):
+            deferred = self._deferred_nodes
+        else:
+            deferred = self._deferred_attributes
+        deferred.pop(item.properties['node_id'], None)
+        deferred[item.properties['node_id']] = item
+        return True
+
+    def defer_move(self, item):
+        """
+        Records the move of a node or a group done during the bulk build, so that the new position is stored
+        in its properties at the end of it instead of being put on the undo stack.
+        Returns False if the move has to be handled right away.
 
-            current_ids.append(item.properties['node_id'])
+            :param GungItem item:
+            :rtype: bool
+        """
+        if not self._bulk_depth:
+            return False
+        self._deferred_moves[item.properties['node_id']] = item
+        return True
+
+    def defer_item_flag(self, item, flag):
+        """
+        Postpones enabling of the item flag until the end of the bulk build.
+        Returns False if the flag has to be set right away.
 
-        while index in current_ids:
-            index += 1
+            :param QGraphicsItem item:
+            :param flag: QGraphicsItem.GraphicsItemFlag to enable.
+            :rtype: bool
+        """
+        if not self._bulk_depth:
+            return False
+        self._deferred_flags.append((item, flag))
+        return True
+
+    def _pop_deferred(self, deferred):
+        """
+        Empties the dictionary of postponed items and returns those of them that are still in the scene.
+
+            :param OrderedDict deferred:
+            :rtype: list of GungItem
+        """
+        result = [item for node_id, item in deferred.items() if self._items_by_id.get(node_id) is item]
+        deferred.clear()
+        return result
+
+    def _finish_bulk_build(self):
+        """
+        Does all the work postponed during the bulk build.
+        """
+        self._bulk_flushing = True
+        try:
+            for attribute in self._pop_deferred(self._deferred_attributes):
+                attribute.rearrange_plugs()
+            for node in self._pop_deferred(self._deferred_nodes):
+                node.rearrange_attributes()
 
-        return index
+            for group in self._pop_deferred(self._deferred_groups):
+                group.update_bounding_rect()
+
+            for item in self._pop_deferred(self._deferred_moves):
+                item_pos = item.pos()
+                item.properties['pos_x'] = float(item_pos.x())
+                item.properties['pos_y'] = float(item_pos.y())
+
+            for item, flag in self._deferred_flags:
+                item.setFlag(flag, True)
+            self._deferred_flags = []
+
+            for edge in self.get_edges():
+                edge.update_position()
+        finally:
+            self._bulk_flushing = False
+
+        self.setItemIndexMethod(self._bulk_index_method)
+
+    def override_settings(self, **overrides):
+        """
+        Replaces some of the settings of Gung in this scene only and tells the items about it. The overrides are kept
+        when the settings are reloaded. The colors are used through the style registry of the scene (see
+        GungItem.get_styles) and the levels of detail are read by the items as they paint. The cell sizes of the
+        spatial indices are read when the indices are built. The view and journal sections are not bound to a scene,
+        so they can't be overridden here.
+
+            scene.override_settings(node={"minimal_width": 150.0, "node_color": (255, 0, 0)},
+                                    level_of_detail={"text": 0.8})
+
+            :param overrides: section attribute name -> {option attribute name: value}
+        """
+        for name in overrides:
+            if name in global_settings_sections:
+                raise ValueError("Settings section can't be overridden in a scene: %s" % name)
+        for name, values in overrides.items():
+            self._settings_overrides.setdefault(name, {}).update(values)
+        self.settings_changed(get_settings())
+
+    def settings_changed(self, settings):
+        """
+        Applies the overrides of this scene to the new settings and passes them on to the items.
+
+            :param gung.config.GungSettings settings:
+        """
+        self.settings = settings.override(self._settings_overrides)
+        if self._settings_overrides:
+            self.styles = GungStyleRegistry(styles)
+            register_settings_styles(self.settings, self.styles)
+        else:
+            self.styles = styles
+        for item in self._items_by_id.values():
+            item.settings_changed()
+        self.draggingEdge.update_position()
+
+    def get_new_id(self):
+        """
+        Returns an id number that's not yet used in the scene. You have to use it while creating a new scene item.
+        If you're going to create many items at once use id_allocator.reserve() instead.
+
+            :rtype: int
+        """
+        return self.id_allocator.allocate()
 
     def get_item_by_id(self, id_):
         """
@@ -68,40 +327,292 @@ class GungScene(QGraphicsScene):
             :param int id_:
             :rtype: GungItem or GungNode or GungPlug or GungEdge
         """
+        return self._items_by_id.get(id_)
+
+    def get_edge_end(self, plug_id):
+        """
+        Returns the item that the edge connected to the plug with provided id should attach to. It's the plug itself
+        or the group containing it, if the content of the group hasn't been loaded yet (see load_binary).
+
+            :param int plug_id:
+            :rtype: GungPlug or GungGroup or None
+        """
+        item = self._items_by_id.get(plug_id)
+        if item is None and plug_id in self._proxy_ids:
+            return self._items_by_id.get(self._proxy_ids[plug_id])
+        return item
+
+    def register_item(self, item):
+        """
+        Adds the GungItem to the id index of this scene. GungItem calls it by itself whenever it enters the scene,
+        so there should be no need to call it manually.
+
+            :param GungItem item:
+        """
+        node_id = item.properties['node_id']
+        self._items_by_id[node_id] = item
+        self.reparent_item(item)
+
+        registry = self._get_type_registry(item)
+        if registry is not None:
+            registry[node_id] = item
+
+    def reparent_item(self, item):
+        """
+        Puts the record of the GungItem in the model under the record of its current parent item.
+        Adds the record to the model if it's not there yet.
+
+            :param GungItem item:
+        """
+        if self._virtualizing:
+            # --- the item is being bound to a record that is in the model already.
+            return
+        record = item.properties
+        parent = item.parentItem()
+        parent_id = parent.properties['node_id'] if isinstance(parent, GungItem) else -1
+        if self.model.get(record.node_id) is record:
+            if record.parent_id != parent_id:
+                self.model.set_parent(record.node_id, parent_id)
+        else:
+            record.parent_id = parent_id
+            self.model.add(record)
+
+        if self.virtualized and isinstance(record, NodeRecord):
+            if parent_id == -1:
+                self._index_node(item)
+            else:
+                self._unindex_node(record.node_id)
+
+    def unregister_item(self, item):
+        """
+        Removes the GungItem from the id index of this scene. GungItem calls it by itself whenever it leaves the scene.
+
+            :param GungItem item:
+        """
+        node_id = item.properties['node_id']
+        if self._items_by_id.get(node_id) is item:
+            del self._items_by_id[node_id]
+        if not self._virtualizing and self.model.get(node_id) is item.properties:
+            self.model.remove(node_id)
+            self._node_index.remove(node_id)
+            self._edge_index.remove(node_id)
+
+        registry = self._get_type_registry(item)
+        if registry is not None and registry.get(node_id) is item:
+            del registry[node_id]
+        if registry is self._edges and self.edge_layer is not None:
+            self.edge_layer.remove_edge(item)
+
+    def reindex_item(self, item, previous_id):
+        """
+        Moves the GungItem in the id index after its node_id has been changed (i.e. while loading from xml).
+
+            :param GungItem item:
+            :param int previous_id: id under which the item has been registered so far.
+        """
+        if self._items_by_id.get(previous_id) is item:
+            del self._items_by_id[previous_id]
+
+        registry = self._get_type_registry(item)
+        if registry is not None and registry.get(previous_id) is item:
+            del registry[previous_id]
+
+        self.model.reindex(item.properties, previous_id)
+        self.register_item(item)
+
+    def _get_type_registry(self, item):
+        """
+        Returns the registry that the provided item belongs to or None if its type is not tracked.
+
+            :param GungItem item:
+            :rtype: OrderedDict or None
+        """
+        if isinstance(item, GungNode):
+            return self._nodes
+        if isinstance(item, GungEdge):
+            return self._edges
+        if isinstance(item, GungPlug):
+            return self._plugs
+        if isinstance(item, GungGroup):
+            return self._groups
+        return None
+
+    def get_nodes(self):
+        """
+        Returns all the GungNodes of this scene (including the ones inside of groups) in order of their creation.
+
+            :rtype: list of GungNode
+        """
+        return self._nodes.values()
+
+    def get_edges(self):
+        """
+        Returns all the GungEdges of this scene in order of their creation.
+
+            :rtype: list of GungEdge
+        """
+        return self._edges.values()
+
+    def get_plugs(self):
+        """
+        Returns all the GungPlugs of this scene in order of their creation.
+
+            :rtype: list of GungPlug
+        """
+        return self._plugs.values()
+
+    def get_groups(self):
+        """
+        Returns all the GungGroups of this scene in order of their creation.
+
+            :rtype: list of GungGroup
+        """
+        return self._groups.values()
+
+    def get_selected_nodes(self):
+        """
+        Returns the selected GungNodes of this scene.
+
+            :rtype: list of GungNode
+        """
+        return [item for item in self.selectedItems() if isinstance(item, GungNode)]
+
+    def check_item_index(self):
+        """
+        Compares the id index with the actual content of the scene. Returns a list of found problems, so an empty
+        list means that the index is consistent. Meant to be used by the tests.
+
+            :rtype: list of str
+        """
+        errors = []
+        scene_items = {}
         for item in self.items():
             if not isinstance(item, GungItem):
                 continue
-            if item.properties['node_id'] == id_:
-                return item
-        return None
+            node_id = item.properties['node_id']
+            if node_id in scene_items:
+                errors.append("Id %s is used by more than one item." % node_id)
+            scene_items[node_id] = item
+            if self._items_by_id.get(node_id) is not item:
+                errors.append("Item %s with id %s is not indexed." % (item, node_id))
+            if self.model.get(node_id) is not item.properties:
+                errors.append("Record of item %s with id %s is not in the model." % (item, node_id))
+
+        for node_id, item in self._items_by_id.items():
+            if node_id not in scene_items:
+                errors.append("Indexed id %s does not belong to any item of the scene." % node_id)
+            elif item.properties['node_id'] != node_id:
+                errors.append("Item %s is indexed under a stale id %s." % (item, node_id))
+
+        for registry in (self._nodes, self._edges, self._plugs, self._groups):
+            for node_id, item in registry.items():
+                if self._items_by_id.get(node_id) is not item:
+                    errors.append("Registered item %s with id %s is not indexed." % (item, node_id))
+            for item in self._items_by_id.values():
+                if self._get_type_registry(item) is registry and registry.get(item.properties['node_id']) is not item:
+                    errors.append("Item %s is missing in its type registry." % item)
+        return errors
+
+    def add_connection(self, edge):
+        """
+        Registers the connection made by the edge in the model. Called by GungEdge.reconnect_edge.
+
+            :param GungEdge edge:
+        """
+        self.model.connect(edge.properties)
+        if self.virtualized:
+            self._index_edge(edge.properties)
+
+    def remove_connection(self, edge):
+        """
+        Removes the connection made by the edge from the model. Called by GungEdge.disconnect_edge.
+
+            :param GungEdge edge:
+        """
+        self.model.disconnect(edge.properties)
+        self._edge_index.remove(edge.properties['node_id'])
+
+    def has_connection(self, plug_a, plug_b):
+        """
+        Returns True if there's an edge between the provided plugs (no matter in which direction).
+
+            :param GungPlug plug_a:
+            :param GungPlug plug_b:
+            :rtype: bool
+        """
+        return self.model.has_connection(plug_a.properties['node_id'], plug_b.properties['node_id'])
+
+    def get_edge_between(self, from_id, to_id):
+        """
+        Returns the edge going from the plug with id from_id to the plug with id to_id or None if there's no such edge.
+
+            :param int from_id:
+            :param int to_id:
+            :rtype: GungEdge or None
+        """
+        edge_id = self.model.get_edge_between(from_id, to_id)
+        if edge_id is None:
+            return None
+        return self.get_item_by_id(edge_id)
+
+    def get_plug_edges(self, plug_id):
+        """
+        Returns the edges connected to the plug with the provided id in order of connecting them.
+
+            :param int plug_id:
+            :rtype: list of GungEdge
+        """
+        return [self._items_by_id[x] for x in self.model.get_plug_edge_ids(plug_id) if x in self._items_by_id]
 
     def as_xml(self):
         """
         Returns this scene as an xml document. It's a simple serialization, however your data model should support its
         own serialization.
         """
+        self.expand_groups()
+        if self.virtualized:
+            # --- most of the nodes have no items, so the model is serialized instead.
+            return self.model.as_xml()
+
         impl = xmldom.getDOMImplementation()
         doc = impl.createDocument(None, "GungGraph", None)
 
-        for node in self.items():
-
-            if isinstance(node, GungNode):
-                if not node.parentItem() is None:
-                    continue
+        for node in self.get_nodes():
+            if not node.parentItem() is None:
+                continue
 
-                xmlnode = node.as_xml(doc)
-                doc.documentElement.appendChild(xmlnode)
-                # sc = node.scene()  # I don't know why it's corrupted without it...
-                node.scene()
+            xmlnode = node.as_xml(doc)
+            doc.documentElement.appendChild(xmlnode)
+            # sc = node.scene()  # I don't know why it's corrupted without it...
+            node.scene()
 
-        for node in self.items():
-            if not isinstance(node, GungEdge):
-                continue
+        for node in self.get_edges():
             xmlnode = node.as_xml(doc)
 
             doc.documentElement.appendChild(xmlnode)
         return doc
 
+    def write_xml(self, target):
+        """
+        Writes this scene to the file in the same format as as_xml, but item by item, so the document is never held
+        in memory. The output is the same as the utf-8 encoded toxml of as_xml.
+
+            :param target: path or file object
+        """
+        self.expand_groups()
+        if self.virtualized:
+            self.model.write_xml(target)
+            return
+
+        with open_xml_writer(target) as writer:
+            with writer.document("GungGraph"):
+                for node in self.get_nodes():
+                    if node.parentItem() is None:
+                        node.write_xml(writer)
+
+                for edge in self.get_edges():
+                    edge.write_xml(writer)
+
     def from_xml(self, xml_string):
         """
         Parses XML string and fills the current scene with the nodes. The scene MUST be empty since
@@ -109,23 +620,515 @@ class GungScene(QGraphicsScene):
 
             :param str xml_string: string to parse (must be a valid xml).
         """
-        dom = xmldom.parseString(xml_string)
+        self.load_xml(as_xml_file(xml_string))
 
-        classes = get_gung_node_classes()
+    def load_xml(self, source, progress=None):
+        """
+        Reads the xml from the file and fills the current scene with the nodes. The file is parsed incrementally and
+        the items are created while it's read, so the whole document is never held in memory. The progress is
+        reported to the callback and by the loadingProgress signal. The scene MUST be empty since this method sets
+        the node id's that are loaded to the values stored in an xml.
 
-        for node in dom.documentElement.childNodes:
-            if not node.nodeType == Node.ELEMENT_NODE:
+            :param source: path or file object of the xml
+            :param progress: callable taking the fraction (0.0 - 1.0) of the file read so far
+        """
+        def report_progress(fraction):
+            if progress is not None:
+                progress(fraction)
+            self.loadingProgress.emit(fraction)
+
+        if self.virtualized:
+            self.model.load_xml(source, report_progress)
+            self._index_model()
+            return
+
+        # --- items of the open elements, None for the skipped ones
+        items = []
+        for event, element in iter_xml_elements(source, report_progress):
+            if event == "end":
+                item = items.pop()
+                if item is not None:
+                    item.finish_loading()
                 continue
-            if node.tagName not in classes.keys():
+
+            parent = items[-1] if items else None
+            if (items and parent is None) or element.tag not in item_classes:
+                # --- unknown element, it's skipped with all its children
+                items.append(None)
                 continue
-            gn = classes[node.tagName](parent=None, scene=self)
-            gn.from_xml(node)
+            item = item_classes[element.tag](parent=parent, scene=self)
+            item.load_properties(element.attrib)
+            items.append(item)
+
+        for i in self.get_edges():
+            i.reconnect_edge()
+
+        # --- the ids were taken from the file, so let the allocator fill the gaps between them.
+        self.id_allocator.seed(self.model.records.keys())
+
+    def save(self, target, serializer="xml"):
+        """
+        Writes this scene to the file with the serializer registered under the name (see gung.gungserializer).
+
+            :param target: path or file object
+            :param str serializer: i.e. "xml", "binary" or "json"
+        """
+        self.expand_groups()
+        get_serializer(serializer).write(self.model, target)
+
+    def load(self, source, serializer="xml"):
+        """
+        Fills the current scene with the content of the file read by the serializer registered under the name. The
+        scene MUST be empty since the ids stored in the file are kept.
+
+            :param source: path or file object
+            :param str serializer: i.e. "xml", "binary" or "json"
+        """
+        if self.virtualized:
+            get_serializer(serializer).read(self.model, source)
+            self._index_model()
+            return
+
+        model = GungModel()
+        get_serializer(serializer).read(model, source)
+        self.load_model(model)
+
+    def write_binary(self, target):
+        """
+        Writes this scene to the file in the compact binary format (see gung.gungbinary). It's much faster than
+        write_xml, but use the xml to exchange the graphs.
+
+            :param target: path or file object
+        """
+        self.save(target, "binary")
 
-        for i in self.items():
-            if not isinstance(i, GungEdge):
+    def load_binary(self, source, lazy_groups=False):
+        """
+        Fills the current scene with the content of the binary file written by write_binary. The scene MUST be empty
+        since the ids stored in the file are kept.
+
+        With lazy_groups only the frames of the top level groups are created, their content is loaded when they get
+        close to the visible rect (see update_viewport), when they're double clicked or by expand_group. Until then
+        the edges connected to the plugs inside of them end at the groups. The file must stay in place (or the
+        file object open) while there are unloaded groups. The virtualized scene loads everything.
+
+            :param source: path or file object
+            :param bool lazy_groups:
+        """
+        if not lazy_groups or self.virtualized:
+            self.load(source, "binary")
+            return
+
+        model = GungModel()
+        header = read_binary(model, source, lazy_groups=True)
+        for group in header.groups:
+            self._unloaded_groups[group.node_id] = (group, source)
+            for port_id in group.port_ids:
+                self._proxy_ids[port_id] = group.node_id
+        self.load_model(model)
+
+        for group, _ in self._unloaded_groups.values():
+            item = self._items_by_id.get(group.node_id)
+            if item is not None:
+                x1, y1, x2, y2 = group.bounds
+                item.set_unloaded_rect(QRectF(x1, y1, x2 - x1, y2 - y1).translated(-item.scenePos()))
+
+        # --- the ids inside of the unloaded groups are taken too.
+        used_ids = self.model.records.keys()
+        for group, _ in self._unloaded_groups.values():
+            used_ids.extend(group.node_ids)
+        self.id_allocator.seed(used_ids)
+
+    def expand_group(self, group_id):
+        """
+        Loads the content of the group left out by load_binary with lazy_groups and moves the edges ending at the group
+        to their plugs. Does nothing if the content is loaded already.
+
+            :param int group_id:
+        """
+        if group_id not in self._unloaded_groups:
+            return
+        group, source = self._unloaded_groups.pop(group_id)
+        for port_id in group.port_ids:
+            self._proxy_ids.pop(port_id, None)
+        item = self._items_by_id.get(group_id)
+        if item is None:
+            return
+
+        model = GungModel()
+        read_binary_group(model, source, group)
+        for record in model.get_children(group_id):
+            self._load_record(model, record, item)
+        item.update_bounding_rect()
+
+        for edge in list(item.edges):
+            item.edges.discard(edge)
+            edge.reconnect_edge()
+
+    def expand_groups(self):
+        """
+        Loads the content of all the groups left out by load_binary with lazy_groups.
+        """
+        for group_id in list(self._unloaded_groups):
+            self.expand_group(group_id)
+
+    def load_model(self, model):
+        """
+        Fills the current scene with the items made for the records of the provided model (i.e. built or loaded
+        without Qt). The scene MUST be empty since the ids of the records are kept.
+
+            :param gung.gungmodel.GungModel model:
+        """
+        if self.virtualized:
+            for record in model.iter_records():
+                copied = record.__class__(record.element_type, record.node_id, record.parent_id)
+                copied.update(record)
+                self.model.add(copied)
+            for record in self.model.iter_records(EdgeRecord):
+                self.model.connect(record)
+            self.id_allocator.seed(self.model.records.keys())
+            self._index_model()
+            return
+
+        for record in model.get_children():
+            if isinstance(record, EdgeRecord):
                 continue
+            self._load_record(model, record, None)
+
+        for record in model.iter_records(EdgeRecord):
+            self._load_record(model, record, None)
+
+        for i in self.get_edges():
             i.reconnect_edge()
 
+        self.id_allocator.seed(self.model.records.keys())
+
+    def _load_record(self, model, record, parent):
+        """
+        Creates the item for the record and its children.
+
+            :param GungModel model: model that the record comes from
+            :param gung.gungmodel.GungRecord record:
+            :param GungItem parent: parent item or None
+        """
+        if record.element_type not in item_classes:
+            return
+        item = item_classes[record.element_type](parent=parent, scene=self, node_id=record.node_id)
+        item.load_properties(record)
+        for child in model.get_children(record.node_id):
+            self._load_record(model, child, item)
+        item.finish_loading()
+
+    def set_virtualized(self, state):
+        """
+        Turns the viewport virtualization on or off. In the virtualized scene only the nodes near the visible rect
+        (see update_viewport) have their items, the other ones exist only as records of the model kept in a spatial
+        index. The items are recycled as the view moves. Selected nodes, groups and the nodes inside of them always
+        keep their items. Selection, undo and serialization work against the whole model.
+
+            :param bool state:
+        """
+        if state == self.virtualized:
+            return
+        self.virtualized = state
+        if state:
+            self._index_model()
+            return
+
+        # --- every record gets its item back.
+        for node_id in list(self._node_index):
+            if node_id not in self._items_by_id:
+                self._materialize_node(node_id)
+        self._node_index.clear()
+        self._edge_index.clear()
+        self._item_pool = {}
+
+    def update_viewport(self, rect=None):
+        """
+        Creates the items of the virtualized nodes that are close to the provided rectangle (or the one provided
+        the last time) and releases the items of the nodes that are further away. The edges that cross the rectangle
+        get their items together with the nodes at both of their ends. GungGraphicsView calls it whenever it moves.
+
+            :param QRectF rect: visible part of the scene.
+        """
+        if rect is not None:
+            self._visible_rect = (rect.x(), rect.y(), rect.width(), rect.height())
+        if self._visible_rect is None:
+            return
+
+        margin = self.settings.virtualization.margin
+        x, y, width, height = self._visible_rect
+        area = (x - margin, y - margin, width + 2 * margin, height + 2 * margin)
+
+        # --- the groups loaded without their content get it once they come close to the visible rect.
+        for group_id in list(self._unloaded_groups):
+            item = self._items_by_id.get(group_id)
+            if item is not None and item.sceneBoundingRect().intersects(QRectF(*area)):
+                self.expand_group(group_id)
+
+        if not self.virtualized:
+            return
+
+        # --- the nodes could have been moved by the user since the last update.
+        for node in self.get_nodes():
+            if node.parentItem() is None:
+                self._index_node(node)
+
+        wanted = self._node_index.query(area)
+        for edge_id in self._edge_index.query(area):
+            wanted.update(self._get_edge_node_ids(self.model.get(edge_id)))
+        for node in self.get_selected_nodes():
+            # --- the edges of the selected nodes have to exist, so that deleting the nodes removes them too.
+            for edge_id in self.model.get_node_edge_ids(node.properties['node_id']):
+                wanted.update(self._get_edge_node_ids(self.model.get(edge_id)))
+
+        for node in self.get_nodes():
+            node_id = node.properties['node_id']
+            if node_id in wanted or node_id not in self._node_index or node.isSelected():
+                continue
+            self._release_node(node)
+        for edge in self.get_edges():
+            if edge.item_from is None or edge.item_to is None or edge.item_from.scene() is not self \
+                    or edge.item_to.scene() is not self:
+                self._release_item(edge)
+
+        for node_id in wanted:
+            if node_id in self._node_index and node_id not in self._items_by_id:
+                self._materialize_node(node_id)
+
+    def materialize(self, node_id):
+        """
+        Returns the item with provided id. If the scene is virtualized and the record has no item, the item is created
+        (together with the whole node that it belongs to). Use it instead of get_item_by_id when the item is needed
+        no matter where it is (i.e. in the undo commands).
+
+            :param int node_id:
+            :rtype: GungItem or None
+        """
+        item = self._items_by_id.get(node_id)
+        if item is not None or not self.virtualized:
+            return item
+        record = self.model.get(node_id)
+        if record is None:
+            return None
+
+        if isinstance(record, EdgeRecord):
+            for top_level_id in self._get_edge_node_ids(record):
+                if top_level_id not in self._items_by_id:
+                    self._materialize_node(top_level_id)
+        else:
+            top_level_id = self.model.get_top_level_id(node_id)
+            if top_level_id not in self._items_by_id:
+                self._materialize_node(top_level_id)
+        return self._items_by_id.get(node_id)
+
+    def get_model_bounds(self):
+        """
+        Returns the rectangle that contains all the virtualized nodes or None if there are none.
+
+            :rtype: QRectF or None
+        """
+        bounds = self._node_index.bounds()
+        if bounds is None:
+            return None
+        return QRectF(*bounds)
+
+    def set_batched_edges(self, state):
+        """
+        Turns the batched painting of the edges on or off. When it's on, a single GungEdgeLayer paints all the edges
+        of the scene instead of every GungEdge painting itself, which saves the per item overhead of the big graphs.
+        The edges stay in the scene, but they have no contents and no bounds, so use get_edge_at_point to find them.
+        The layer paints the edges just like GungEdge.paint does, don't batch the edges that override it.
+
+            :param bool state:
+        """
+        if state == (self.edge_layer is not None):
+            return
+        if state:
+            self.edge_layer = GungEdgeLayer(self.settings.edge_layer.cell_size)
+            self.addItem(self.edge_layer)
+        else:
+            self.removeItem(self.edge_layer)
+            self.edge_layer = None
+
+        for edge in self.get_edges():
+            edge.set_batched(state)
+        # --- the pooled edges are bound to the records later on, they only need to know the mode.
+        for item_class, pool in self._item_pool.items():
+            if issubclass(item_class, GungEdge):
+                for edge in pool:
+                    edge.set_batched(state)
+
+    def _index_model(self):
+        """
+        Puts all the top level nodes and the edges of the model in the spatial index, creates the items of the
+        records that are never virtualized and updates the items against the last visible rect.
+        """
+        self._node_index.clear()
+        self._edge_index.clear()
+        for record in self.model.get_children():
+            if isinstance(record, EdgeRecord):
+                continue
+            item = self._items_by_id.get(record.node_id)
+            if isinstance(record, NodeRecord):
+                self._index_node(item or record)
+            elif item is None:
+                self._materialize_node(record.node_id)
+        for record in self.model.iter_records(EdgeRecord):
+            self._index_edge(record)
+        self.update_viewport()
+
+    def _index_node(self, node):
+        """
+        Puts the top level node in the spatial index (updating the edges connected to it if it has moved).
+
+            :param node: GungNode or NodeRecord
+        """
+        if isinstance(node, GungNode):
+            pos = node.pos()
+            record = node.properties
+            rect = (pos.x(), pos.y(), record.node_width, record.node_height)
+        else:
+            record = node
+            rect = (record.pos_x, record.pos_y, record.node_width, record.node_height)
+        if self._node_index.insert(record.node_id, rect):
+            for edge_id in self.model.get_node_edge_ids(record.node_id):
+                self._index_edge(self.model.get(edge_id))
+
+    def _unindex_node(self, node_id):
+        """
+        Removes the node from the spatial index (i.e. when it's been put into a group).
+
+            :param int node_id:
+        """
+        if node_id not in self._node_index:
+            return
+        self._node_index.remove(node_id)
+        for edge_id in self.model.get_node_edge_ids(node_id):
+            self._index_edge(self.model.get(edge_id))
+
+    def _index_edge(self, record):
+        """
+        Puts the edge in the spatial index with a rectangle that contains the virtualized nodes at its ends. The edges
+        between the nodes that are never virtualized are not indexed.
+
+            :param EdgeRecord record:
+        """
+        rects = [self._node_index.get_rect(x) for x in self._get_edge_node_ids(record)]
+        rects = [x for x in rects if x is not None]
+        if not rects:
+            self._edge_index.remove(record.node_id)
+            return
+        left = min(r[0] for r in rects)
+        top = min(r[1] for r in rects)
+        right = max(r[0] + r[2] for r in rects)
+        bottom = max(r[1] + r[3] for r in rects)
+        self._edge_index.insert(record.node_id, (left, top, right - left, bottom - top))
+
+    def _get_edge_node_ids(self, record):
+        """
+        Returns the ids of the top level records at both ends of the edge.
+
+            :param EdgeRecord record:
+            :rtype: tuple of int
+        """
+        return self.model.get_top_level_id(record.item_from_id), self.model.get_top_level_id(record.item_to_id)
+
+    def _materialize_node(self, node_id):
+        """
+        Creates the items of the top level record and its children, then the items of its edges that have items at
+        their other ends.
+
+            :param int node_id:
+        """
+        self._materialize_record(self.model.get(node_id), None)
+        for edge_id in self.model.get_node_edge_ids(node_id):
+            if edge_id in self._items_by_id:
+                continue
+            record = self.model.get(edge_id)
+            if record.item_from_id in self._items_by_id and record.item_to_id in self._items_by_id:
+                edge = self._materialize_record(record, None)
+                if edge is not None:
+                    edge.reconnect_edge()
+
+    def _materialize_record(self, record, parent):
+        """
+        Binds an item taken from the pool (or a new one) to the record and does the same for its children.
+
+            :param gung.gungmodel.GungRecord record:
+            :param GungItem parent: parent item or None
+            :rtype: GungItem or None
+        """
+        item_class = item_classes.get(record.element_type)
+        if item_class is None:
+            return None
+
+        self._virtualizing += 1
+        try:
+            pool = self._item_pool.get(item_class)
+            if pool:
+                item = pool.pop()
+                item.bind_record(record)
+                if parent is None:
+                    self.addItem(item)
+                else:
+                    item.setParentItem(parent)
+            else:
+                item = item_class(parent=parent, scene=self, node_id=record.node_id)
+                item.bind_record(record)
+        finally:
+            self._virtualizing -= 1
+
+        for child in self.model.get_children(record.node_id):
+            self._materialize_record(child, item)
+        item.finish_loading()
+        return item
+
+    def _release_node(self, node):
+        """
+        Removes the items of the node and its edges from the scene and puts them in the pool. Their records stay
+        in the model.
+
+            :param GungNode node:
+        """
+        for edge in node.get_all_edges():
+            self._release_item(edge)
+        self._release_item(node)
+
+    def _release_item(self, item):
+        """
+        Removes the item from the scene without touching its record and puts it (and its children) in the pool.
+
+            :param GungItem item:
+        """
+        if isinstance(item, GungEdge):
+            if item.item_from is not None:
+                item.item_from.edges.discard(item)
+            if item.item_to is not None:
+                item.item_to.edges.discard(item)
+
+        self._virtualizing += 1
+        try:
+            self.removeItem(item)
+        finally:
+            self._virtualizing -= 1
+        self._pool_item(item)
+
+    def _pool_item(self, item):
+        """
+        Detaches the GungItem children of the item and keeps all of them for reuse.
+
+            :param GungItem item:
+        """
+        for child in item.childItems():
+            if isinstance(child, GungItem):
+                child.setParentItem(None)
+                self._pool_item(child)
+
+        pool = self._item_pool.setdefault(item.__class__, [])
+        if len(pool) < self.settings.virtualization.pool_size:
+            pool.append(item)
+
     def init_dragging_edge(self, drag_start, drag_end):
         """
         Starts the rubber edge dragging and sets the start position of a dragged edge.
@@ -135,8 +1138,7 @@ class GungScene(QGraphicsScene):
             :return:
         """
         self.isDragging = True
-        self.draggingEdge.post_start = drag_start
-        self.draggingEdge.pos_end = drag_start
+        self.draggingEdge.set_ends(drag_start, drag_start)
         self.dragFrom = drag_end
         self.draggingEdge.setFlag(QGraphicsItem.ItemHasNoContents, False)
         self.draggingEdge.update()
@@ -206,9 +1208,7 @@ class GungScene(QGraphicsScene):
         """
 
         nodes_that_have_moved = []
-        for item in self.items():
-            if not isinstance(item, (GungNode, GungGroup)):
-                continue
+        for item in self.get_nodes() + self.get_groups():
             p = item.pos()
             if p.x() != item.properties['pos_x'] or p.y() != item.properties['pos_y']:
                 nodes_that_have_moved.append(item)
@@ -272,6 +1272,28 @@ class GungScene(QGraphicsScene):
 
         return hit_item
 
+    def get_edge_at_point(self, pos, tolerance=0.0):
+        """
+        Returns the topmost GungEdge whose shape is closer to the point than the tolerance or None. Works with
+        the batched edges too. The edges are thin, so pass a tolerance of a few pixels of the view to click them
+        (see GungGraphicsView.get_edge_at).
+
+            :param QPointF pos:
+            :param float tolerance: in scene units
+            :rtype: GungEdge or None
+        """
+        if self.edge_layer is not None:
+            return self.edge_layer.edge_at(pos, tolerance)
+
+        if tolerance:
+            hits = self.items(get_hit_rect(pos, tolerance), Qt.IntersectsItemShape, Qt.DescendingOrder)
+        else:
+            hits = self.items(pos)
+        for hi in hits:
+            if isinstance(hi, GungEdge):
+                return hi
+        return None
+
     def dragging_ended(self, pos):
         # --- it the scene is not in "dragging" state then it means that
         # --- no action is necessary here
@@ -300,16 +1322,8 @@ class GungScene(QGraphicsScene):
             return
 
         # --- check it maybe there is already a connection between those plugs
-        for edge in self.dragFrom.edges:
-            if edge is None:
-                continue
-            if hit_item in [edge.item_from, edge.item_to]:
-                return
-        for edge in hit_item.edges:
-            if edge is None:
-                continue
-            if self.dragFrom in [edge.item_from, edge.item_to]:
-                return
+        if self.has_connection(self.dragFrom, hit_item):
+            return
 
         # --- finally create an edge
         self.create_edge_call(self.dragFrom, hit_item)
@@ -321,12 +1335,14 @@ class GungScene(QGraphicsScene):
                 :param edge_id: id of an edge to delete.
                 :type edge_id: int
         """
-        created_edge = self.get_item_by_id(edge_id)
+        created_edge = self.materialize(edge_id)
         if created_edge is None:
             return
         created_edge.disconnect_edge()
         created_edge.prepareGeometryChange()
         self.removeItem(created_edge)
+        # --- edges are never re-added to the scene (undo creates a new one), so the id can be reused.
+        self.id_allocator.release(edge_id)
 
     def update_dragging_edge(self, pos):
         """
@@ -334,16 +1350,14 @@ class GungScene(QGraphicsScene):
 
             :param pos:
         """
-        self.draggingEdge.pos_end = pos
-        self.draggingEdge.update_position()
+        self.draggingEdge.set_ends(self.draggingEdge.post_start, pos)
 
     def hide_dragging_edge(self):
         """
         Hides the rubber edge from the user.
         """
         self.isDragging = False
-        self.draggingEdge.post_start = None
-        self.draggingEdge.pos_end = None
+        self.draggingEdge.set_ends(None, None)
         self.draggingEdge.setFlag(QGraphicsItem.ItemHasNoContents, True)
         self.draggingEdge.update()
         self.update()
@@ -362,11 +1376,12 @@ class GungScene(QGraphicsScene):
 
     @Slot()
     def delete_called(self):
-        sel = self.selectedItems()
-        nodes = []
-        for item in sel:
-            if isinstance(item, GungNode):
-                nodes.append(item)
+        # --- the edges of the selected nodes need their items before the nodes can be deleted.
+        self.update_viewport()
+        for item in self.selectedItems():
+            if isinstance(item, GungGroup):
+                self.expand_group(item.properties['node_id'])
+        nodes = self.get_selected_nodes()
         if len(nodes):
             command = GungDeleteItemsCommand(self, nodes)
             self.undoStack.push(command)
@@ -381,11 +1396,7 @@ class GungScene(QGraphicsScene):
 
     @Slot()
     def create_group_called(self):
-        sel = self.selectedItems()
-        nodes = []
-        for item in sel:
-            if isinstance(item, GungNode):
-                nodes.append(item)
+        nodes = self.get_selected_nodes()
         if len(nodes):
             command = GungCreateGroupCommand(self, [node.properties['node_id'] for node in nodes])
             self.undoStack.push(command)
@@ -429,17 +1440,17 @@ class GungDragEdge(QGraphicsItem):
     def __init__(self):
         QGraphicsItem.__init__(self)
 
-        self.edge_pen = QPen(QColor(0, 0, 0))
         self.setZValue(2.000)
 
         self.post_start = None
         self.pos_end = None
+        self.bounding_rect = QRectF()
 
     def paint(self, painter, option, widget=None):
         if not self.scene().isDragging:
             return
 
-        painter.setPen(self.edge_pen)
+        painter.setPen(styles.get_pen(self.__class__))
 
         if self.post_start is None or self.pos_end is None:
             return
@@ -448,30 +1459,147 @@ class GungDragEdge(QGraphicsItem):
 
         painter.drawLine(self.post_start - current_pos, self.pos_end - current_pos)
 
-    def update_position(self):
+    def set_ends(self, pos_start, pos_end):
+        """
+        Sets the scene positions of both ends of the rubber edge (None hides it) and updates its geometry.
+
+            :param QPointF pos_start:
+            :param QPointF pos_end:
+        """
+        self.prepareGeometryChange()
+        self.post_start = pos_start
+        self.pos_end = pos_end
         if self.post_start is None or self.pos_end is None:
+            self.bounding_rect = QRectF()
             return
 
         top_left_x = min(self.post_start.x(), self.pos_end.x())
         top_left_y = min(self.post_start.y(), self.pos_end.y())
 
+        bottom_right_x = max(self.post_start.x(), self.pos_end.x())
+        bottom_right_y = max(self.post_start.y(), self.pos_end.y())
+
         self.setPos(QPointF(top_left_x, top_left_y))
+        margin = get_pen_margin(styles.get_pen(self.__class__))
+        self.bounding_rect = QRectF(0, 0, bottom_right_x - top_left_x,
+                                    bottom_right_y - top_left_y).adjusted(-margin, -margin, margin, margin)
         self.update()
 
+    def update_position(self):
+        self.set_ends(self.post_start, self.pos_end)
+
     def boundingRect(self, *args, **kwargs):
-        if not self.scene().isDragging:
-            return QRectF()
+        return self.bounding_rect
 
-        if self.post_start is None or self.pos_end is None:
-            return QRectF()
+    def mouseReleaseEvent(self, *args, **kwargs):
+        return QGraphicsItem.mouseReleaseEvent(self, *args, **kwargs)
 
-        top_left_x = min(self.post_start.x(), self.pos_end.x())
-        top_left_y = min(self.post_start.y(), self.pos_end.y())
 
-        bottom_right_x = max(self.post_start.x(), self.pos_end.x())
-        bottom_right_y = max(self.post_start.y(), self.pos_end.y())
+class GungEdgeLayer(QGraphicsItem):
+    """
+    Graphics item that paints all the edges of the scene when they are batched (see GungScene.set_batched_edges).
+    The edges are kept in a spatial grid, so that only the ones crossing the exposed area are painted, and the ones
+    that share a pen are painted as a single path. The layer itself can't be hit, use edge_at to find the edges.
+    """
+
+    def __init__(self, cell_size=1000.0):
+        QGraphicsItem.__init__(self)
+        self.setZValue(1.000)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
 
-        return QRectF(0, 0, bottom_right_x - top_left_x, bottom_right_y - top_left_y)
+        self.bounding_rect = QRectF()
+        # --- GungEdge -> its bounding rect, the edges are the keys, so their ids can change.
+        self._index = GungSpatialIndex(cell_size)
 
-    def mouseReleaseEvent(self, *args, **kwargs):
-        return QGraphicsItem.mouseReleaseEvent(self, *args, **kwargs)
+    def update_edge(self, edge):
+        """
+        Adds the edge to the layer or updates it after it's been moved. GungEdge calls it by itself.
+
+            :param GungEdge edge:
+        """
+        rect = edge.bounding_rect
+        previous = self._index.get_rect(edge)
+        self._index.insert(edge, (rect.x(), rect.y(), rect.width(), rect.height()))
+        if not self.bounding_rect.contains(rect):
+            # --- the bounds only grow, it's cheaper to paint some empty space than to find the new ones.
+            self.prepareGeometryChange()
+            self.bounding_rect = self.bounding_rect.united(rect)
+        if previous is not None:
+            self.update(QRectF(*previous))
+        self.update(rect)
+
+    def remove_edge(self, edge):
+        """
+        Removes the edge from the layer (if it's there).
+
+            :param GungEdge edge:
+        """
+        previous = self._index.get_rect(edge)
+        if previous is None:
+            return
+        self._index.remove(edge)
+        self.update(QRectF(*previous))
+
+    def get_edges(self, rect):
+        """
+        Returns the connected edges whose bounding rects intersect the rectangle.
+
+            :param QRectF rect: rectangle in scene coordinates
+            :rtype: list of GungEdge
+        """
+        edges = self._index.query((rect.x(), rect.y(), rect.width(), rect.height()))
+        return [x for x in edges if x.item_from is not None and x.item_to is not None]
+
+    def edge_at(self, pos, tolerance=0.0):
+        """
+        Returns the topmost edge whose shape is closer to the point than the tolerance or None.
+
+            :param QPointF pos: point in scene coordinates
+            :param float tolerance: in scene units
+            :rtype: GungEdge or None
+        """
+        if tolerance:
+            rect = get_hit_rect(pos, tolerance)
+            hits = [x for x in self.get_edges(rect) if x.shape_path.intersects(rect)]
+        else:
+            hits = [x for x in self.get_edges(QRectF(pos, pos)) if x.shape_path.contains(pos)]
+        if not hits:
+            return None
+        return max(hits, key=lambda x: x.zValue())
+
+    def paint(self, painter, option, widget=None):
+        curves = get_level_of_detail(painter) >= self.scene().settings.level_of_detail.curves
+        batches = OrderedDict()
+        for edge in self.get_edges(option.exposedRect):
+            pen = edge.get_pen("selected" if edge.isSelected() else "default")
+            # --- the pens are shared by all the edges of a class (see gung.gungstyle), so there are just a few.
+            batch = batches.get(id(pen))
+            if batch is None:
+                batch = batches[id(pen)] = (pen, QPainterPath())
+            if curves:
+                batch[1].addPath(edge.path)
+            else:
+                batch[1].moveTo(edge.from_pos)
+                batch[1].lineTo(edge.to_pos)
+
+        painter.setBrush(Qt.NoBrush)
+        for pen, path in batches.values():
+            painter.setPen(pen)
+            painter.drawPath(path)
+
+    def boundingRect(self, *args, **kwargs):
+        return self.bounding_rect
+
+    def shape(self):
+        return QPainterPath()
+
+
+styles.set_pen(GungDragEdge, "default", QPen(QColor(0, 0, 0)))
+
+
+def _settings_reloaded(settings):
+    for scene in list(_scenes):
+        scene.settings_changed(settings)
+
+
+add_settings_listener(_settings_reloaded)
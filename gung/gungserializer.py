@@ -0,0 +1,186 @@
+"""
+Serializers of the GUNG graphs. Every backend writes and reads a GungModel, the scenes use them through
+GungScene.save and GungScene.load, i.e. scene.save(path, "json"). Register your own backends with
+register_serializer.
+"""
+import json
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+
+from gungbinary import read_binary, write_binary
+from gungmodel import GungRecord, EdgeRecord, record_classes
+
+
+class GungSerializer(object):
+    """
+    Base class of the serializer backends. The targets and sources are paths or file objects. The backends implement
+    both write and read, the ones missing any of them can't be instantiated.
+    """
+    __metaclass__ = ABCMeta
+    name = None
+
+    @abstractmethod
+    def write(self, model, target):
+        """
+        Writes the model to the file.
+
+            :param gung.gungmodel.GungModel model:
+            :param target: path or file object
+        """
+
+    @abstractmethod
+    def read(self, model, source):
+        """
+        Adds the content of the file to the model. The ids stored in the file are kept, so the model SHOULD be empty.
+
+            :param gung.gungmodel.GungModel model:
+            :param source: path or file object
+        """
+
+
+class GungXmlSerializer(GungSerializer):
+    """
+    The xml written by GungScene.as_xml, it's the interchange format of Gung.
+    """
+    name = "xml"
+
+    def write(self, model, target):
+        model.write_xml(target)
+
+    def read(self, model, source):
+        model.load_xml(source)
+
+
+class GungBinarySerializer(GungSerializer):
+    """
+    The compact binary format (see gung.gungbinary).
+    """
+    name = "binary"
+
+    def write(self, model, target):
+        write_binary(model, target)
+
+    def read(self, model, source):
+        read_binary(model, source)
+
+
+class GungJsonSerializer(GungSerializer):
+    """
+    Json document keeping the types of the values, so nothing is parsed from the strings while reading. The fields of
+    every element type are listed once in the schemas of the document and every record is a row of values in that
+    order: [element type, parent id, extra properties or null, field values...].
+    """
+    name = "json"
+    version = 1
+
+    def write(self, model, target):
+        schemas = {}
+        rows = []
+        for record in model.iter_records():
+            if record.element_type not in schemas:
+                schemas[record.element_type] = record.fields
+            rows.append(record_to_row(record))
+
+        document = json.dumps({"version": self.version, "schemas": schemas, "records": rows}, separators=(",", ":"))
+        json_file = open(target, "wb") if isinstance(target, basestring) else target
+        try:
+            json_file.write(document)
+        finally:
+            if json_file is not target:
+                json_file.close()
+
+    def read(self, model, source):
+        json_file = open(source, "rb") if isinstance(source, basestring) else source
+        try:
+            document = json.load(json_file)
+        finally:
+            if json_file is not source:
+                json_file.close()
+        if document.get("version", 0) > self.version:
+            raise ValueError("Version %s of the json Gung graph is not supported (the latest one is %i)."
+                             % (document["version"], self.version))
+
+        # --- element type -> (record class, fields of the rows, whether the fields are the ones of the class)
+        layouts = {}
+        for element_type, fields in document["schemas"].items():
+            record_class = record_classes.get(element_type, GungRecord)
+            fields = tuple(str(x) for x in fields)
+            layouts[element_type] = (record_class, fields, fields == record_class.fields)
+
+        add = model.add
+        for row in document["records"]:
+            add(_record_from_row(row, *layouts[row[0]]))
+
+        for record in model.iter_records(EdgeRecord):
+            model.connect(record)
+        model.id_allocator.seed(model.records.keys())
+
+
+def record_to_row(record):
+    """
+    Returns the record as a row of the json documents: [element type, parent id, extra properties or null,
+    values of the fields...].
+
+        :param gung.gungmodel.GungRecord record:
+        :rtype: list
+    """
+    row = [record.element_type, record.parent_id, record.extra or None]
+    row.extend([getattr(record, x) for x in record.fields])
+    return row
+
+
+def record_from_row(row):
+    """
+    Returns the record made of the row written by record_to_row.
+
+        :param list row:
+        :rtype: gung.gungmodel.GungRecord
+    """
+    record_class = record_classes.get(row[0], GungRecord)
+    return _record_from_row(row, record_class, record_class.fields, True)
+
+
+def _record_from_row(row, record_class, fields, exact):
+    record = record_class(str(row[0]), -1, row[1])
+    if exact:
+        for field, value in zip(fields, row[3:]):
+            setattr(record, field, value)
+    else:
+        # --- written for another version of the record class, so the unknown fields become extras
+        for field, value in zip(fields, row[3:]):
+            record[field] = value
+    if row[2]:
+        for key, value in row[2].items():
+            record[str(key)] = value
+    return record
+
+
+# --- name -> serializer, in order of registering them
+serializers = OrderedDict()
+
+
+def register_serializer(serializer):
+    """
+    Makes the serializer available to GungScene.save and GungScene.load under its name.
+
+        :param GungSerializer serializer:
+    """
+    if not isinstance(serializer, GungSerializer) or not serializer.name:
+        raise ValueError("Serializer %r is not a named GungSerializer." % serializer)
+    serializers[serializer.name] = serializer
+
+
+def get_serializer(name):
+    """
+    Returns the serializer registered under the name.
+
+        :param str name:
+        :rtype: GungSerializer
+    """
+    if name not in serializers:
+        raise ValueError("Unknown serializer: %s" % name)
+    return serializers[name]
+
+
+for _serializer in (GungXmlSerializer(), GungBinarySerializer(), GungJsonSerializer()):
+    register_serializer(_serializer)
@@ -0,0 +1,143 @@
+import math
+
+
+class GungSpatialIndex(object):
+    """
+    Uniform grid used to find the rectangles that intersect a given area without testing all of them. Rectangles
+    are (x, y, width, height) tuples, keys can be anything hashable (i.e. ids of the records of a GungModel).
+    Rectangles that would cover too many cells (i.e. edges between distant nodes) are kept aside and tested one by one.
+    """
+    max_cells = 64
+
+    def __init__(self, cell_size=1000.0):
+        self.cell_size = float(cell_size)
+        self._rects = {}
+        self._cells = {}
+        self._oversized = set()
+
+    def __len__(self):
+        return len(self._rects)
+
+    def __contains__(self, key):
+        return key in self._rects
+
+    def __iter__(self):
+        return iter(self._rects)
+
+    def _get_cell_range(self, rect):
+        x, y, width, height = rect
+        return (int(math.floor(x / self.cell_size)),
+                int(math.floor(y / self.cell_size)),
+                int(math.floor((x + width) / self.cell_size)),
+                int(math.floor((y + height) / self.cell_size)))
+
+    def insert(self, key, rect):
+        """
+        Adds the key to the index or moves it if it's already there. Returns False if the key has been indexed with
+        the same rectangle already.
+
+            :param key:
+            :param tuple rect: (x, y, width, height)
+            :rtype: bool
+        """
+        rect = tuple(float(x) for x in rect)
+        previous = self._rects.get(key)
+        if previous == rect:
+            return False
+        if previous is not None:
+            self.remove(key)
+
+        self._rects[key] = rect
+        x0, y0, x1, y1 = self._get_cell_range(rect)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > self.max_cells:
+            self._oversized.add(key)
+            return True
+
+        for cell_x in xrange(x0, x1 + 1):
+            for cell_y in xrange(y0, y1 + 1):
+                cell = self._cells.get((cell_x, cell_y))
+                if cell is None:
+                    cell = self._cells[(cell_x, cell_y)] = set()
+                cell.add(key)
+        return True
+
+    def remove(self, key):
+        """
+        Removes the key from the index (if it's there).
+
+            :param key:
+        """
+        rect = self._rects.pop(key, None)
+        if rect is None:
+            return
+        if key in self._oversized:
+            self._oversized.discard(key)
+            return
+
+        x0, y0, x1, y1 = self._get_cell_range(rect)
+        for cell_x in xrange(x0, x1 + 1):
+            for cell_y in xrange(y0, y1 + 1):
+                cell = self._cells.get((cell_x, cell_y))
+                if cell is None:
+                    continue
+                cell.discard(key)
+                if not cell:
+                    del self._cells[(cell_x, cell_y)]
+
+    def get_rect(self, key):
+        """
+        Returns the rectangle that the key has been indexed with or None.
+
+            :param key:
+            :rtype: tuple or None
+        """
+        return self._rects.get(key)
+
+    def query(self, rect):
+        """
+        Returns the keys whose rectangles intersect the provided one.
+
+            :param tuple rect: (x, y, width, height)
+            :rtype: set
+        """
+        x0, y0, x1, y1 = self._get_cell_range(rect)
+        candidates = set(self._oversized)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self._cells):
+            # --- the area covers more cells than there are in use, so it's faster to go through the used ones.
+            for (cell_x, cell_y), cell in self._cells.iteritems():
+                if x0 <= cell_x <= x1 and y0 <= cell_y <= y1:
+                    candidates.update(cell)
+        else:
+            for cell_x in xrange(x0, x1 + 1):
+                for cell_y in xrange(y0, y1 + 1):
+                    cell = self._cells.get((cell_x, cell_y))
+                    if cell is not None:
+                        candidates.update(cell)
+
+        x, y, width, height = rect
+        result = set()
+        for key in candidates:
+            key_x, key_y, key_width, key_height = self._rects[key]
+            if key_x <= x + width and x <= key_x + key_width and key_y <= y + height and y <= key_y + key_height:
+                result.add(key)
+        return result
+
+    def bounds(self):
+        """
+        Returns the rectangle that contains all the indexed rectangles or None if the index is empty.
+
+            :rtype: tuple or None
+        """
+        if not self._rects:
+            return None
+        rects = self._rects.values()
+        left = min(r[0] for r in rects)
+        top = min(r[1] for r in rects)
+        right = max(r[0] + r[2] for r in rects)
+        bottom = max(r[1] + r[3] for r in rects)
+        return left, top, right - left, bottom - top
+
+    def clear(self):
+        self._rects.clear()
+        self._cells.clear()
+        self._oversized.clear()
@@ -0,0 +1,103 @@
+class GungStyleRegistry(object):
+    """
+    Pens and brushes shared by all the Gung items, so that every item doesn't create its own copies of them.
+    A style is registered for an item class and a state (i.e. "selected") and is used by the subclasses too,
+    unless they register their own. The returned objects are shared, so don't modify them, register new ones instead.
+
+    A registry can be derived from a base one (i.e. the one of a scene with its own settings is derived from styles),
+    then its styles take precedence over the ones of the base registry registered for the same class and the rest
+    is taken from the base registry.
+    """
+
+    def __init__(self, base=None):
+        self.base = base
+        self._pens = {}
+        self._brushes = {}
+        # --- (item class, state) -> style found for it, so that the class hierarchy is searched only once.
+        self._pen_cache = {}
+        self._brush_cache = {}
+        # --- incremented whenever the styles change, so that the derived registries know to drop their caches
+        self.generation = 0
+        self._base_generation = None if base is None else base.generation
+
+    def set_pen(self, item_class, state, pen):
+        """
+        Registers the pen used by the items of the class (and its subclasses) in the provided state.
+
+            :param type item_class:
+            :param str state:
+            :param QPen pen:
+        """
+        self._pens[(item_class, state)] = pen
+        self._changed()
+
+    def set_brush(self, item_class, state, brush):
+        """
+        Registers the brush used by the items of the class (and its subclasses) in the provided state.
+
+            :param type item_class:
+            :param str state:
+            :param QBrush brush:
+        """
+        self._brushes[(item_class, state)] = brush
+        self._changed()
+
+    def get_pen(self, item_class, state="default"):
+        """
+        Returns the pen registered for the class or the closest of its base classes.
+
+            :param type item_class:
+            :param str state:
+            :rtype: QPen
+        """
+        if self.base is not None and self.base.generation != self._base_generation:
+            self._changed()
+        try:
+            return self._pen_cache[(item_class, state)]
+        except KeyError:
+            pen = self._pen_cache[(item_class, state)] = self._find("_pens", item_class, state)
+            return pen
+
+    def get_brush(self, item_class, state="default"):
+        """
+        Returns the brush registered for the class or the closest of its base classes.
+
+            :param type item_class:
+            :param str state:
+            :rtype: QBrush
+        """
+        if self.base is not None and self.base.generation != self._base_generation:
+            self._changed()
+        try:
+            return self._brush_cache[(item_class, state)]
+        except KeyError:
+            brush = self._brush_cache[(item_class, state)] = self._find("_brushes", item_class, state)
+            return brush
+
+    def _find(self, attribute, item_class, state):
+        for base in item_class.__mro__:
+            registry = self
+            while registry is not None:
+                style = getattr(registry, attribute).get((base, state))
+                if style is not None:
+                    return style
+                registry = registry.base
+        raise KeyError("There's no %s style registered for %s." % (state, item_class.__name__))
+
+    def _changed(self):
+        self._pen_cache.clear()
+        self._brush_cache.clear()
+        self.generation += 1
+        if self.base is not None:
+            self._base_generation = self.base.generation
+
+    def clear(self):
+        """
+        Forgets all the registered styles.
+        """
+        self._pens.clear()
+        self._brushes.clear()
+        self._changed()
+
+
+styles = GungStyleRegistry()
@@ -7,17 +7,20 @@ from .qt.qt_core import Signal
 
 from .qt.qt_gui import QTransform
 from .qt.qt_gui import QFont
+from .qt.qt_gui import QFontMetrics
 from .qt.qt_gui import QBrush
 from .qt.qt_gui import QColor
 from .qt.qt_gui import QMouseEvent
+from .qt.qt_gui import QPainter
 from .qt.qt_gui import QPen
-from .qt.qt_gui import QImage
+from .qt.qt_gui import QPixmap
 
 from .qt.qt_widgets import QGraphicsItem
 from .qt.qt_widgets import QGraphicsView
 from .qt.qt_widgets import QRubberBand
 
-from gungnode import GungNode, GungItem
+from config import get_settings
+from gungnode import GungNode
 from gungscene import GungScene
 
 QString = str  # <- this is to keep the compatibility between PySide and PyQt
@@ -33,12 +36,21 @@ class GungGraphicsView(QGraphicsView):
     deleteSignal = Signal()
     groupSignal = Signal()
 
+    # --- names of the viewport update modes that can be set in the [View] section of the config.
+    update_modes = {"Full": QGraphicsView.FullViewportUpdate,
+                    "Minimal": QGraphicsView.MinimalViewportUpdate,
+                    "Smart": QGraphicsView.SmartViewportUpdate,
+                    "BoundingRect": QGraphicsView.BoundingRectViewportUpdate,
+                    "No": QGraphicsView.NoViewportUpdate}
+    # --- distance in pixels from an edge within which a click still hits it, the edges are just a pixel wide.
+    edge_hit_tolerance = 4.0
+
     def __init__(self, parent=None):
         QGraphicsView.__init__(self, parent)
         self.prev_mouse_pos = None
         self.setSceneRect(-64000, -64000, 128000, 128000)
         self.setTransformationAnchor(QGraphicsView.NoAnchor)
-        self.setViewportUpdateMode(QGraphicsView.FullViewportUpdate)
+        self.set_update_mode(get_settings().view.update_mode)
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.current_scale = 1
@@ -50,6 +62,15 @@ class GungGraphicsView(QGraphicsView):
         self.font = QFont("Impact", 18)
         self.name_font = QFont("Impact", 8)
 
+        # --- the background is drawn from the cached pixmaps: the overlay is kept until the view is resized and
+        # --- the tile of the grid until the zoom changes the size of its cells in pixels (see drawBackground)
+        view_settings = get_settings().view
+        self.grid_visible = view_settings.grid
+        self.grid_pen = QPen(QColor(*view_settings.grid_color))
+        self._overlay = None
+        self._grid_tile = None
+        self._grid_tile_key = None
+
         self.zoom_start = QPoint()
         self.zoom_start_transform = QTransform()
 
@@ -124,6 +145,7 @@ class GungGraphicsView(QGraphicsView):
                 x = (current_mouse_pos - self.prev_mouse_pos).x()
                 y = (current_mouse_pos - self.prev_mouse_pos).y()
                 self.translate(x / self.current_scale, y / self.current_scale)
+                self.update_visible_rect()
             self.prev_mouse_pos = event.globalPos()
         elif event.buttons() == Qt.RightButton:  # Zoom viewport
             if event.pos().x() > self.zoom_start.x():
@@ -164,10 +186,23 @@ class GungGraphicsView(QGraphicsView):
                     select = False
                 else:
                     self.extend_selection = False
-                self.select_items_in_rubber_band(self.rubber_band.geometry(), self.extend_selection, select)
+                rect = self.rubber_band.geometry()
+                edge = None
+                if rect.width() <= 1 and rect.height() <= 1 and isinstance(self.scene(), GungScene):
+                    # --- a click, the edge under it is picked by its shape (the batched ones through the edge layer).
+                    edge = self.get_edge_at(event.pos())
+                if edge is not None:
+                    if not self.extend_selection:
+                        self.scene().clearSelection()
+                    edge.setSelected(select)
+                else:
+                    self.select_items_in_rubber_band(rect, self.extend_selection, select)
             else:
                 # --- selection through click is handled here
                 item = self.itemAt(event.pos())
+                if item is None and isinstance(self.scene(), GungScene):
+                    # --- the batched edges can only be found through the scene.
+                    item = self.get_edge_at(event.pos())
                 if item is not None:
                     if not self.remove_selection:
                         item.setSelected(True)
@@ -176,6 +211,17 @@ class GungGraphicsView(QGraphicsView):
         self.rubber_band.hide()
         QGraphicsView.mouseReleaseEvent(self, event)
 
+    def get_edge_at(self, pos):
+        """
+        Returns the topmost edge of the GungScene closer to the point of the viewport than edge_hit_tolerance pixels
+        (at any zoom) or None.
+
+            :param QPoint pos:
+            :rtype: gung.gungnode.GungEdge or None
+        """
+        tolerance = self.edge_hit_tolerance / self.transform().m11()
+        return self.scene().get_edge_at_point(self.mapToScene(pos), tolerance)
+
     def select_items_in_rubber_band(self, rect, append=True, select=True):
         """
         Iterates all the items that collides with selection rubber band and selects them if they are selectable.
@@ -191,6 +237,8 @@ class GungGraphicsView(QGraphicsView):
         scene_bottom_right = self.mapToScene(rect.bottomRight())
         items = self.scene().items(QRectF(scene_top_left, scene_bottom_right),
                                    Qt.IntersectsItemBoundingRect)
+        if isinstance(self.scene(), GungScene) and self.scene().edge_layer is not None:
+            items = list(items) + self.scene().edge_layer.get_edges(QRectF(scene_top_left, scene_bottom_right))
         for item in items:
             if (item.flags() & QGraphicsItem.ItemIsSelectable) == QGraphicsItem.ItemIsSelectable:
                 item.setSelected(select)
@@ -235,6 +283,7 @@ class GungGraphicsView(QGraphicsView):
         # set the final transform and keep the current scale in a variable
         self.setTransform(scaled_transform)
         self.get_current_scale()
+        self.update_visible_rect()
 
     def get_current_scale(self):
         """
@@ -304,7 +353,9 @@ class GungGraphicsView(QGraphicsView):
             self.scale(scale_value, scale_value)
 
         self.get_current_scale()
-        return QGraphicsView.resizeEvent(self, event)
+        result = QGraphicsView.resizeEvent(self, event)
+        self.update_visible_rect()
+        return result
 
     def setBaseSize(self):
         """
@@ -349,6 +400,7 @@ class GungGraphicsView(QGraphicsView):
 
         # Set the final transform
         self.setTransform(scaled * fit_center_matrix.inverted()[0] * to_screen_center_transform)
+        self.update_visible_rect()
 
     def zoom_to_selected(self):
         """
@@ -372,12 +424,21 @@ class GungGraphicsView(QGraphicsView):
         """
         Tries to fit the viewport so that all the items of the scene are visible.
         """
+        if isinstance(self.scene(), GungScene) and self.scene().virtualized:
+            # --- most of the nodes have no items in the virtualized scene.
+            zoom_rect = self.scene().get_model_bounds() or QRectF()
+            for item in self.scene().get_groups():
+                zoom_rect = zoom_rect.united(item.sceneBoundingRect())
+            if not zoom_rect.isNull():
+                self.fitInView(zoom_rect, Qt.KeepAspectRatio)
+                self.get_current_scale()
+            return
+
         all_nodes = self.get_nodes()
         if len(all_nodes) > 0:
-            zoom_rect = all_nodes[0].boundingRect().translated(all_nodes[0].x(), all_nodes[0].y())
+            zoom_rect = all_nodes[0].sceneBoundingRect()
             for item in all_nodes[1:]:
-                item_rect = item.boundingRect()
-                zoom_rect = zoom_rect.united(item_rect.translated(item.x(), item.y()))
+                zoom_rect = zoom_rect.united(item.sceneBoundingRect())
             self.fitInView(zoom_rect, Qt.KeepAspectRatio)
             self.get_current_scale()
         else:
@@ -385,18 +446,22 @@ class GungGraphicsView(QGraphicsView):
 
     def get_nodes(self):
         """
-        Gathers all gung items from the current scene
+        Gathers all gung nodes and groups from the current scene
 
             :return: nodes
             :rtype: list of gung.gungnode.GungItem
         """
-        scene_items = self.scene().items()
-        nodes = []
-        for item in scene_items:
-            if not isinstance(item, GungItem):
-                continue
-            nodes.append(item)
-        return nodes
+        return self.scene().get_nodes() + self.scene().get_groups()
+
+    def update_visible_rect(self):
+        """
+        Tells the GungScene which part of it is visible, so that it can create the items near it (when it's virtualized
+        or has groups loaded without their content).
+        """
+        scene = self.scene()
+        if not isinstance(scene, GungScene):
+            return
+        scene.update_viewport(self.mapToScene(self.viewport().rect()).boundingRect())
 
     def keyPressEvent(self, event):
         """
@@ -421,33 +486,146 @@ class GungGraphicsView(QGraphicsView):
         else:
             return QGraphicsView.keyPressEvent(self, event)
 
+    def set_update_mode(self, mode_name):
+        """
+        Sets how the viewport is repainted when the items change. All the Gung items report their exact bounds, so
+        "Smart" and "BoundingRect" repaint only the changed parts of the viewport. "Full" repaints everything.
+
+            :param str mode_name: one of the keys of update_modes
+        """
+        if mode_name not in self.update_modes:
+            raise ValueError("Unknown viewport update mode: %s" % mode_name)
+        self.setViewportUpdateMode(self.update_modes[mode_name])
+
+    def scrollContentsBy(self, dx, dy):
+        # --- the scrolled pixels are reused, but they carry the parts of the overlay fixed to the viewport with them,
+        # --- so only those (where they were moved to and where they belong) are repainted.
+        QGraphicsView.scrollContentsBy(self, dx, dy)
+        viewport = self.viewport()
+        for rect in self.get_overlay_rects():
+            viewport.update(rect)
+            viewport.update(rect.translated(dx, dy))
+
+    def get_overlay_rects(self):
+        """
+        Returns the parts of the viewport covered by the overlay fixed to it (the cross and the version text).
+
+            :rtype: list of QRect
+        """
+        size = self.viewport().size()
+        width = size.width()
+        height = size.height()
+        text_rect = QFontMetrics(self.font).boundingRect(QString(versionString))
+        return [QRect(width / 2 - 1, 0, 3, height),
+                QRect(0, height / 2 - 1, width, 3),
+                text_rect.translated(2, height - 6).adjusted(-2, -2, 2, 2)]
+
     def drawBackground(self, painter, rect):
         """
         Called whenever the background re-paint is required. Override this in your child classes to have a custom graph
-        look.
+        look. The grid and the parts fixed to the viewport are drawn from the cached pixmaps, so panning the view just
+        blits them.
             :param qt_gui.QPainter painter:
             :param qt_core.QRect rect:
         """
-        painter.setFont(self.font)
+        QGraphicsView.drawBackground(self, painter, rect)
+
+        if self.grid_visible:
+            tile = self._get_grid_tile(self.get_grid_spacing() * self.transform().m11())
+            # --- the tile repeats in the device space from the position of the scene origin.
+            origin = self.viewportTransform().map(QPointF())
+            painter.save()
+            painter.setWorldMatrixEnabled(False)
+            painter.drawTiledPixmap(QRectF(self.viewport().rect()), tile,
+                                    QPointF(-origin.x() % tile.width(), -origin.y() % tile.height()))
+            painter.restore()
+
         painter.setPen(self.text_pen)
-        painter.setBrush(self.text_brush)
         painter.drawLine(0, 0, 100, 0)
         painter.drawLine(0, 0, 0, 100)
+
+        painter.save()
         painter.setWorldMatrixEnabled(False)
+        painter.drawPixmap(0, 0, self._get_overlay())
+        painter.restore()
 
-        image = QImage()
+    def set_grid_visible(self, state):
+        """
+        Shows or hides the grid drawn in the background.
 
-        w = image.size().width()
-        h = image.size().height()
-        r = QRect(1, self.height() - h - 5, w, h)
-        painter.drawImage(r, image)
+            :param bool state:
+        """
+        self.grid_visible = state
+        self.viewport().update()
 
-        painter.drawLine(self.width() / 2, 0, self.width() / 2, self.height())
-        painter.drawLine(0, self.height() / 2, self.width(), self.height() / 2)
+    def get_grid_spacing(self):
+        """
+        Returns the distance between the grid lines in the scene units. It doubles as the view zooms out, so that
+        the lines are never closer to each other than GridMinimalSpacing pixels.
 
-        painter.drawText(w + 2, self.height() - 6, QString(versionString))
+            :rtype: float
+        """
+        view_settings = get_settings().view
+        scale = self.transform().m11()
+        spacing = view_settings.grid_spacing
+        while 0 < spacing * scale < view_settings.grid_minimal_spacing:
+            spacing *= 2.0
+        return spacing
 
-        return QGraphicsView.drawBackground(self, painter, rect)
+    def invalidate_background(self):
+        """
+        Drops the cached pixmaps of the background. Call it after changing the pens or the font of the view.
+        """
+        self._overlay = None
+        self._grid_tile = None
+        self.viewport().update()
+
+    def _get_overlay(self):
+        """
+        Returns the pixmap with the parts of the background that are fixed to the viewport (the cross and the version).
+
+            :rtype: QPixmap
+        """
+        size = self.viewport().size()
+        if self._overlay is not None and self._overlay.size() == size:
+            return self._overlay
+
+        self._overlay = QPixmap(size)
+        self._overlay.fill(Qt.transparent)
+        width = size.width()
+        height = size.height()
+        painter = QPainter(self._overlay)
+        painter.setFont(self.font)
+        painter.setPen(self.text_pen)
+        painter.setBrush(self.text_brush)
+        painter.drawLine(width / 2, 0, width / 2, height)
+        painter.drawLine(0, height / 2, width, height / 2)
+        painter.drawText(2, height - 6, QString(versionString))
+        painter.end()
+        return self._overlay
+
+    def _get_grid_tile(self, cell):
+        """
+        Returns the pixmap with two cells of the grid that is tiled over the viewport. The cell is quantized to half
+        a pixel, so that the tile is a whole number of pixels big, and the tile is reused until that changes.
+
+            :param float cell: distance between the grid lines in pixels.
+            :rtype: QPixmap
+        """
+        size = max(2, int(round(cell * 2.0)))
+        if self._grid_tile is not None and self._grid_tile_key == size:
+            return self._grid_tile
+
+        self._grid_tile = QPixmap(size, size)
+        self._grid_tile.fill(Qt.transparent)
+        self._grid_tile_key = size
+        painter = QPainter(self._grid_tile)
+        painter.setPen(self.grid_pen)
+        for position in (0.0, size / 2.0):
+            painter.drawLine(QPointF(position, 0), QPointF(position, size))
+            painter.drawLine(QPointF(0, position), QPointF(size, position))
+        painter.end()
+        return self._grid_tile
 
     def setScene(self, scene):
         """
@@ -462,4 +640,6 @@ class GungGraphicsView(QGraphicsView):
             self.redoSignal.connect(scene.redo_called)
             self.deleteSignal.connect(scene.delete_called)
             self.groupSignal.connect(scene.create_group_called)
-        return QGraphicsView.setScene(self, scene)
+        result = QGraphicsView.setScene(self, scene)
+        self.update_visible_rect()
+        return result
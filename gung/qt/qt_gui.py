@@ -79,6 +79,7 @@ try:
                               QShowEvent,
                               QStandardItem,
                               QStandardItemModel,
+                              QStaticText,
                               QStatusTipEvent,
                               QStringListModel,
                               QSyntaxHighlighter,
@@ -202,6 +203,7 @@ except ImportError:
                                QShowEvent,
                                QStandardItem,
                                QStandardItemModel,
+                               QStaticText,
                                QStatusTipEvent,
                                QStringListModel,
                                QSyntaxHighlighter,
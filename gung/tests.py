@@ -1,4 +1,10 @@
+import ConfigParser
+import gc
+import os
+import shutil
+import tempfile
 import unittest
+from cStringIO import StringIO
 # try:
 #     from PySide.QtGui import QWidget
 #     from PySide.QtGui import QVBoxLayout
@@ -7,14 +13,52 @@ import unittest
 #     from PySide2.QtWidgets import QApplication
 #     from PySide2.QtWidgets import QWidget
 #     from PySide2.QtWidgets import QVBoxLayout
+from .qt.qt_core import QEvent
+from .qt.qt_core import QPoint
+from .qt.qt_core import QPointF
+from .qt.qt_core import QRectF
+from .qt.qt_core import Qt
+from .qt.qt_gui import QBrush
+from .qt.qt_gui import QColor
+from .qt.qt_gui import QFont
+from .qt.qt_gui import QImage
+from .qt.qt_gui import QMouseEvent
+from .qt.qt_gui import QPainter
 from .qt.qt_widgets import QApplication
+from .qt.qt_widgets import QGraphicsItem
+from .qt.qt_widgets import QGraphicsScene
 from .qt.qt_widgets import QVBoxLayout
 from .qt.qt_widgets import QWidget
 
 
+from gung.config import config_path, get_settings, reload_settings
+from gung.gungcommand import GungDeleteItemsCommand, GungMoveCommand
+from gung.gungjournal import GungJournal
 from gung.gungview import GungGraphicsView
 from gung.gungscene import GungScene
-from gung.gungnode import GungNode, GungPlug, GungAttribute
+from gung.gungnode import GungItem, GungNode, GungPlug, GungAttribute, GungInPlug, GungOutPlug, GungGroup
+from gung.gungnode import item_classes, register_item_class
+from gung.gungbinary import read_binary, read_binary_group, write_binary
+from gung.gungmodel import GungModel, NodeRecord, AttributeRecord, EdgeRecord, get_record_schema
+from gung.gungserializer import GungSerializer, get_serializer, register_serializer, serializers
+from gung.gungspatial import GungSpatialIndex
+from gung.gungstyle import styles
+
+
+class CustomRecord(NodeRecord):
+    __slots__ = ("color",)
+    fields = NodeRecord.fields + __slots__
+    field_types = NodeRecord.field_types + (basestring,)
+
+    def __init__(self, element_type="CustomNode", node_id=-1, parent_id=-1):
+        NodeRecord.__init__(self, element_type, node_id, parent_id)
+        self.color = "red"
+
+
+@register_item_class
+class CustomNode(GungNode):
+    element_type = "CustomNode"
+    record_class = CustomRecord
 
 
 class TestSequenceFunctions(unittest.TestCase):
@@ -52,6 +96,8 @@ class TestSequenceFunctions(unittest.TestCase):
                 gungnodes.append(i)
                 
         self.assert_(len(gungnodes) == 10, "Wrong number of created nodes!")
+        self.assert_(set(scene.get_nodes()) == set(gungnodes), "Node registry doesn't match the scene!")
+        self.assert_(len(scene.get_plugs()) == 30, "Wrong number of registered plugs!")
         
     def test_save_load_xml(self):
         """
@@ -77,16 +123,869 @@ class TestSequenceFunctions(unittest.TestCase):
         scene_b.from_xml(scenexml.toxml())
         self.assert_(scene_b.as_xml().toxml() == scenexml.toxml(), "Scene serialization failed!")
 
+        xml_file = StringIO()
+        scene.write_xml(xml_file)
+        self.assert_(xml_file.getvalue() == scenexml.toxml().encode("utf-8"), "Streamed xml differs from as_xml!")
+        xml_file.seek(0)
+        scene_c = GungScene(self.view)
+        scene_c.load_xml(xml_file)
+        self.assert_(scene_c.as_xml().toxml() == scenexml.toxml(), "Streamed scene serialization failed!")
+
+    def test_load_xml(self):
+        """
+        Checks if the scene is loaded from the xml file object and if the progress is signalled.
+        """
+        scene = GungScene(self.view)
+        node = GungNode("test", None, scene)
+        GungPlug(GungAttribute(node, scene), scene)
+        GungGroup(None, scene)
+        xml_string = scene.as_xml().toxml()
+
+        progress = []
+        scene_b = GungScene(self.view)
+        scene_b.loadingProgress.connect(progress.append)
+        scene_b.load_xml(StringIO(xml_string.encode("utf-8")))
+        self.assert_(scene_b.as_xml().toxml() == xml_string, "Scene has not been loaded from the file!")
+        self.assert_(progress and progress[-1] == 1.0, "Progress has not been signalled!")
+
+    def test_load_properties(self):
+        """
+        Checks if the properties of every type are the same after saving and loading the scene.
+        """
+        scene = GungScene(self.view)
+        node = GungNode(u"n\xf3de", None, scene)
+        node.setX(1 / 3.0)
+        attribute = GungAttribute(node, scene)
+        attribute.set_inverted(True)
+        GungAttribute(node, scene).set_inverted(False)
+
+        scene_b = GungScene(self.view)
+        scene_b.from_xml(scene.as_xml().toxml())
+        for item in scene.items():
+            if not isinstance(item, GungItem):
+                continue
+            item_b = scene_b.get_item_by_id(item.properties['node_id'])
+            for field in item.properties.fields:
+                value, value_b = item.properties[field], item_b.properties[field]
+                self.assert_(value == value_b and type(value) is type(value_b),
+                             "Property %s has not been loaded!" % field)
+        self.assert_(scene_b.get_item_by_id(attribute.properties['node_id']).properties['inverted'] is True,
+                     "Bool property has not been loaded!")
+
+    def test_item_classes(self):
+        """
+        Checks if the item classes registered outside of gung.gungnode are loaded by every deserializer.
+        """
+        scene = GungScene(self.view)
+        node = CustomNode("custom", None, scene)
+        node.properties['color'] = "blue"
+        GungPlug(GungAttribute(node, scene), scene)
+        GungNode("regular", None, scene)
+        xml_string = scene.as_xml().toxml()
+
+        scene_b = GungScene(self.view)
+        scene_b.from_xml(xml_string)
+        node_b = scene_b.get_item_by_id(node.properties['node_id'])
+        self.assert_(isinstance(node_b, CustomNode), "Registered item class has not been loaded!")
+        self.assert_(node_b.properties['color'] == "blue", "Property of the registered class has not been loaded!")
+
+        model = GungModel()
+        model.from_xml(xml_string)
+        self.assert_(isinstance(model.get(node.properties['node_id']), CustomRecord),
+                     "Record class of the registered item class has not been used!")
+        for name in serializers:
+            model_file = StringIO()
+            scene.save(model_file, name)
+            model_file.seek(0)
+            scene_c = GungScene(self.view)
+            scene_c.load(model_file, name)
+            self.assert_(isinstance(scene_c.get_item_by_id(node.properties['node_id']), CustomNode),
+                         "%s hasn't loaded the registered item class!" % name)
+
+        self.assert_(item_classes["GungInPlug"] is GungInPlug, "Built-in item class is not registered!")
+        self.assertRaises(ValueError, register_item_class, type("Unregistered", (CustomNode,), {}))
+
     def test_get_node_by_id(self):
         scene = GungScene(self.view)
         node = GungNode("test%i", None, scene)
         self.assert_(scene.get_item_by_id(0) == node, "Failed to get the node by Id")
         node_b = GungNode("test%i", None, scene)
         self.assert_(scene.get_item_by_id(1) == node_b, "Failed to get the second node by Id")
-    
+
+    def test_item_index(self):
+        """
+        Checks if the id index of the scene follows adding, removing and loading of the items.
+        """
+        scene = GungScene(self.view)
+        node = GungNode("test", None, scene)
+        a = GungAttribute(node, scene)
+        plug = GungPlug(a, scene)
+        self.assert_(scene.get_item_by_id(plug.properties['node_id']) == plug, "Failed to get the plug by Id")
+        self.assert_(not scene.check_item_index(), "Index is inconsistent after creation!")
+
+        scene.removeItem(node)
+        self.assert_(scene.get_item_by_id(plug.properties['node_id']) is None, "Removed plug is still indexed!")
+        self.assert_(not scene.check_item_index(), "Index is inconsistent after removal!")
+
+        scene.addItem(node)
+        self.assert_(scene.get_item_by_id(plug.properties['node_id']) == plug, "Re-added plug is not indexed!")
+
+        node.set_node_id(100)
+        self.assert_(scene.get_item_by_id(100) == node, "Failed to get the node by changed Id")
+        self.assert_(not scene.check_item_index(), "Index is inconsistent after changing the id!")
+
+        scene_b = GungScene(self.view)
+        scene_b.from_xml(scene.as_xml().toxml())
+        self.assert_(not scene_b.check_item_index(), "Index is inconsistent after loading!")
+        self.assert_(isinstance(scene_b.get_item_by_id(100), GungNode), "Loaded node is not indexed!")
+
+    def test_id_allocator(self):
+        """
+        Checks if the ids handed out by the scene are unique, also when they're reserved in bulk.
+        """
+        scene = GungScene(self.view)
+        ids = scene.id_allocator.reserve(10)
+        nodes = [GungNode("test%i" % i, None, scene, node_id=node_id) for i, node_id in enumerate(ids)]
+        other = GungNode("other", None, scene)
+        self.assert_(other.properties['node_id'] not in ids, "Reserved id has been handed out again!")
+        self.assert_(scene.get_item_by_id(ids[5]) == nodes[5], "Failed to get the node by reserved Id")
+        self.assert_(not scene.check_item_index(), "Index is inconsistent after bulk creation!")
+
+    def test_bulk_build(self):
+        """
+        Checks if the scene built inside of bulk_build() looks the same as the one built item by item.
+        """
+        def build(scene):
+            upstream_plug = None
+            for i in range(5):
+                node = GungNode("test%i" % i, None, scene)
+                node.setX(i * 150)
+                for j in range(4):
+                    a = GungAttribute(node, scene)
+                    if j % 2:
+                        GungOutPlug(a, scene)
+                    else:
+                        plug = GungInPlug(a, scene)
+                        if upstream_plug is not None:
+                            scene.create_edge_call(upstream_plug, plug)
+                    a.rearrange_plugs()
+                node.rearrange_attributes()
+                upstream_plug = node.get_all_plugs()[-1]
+
+        scene = GungScene(self.view)
+        build(scene)
+
+        scene_b = GungScene(self.view)
+        with scene_b.bulk_build():
+            build(scene_b)
+            self.assert_(scene_b.itemIndexMethod() == QGraphicsScene.NoIndex, "Index is used inside of bulk build!")
+
+        self.assert_(scene_b.itemIndexMethod() == scene.itemIndexMethod(), "Index method has not been restored!")
+        self.assert_(not scene_b.nodesHaveMoved, "Bulk build has been registered as a move!")
+        self.assert_([p.scenePos() for p in scene.get_plugs()] == [p.scenePos() for p in scene_b.get_plugs()],
+                     "Plugs are placed differently after the bulk build!")
+        self.assert_([e.boundingRect() for e in scene.get_edges()] == [e.boundingRect() for e in scene_b.get_edges()],
+                     "Edges are placed differently after the bulk build!")
+
+    def test_edge_connections(self):
+        """
+        Checks if the scene keeps track of the connections made by the edges.
+        """
+        scene = GungScene(self.view)
+        node = GungNode("source", None, scene)
+        out_plug = GungOutPlug(GungAttribute(node, scene), scene)
+        in_plugs = []
+        for i in range(20):
+            target = GungNode("target%i" % i, None, scene)
+            in_plugs.append(GungInPlug(GungAttribute(target, scene), scene))
+            scene.create_edge_call(out_plug, in_plugs[-1])
+
+        self.assert_(len(out_plug.edges) == 20, "Wrong number of edges of the plug!")
+        self.assert_(scene.has_connection(in_plugs[5], out_plug), "Connection has not been registered!")
+        self.assert_(len(scene.get_plug_edges(out_plug.properties['node_id'])) == 20, "Wrong adjacency of the plug!")
+
+        edge = scene.get_edge_between(out_plug.properties['node_id'], in_plugs[5].properties['node_id'])
+        scene.delete_edge_call(edge.properties['node_id'])
+        self.assert_(not scene.has_connection(out_plug, in_plugs[5]), "Deleted connection is still registered!")
+        self.assert_(len(out_plug.edges) == 19 and not in_plugs[5].edges, "Deleted edge is still held by the plugs!")
+
+        scene.undo_called()
+        self.assert_(scene.has_connection(out_plug, in_plugs[5]), "Connection has not been restored by undo!")
+        self.assert_(list(out_plug.edges)[-1].item_to is in_plugs[5], "Restored edge is not the last one!")
+
+    def test_items_are_released(self):
+        """
+        Checks that the scene doesn't keep the items alive after they have been deleted or the scene has been cleared.
+        """
+        def count_gung_items():
+            gc.collect()
+            return len([x for x in gc.get_objects() if isinstance(x, GungItem)])
+
+        baseline = count_gung_items()
+
+        scene = GungScene(self.view)
+        node_count = 25000
+        for _ in range(node_count):
+            node = GungNode("test", None, scene)
+            a = GungAttribute(node, scene)
+            GungPlug(a, scene)
+        # --- 3 GungItems per node: the node, the attribute and the plug (the resizer of the node isn't a GungItem)
+        self.assert_(count_gung_items() == baseline + node_count * 3, "Wrong number of the created items!")
+
+        # --- deleting one node releases its 3 GungItems
+        scene.clearSelection()
+        scene.get_nodes()[0].setSelected(True)
+        scene.delete_called()
+        scene.undoStack.clear()
+        del node, a
+        self.assert_(count_gung_items() == baseline + (node_count - 1) * 3,
+                     "Deleted items are still alive after the undo history has been cleared!")
+
+        scene.clear()
+        self.assert_(count_gung_items() == baseline, "Items are still alive after the scene has been cleared!")
+
+    def test_scene_model(self):
+        """
+        Checks if the scene keeps its model in sync and if a headless model can be loaded into the scene.
+        """
+        scene = GungScene(self.view)
+        node = GungNode("test", None, scene)
+        plug = GungOutPlug(GungAttribute(node, scene), scene)
+        self.assert_(scene.model.get(plug.properties['node_id']) is plug.properties, "Plug record is not in the model!")
+        self.assert_(scene.model.get_children() == [node.properties], "Wrong top level records of the model!")
+
+        model = GungModel()
+        from_plug = model.add_plug(model.add_attribute(model.add_node("a").node_id).node_id, "GungOutPlug")
+        to_plug = model.add_plug(model.add_attribute(model.add_node("b", 150.0).node_id).node_id, "GungInPlug")
+        model.add_edge(from_plug.node_id, to_plug.node_id)
+
+        scene_b = GungScene(self.view)
+        scene_b.load_model(model)
+        self.assert_(not scene_b.check_item_index(), "Index is inconsistent after loading the model!")
+        self.assert_(scene_b.has_connection(scene_b.get_item_by_id(from_plug.node_id),
+                                            scene_b.get_item_by_id(to_plug.node_id)), "Edge has not been connected!")
+        self.assert_([n.properties['name'] for n in scene_b.get_nodes()] == ["a", "b"], "Nodes have not been loaded!")
+
+    def test_virtualization(self):
+        """
+        Checks if the virtualized scene creates the items only near the visible rect and keeps the whole model.
+        """
+        model = GungModel()
+        upstream_plug = None
+        for i in range(100):
+            node = model.add_node("test%i" % i, (i % 10) * 1000.0, (i / 10) * 1000.0)
+            in_plug = model.add_plug(model.add_attribute(node.node_id).node_id, "GungInPlug")
+            out_plug = model.add_plug(model.add_attribute(node.node_id).node_id, "GungOutPlug")
+            if upstream_plug is not None:
+                model.add_edge(upstream_plug.node_id, in_plug.node_id)
+            upstream_plug = out_plug
+        node_ids = [x.node_id for x in model.get_children() if isinstance(x, NodeRecord)]
+
+        def matches_model(scene):
+            return sorted(scene.model.records.keys()) == sorted(model.records.keys()) and \
+                all(scene.model.has_connection(x.item_from_id, x.item_to_id) for x in model.iter_records(EdgeRecord))
+
+        scene = GungScene(self.view)
+        scene.set_virtualized(True)
+        scene.load_model(model)
+        scene.update_viewport(QRectF(0, 0, 1500, 500))
+        self.assert_(0 < len(scene.get_nodes()) < 20, "Wrong number of materialized nodes!")
+        self.assert_(not scene.check_item_index(), "Index is inconsistent in the virtualized scene!")
+        self.assert_(matches_model(scene), "Virtualized scene doesn't match the loaded model!")
+
+        loaded = GungModel()
+        loaded.from_xml(scene.as_xml().toxml())
+        self.assert_(len(loaded) == len(model), "Virtualized scene serialization failed!")
+
+        selected = scene.get_item_by_id(node_ids[0])
+        selected.setSelected(True)
+        scene.update_viewport(QRectF(5000, 5000, 1500, 500))
+        self.assert_(selected.scene() is scene, "Selected node has been released!")
+        self.assert_(scene.get_item_by_id(node_ids[2]) is None, "Node far from the viewport has not been released!")
+        self.assert_(len(scene.get_plugs()) == 2 * len(scene.get_nodes()), "Released plugs are still in the scene!")
+        self.assert_(not scene.check_item_index(), "Index is inconsistent after moving the viewport!")
+
+        scene.delete_called()
+        self.assert_(node_ids[0] not in scene.model, "Selected node has not been deleted!")
+        self.assert_(len(scene.model.get_node_edge_ids(node_ids[1])) == 1,
+                     "Edge of the deleted node is still in the model!")
+        scene.update_viewport(QRectF(0, 0, 1500, 500))
+        scene.undo_called()
+        self.assert_(matches_model(scene), "Undo of the delete failed in the virtualized scene!")
+
+        scene.set_virtualized(False)
+        self.assert_(len(scene.get_nodes()) == 100, "Nodes have not been materialized!")
+        self.assert_(not scene.check_item_index(), "Index is inconsistent after turning the virtualization off!")
+
+    def test_edge_geometry(self):
+        """
+        Checks if the cached geometry of the edge follows its plugs.
+        """
+        scene = GungScene(self.view)
+        node_a = GungNode("a", None, scene)
+        out_plug = GungOutPlug(GungAttribute(node_a, scene), scene)
+        node_b = GungNode("b", None, scene)
+        in_plug = GungInPlug(GungAttribute(node_b, scene), scene)
+        node_b.setPos(300, 200)
+        scene.create_edge_call(out_plug, in_plug)
+        edge = scene.get_edges()[0]
+
+        path = edge.path
+        edge.update_position()
+        self.assert_(edge.path is path, "Path has been rebuilt although the plugs haven't moved!")
+
+        node_b.setPos(400, -100)
+        end = in_plug.mapToScene(in_plug.boundingRect().center())
+        self.assert_(edge.path.currentPosition() == end, "Path doesn't end at the moved plug!")
+        self.assert_(edge.boundingRect().contains(edge.path.controlPointRect()), "Bounding rect is too small!")
+        self.assert_(edge.shape().contains(edge.path.pointAtPercent(0.5)), "Shape doesn't follow the path!")
+
+    def test_level_of_detail(self):
+        """
+        Checks if the scene can be painted with all the levels of detail.
+        """
+        scene = GungScene(self.view)
+        upstream_plug = None
+        for i in range(10):
+            node = GungNode("test%i" % i, None, scene)
+            node.setX(i * 100)
+            plug = GungInPlug(GungAttribute(node, scene), scene)
+            if upstream_plug is not None:
+                scene.create_edge_call(upstream_plug, plug)
+            upstream_plug = GungOutPlug(GungAttribute(node, scene), scene)
+            node.rearrange_attributes()
+
+        source = scene.itemsBoundingRect()
+        for scale in (1.0, 0.4, 0.3, 0.1):
+            image = QImage(int(source.width() * scale) + 1, int(source.height() * scale) + 1, QImage.Format_ARGB32)
+            image.fill(0)
+            painter = QPainter(image)
+            scene.render(painter, QRectF(image.rect()), source)
+            painter.end()
+            self.assert_(image.pixel(image.width() / 2, image.height() / 2) != 0, "Nothing has been painted!")
+
+    def test_exact_bounds(self):
+        """
+        Checks if the items paint only inside of their bounding rects, so that the view doesn't leave any artifacts
+        when it repaints only the changed parts of the viewport.
+        """
+        scene = GungScene(self.view)
+        node_a = GungNode("a", None, scene)
+        out_plug = GungOutPlug(GungAttribute(node_a, scene), scene)
+        node_a.rearrange_attributes()
+        node_b = GungNode("b", None, scene)
+        in_plug = GungInPlug(GungAttribute(node_b, scene), scene)
+        node_b.rearrange_attributes()
+        node_b.setPos(300, 200)
+        node_b.set_size(QPointF(150, 120))
+        scene.create_edge_call(out_plug, in_plug)
+        node_a.setSelected(True)
+        node_b.setSelected(True)
+        scene.create_group_called()
+        group = [item for item in scene.items() if isinstance(item, GungGroup)][0]
+        scene.init_dragging_edge(QPointF(50, 300), out_plug)
+        scene.update_dragging_edge(QPointF(250, 350))
+
+        source = QRectF(scene.itemsBoundingRect().adjusted(-10, -10, 10, 10).toAlignedRect())
+
+        def render(bounds):
+            image = QImage(int(source.width()), int(source.height()), QImage.Format_ARGB32)
+            image.fill(0)
+            painter = QPainter(image)
+            scene.render(painter, QRectF(image.rect()), source)
+            # --- clear the area that the item is allowed to paint in.
+            painter.setCompositionMode(QPainter.CompositionMode_Source)
+            painter.fillRect(bounds.translated(-source.topLeft()).adjusted(-1, -1, 1, 1), QColor(0, 0, 0, 0))
+            painter.end()
+            return image
+
+        def get_bounds(item):
+            bounds = item.sceneBoundingRect()
+            for child_item in item.childItems():
+                bounds = bounds.united(get_bounds(child_item))
+            return bounds
+
+        for item in (node_b, scene.get_edges()[0], group, scene.draggingEdge):
+            bounds = get_bounds(item)
+            image = render(bounds)
+            item.setVisible(False)
+            self.assert_(image == render(bounds), "%s paints outside of its bounding rect!" % item.__class__.__name__)
+            item.setVisible(True)
+
+    def test_edge_layer(self):
+        """
+        Checks if the batched edges are painted and hit-tested through the edge layer.
+        """
+        scene = GungScene(self.view)
+        node_a = GungNode("a", None, scene)
+        out_plug = GungOutPlug(GungAttribute(node_a, scene), scene)
+        node_a.rearrange_attributes()
+        node_b = GungNode("b", None, scene)
+        in_plug = GungInPlug(GungAttribute(node_b, scene), scene)
+        node_b.rearrange_attributes()
+        node_b.setPos(300, 200)
+        scene.create_edge_call(out_plug, in_plug)
+        edge = scene.get_edges()[0]
+        middle = edge.path.pointAtPercent(0.5)
+
+        scene.set_batched_edges(True)
+        self.assert_(edge.boundingRect().isNull(), "Batched edge still has its own bounds!")
+        self.assert_(scene.get_edge_at_point(middle) is edge, "Batched edge can't be hit!")
+        self.assert_(scene.get_edge_at_point(middle + QPointF(50, 0)) is None, "Hit an edge in the empty space!")
+
+        self.assert_(scene.get_edge_at_point(middle + QPointF(3, 0)) is None, "Edge is wider than its pen!")
+        self.assert_(scene.get_edge_at_point(middle + QPointF(3, 0), 4.0) is edge, "Hit tolerance is not used!")
+
+        self.view.setScene(scene)
+        # --- a few pixels off the curve, which is just a pixel wide
+        click_pos = self.view.mapFromScene(middle) + QPoint(3, 0)
+        for event_type, view_event in ((QEvent.MouseButtonPress, self.view.mousePressEvent),
+                                       (QEvent.MouseButtonRelease, self.view.mouseReleaseEvent)):
+            view_event(QMouseEvent(event_type, click_pos, Qt.LeftButton, Qt.LeftButton, Qt.NoModifier))
+        self.assert_(edge.isSelected(), "Batched edge has not been selected by the click!")
+        self.view.select_items_in_rubber_band(self.view.mapFromScene(edge.bounding_rect).boundingRect(), True, False)
+        self.assert_(not edge.isSelected(), "Batched edge has not been deselected by the rubber band!")
+
+        image = QImage(400, 300, QImage.Format_ARGB32)
+        image.fill(0)
+        painter = QPainter(image)
+        scene.render(painter, QRectF(image.rect()), QRectF(image.rect()))
+        painter.end()
+        painted = [image.pixel(int(middle.x()) + x, int(middle.y()) + y) for x in range(-2, 3) for y in range(-2, 3)]
+        self.assert_(any(painted), "Batched edge has not been painted!")
+
+        node_b.setPos(400, -100)
+        middle = edge.path.pointAtPercent(0.5)
+        self.assert_(scene.get_edge_at_point(middle) is edge, "Edge layer doesn't follow the moved edge!")
+
+        scene.set_batched_edges(False)
+        self.assert_(scene.get_edge_at_point(middle) is edge, "Edge can't be hit after it's been unbatched!")
+
+        scene.set_batched_edges(True)
+        scene.remove_edge(edge.properties['node_id'])
+        self.assert_(scene.get_edge_at_point(middle) is None, "Removed edge is still in the edge layer!")
+
+    def test_styles(self):
+        """
+        Checks if the items share their pens and brushes and if the subclasses can register their own.
+        """
+        class CustomNode(GungNode):
+            pass
+
+        scene = GungScene(self.view)
+        node = GungNode("a", None, scene)
+        custom_node = CustomNode("b", None, scene)
+        self.assert_(node.get_pen("selected") is custom_node.get_pen("selected"), "Pens are not shared!")
+
+        styles.set_brush(CustomNode, "default", QBrush(QColor(255, 0, 0)))
+        try:
+            self.assert_(custom_node.get_brush().color() == QColor(255, 0, 0), "Subclass brush is not used!")
+            self.assert_(node.get_brush() is not custom_node.get_brush(), "Subclass brush is used by the base class!")
+            self.assert_(node.get_pen() is custom_node.get_pen(), "Base class pen is not used by the subclass!")
+            self.assert_(custom_node.lightGrayBrush is custom_node.get_brush() and
+                         node.selectedPen is node.get_pen("selected"), "Old names of the styles don't work!")
+        finally:
+            styles.set_brush(CustomNode, "default", node.get_brush())
+
+    def test_settings(self):
+        """
+        Checks if the scenes override the settings only for themselves and if they get the reloaded settings.
+        """
+        scene = GungScene(self.view)
+        other_scene = GungScene(self.view)
+        scene.override_settings(node={"minimal_width": 150.0})
+        node = GungNode("a", None, scene)
+        other_node = GungNode("b", None, other_scene)
+        self.assert_(node.properties['node_width'] == 150.0, "Scene settings are not used!")
+        self.assert_(other_node.properties['node_width'] == get_settings().node.minimal_width,
+                     "Settings of one scene are used by the other one!")
+        self.assertRaises(AttributeError, setattr, scene.settings.node, "minimal_width", 10.0)
+
+        scene.override_settings(node={"node_color": (255, 0, 0)}, level_of_detail={"text": 0.9})
+        self.assert_(node.get_brush().color() == QColor(255, 0, 0), "Scene color is not used by its items!")
+        self.assert_(other_node.get_brush().color() == QColor(*get_settings().node.node_color),
+                     "Color of one scene is used by the other one!")
+        self.assert_(node.get_pen("disabled") is other_node.get_pen("disabled"),
+                     "Styles that are not overridden are not shared!")
+        self.assert_(scene.settings.level_of_detail.text == 0.9 and
+                     other_scene.settings.level_of_detail.text == get_settings().level_of_detail.text,
+                     "Level of detail of the scene has not been overridden!")
+        self.assertRaises(ValueError, scene.override_settings, view={"grid": True})
+
+        parser = ConfigParser.ConfigParser()
+        parser.read(config_path)
+        parser.set("Node", "MinimalHeight", "70.0")
+        config_file, path = tempfile.mkstemp(".cfg")
+        try:
+            with os.fdopen(config_file, "w") as f:
+                parser.write(f)
+            reload_settings(path)
+            self.assert_(get_settings().node.minimal_height == 70.0, "Settings have not been reloaded!")
+            self.assert_(other_scene.settings.node.minimal_height == 70.0, "Scene has not got the reloaded settings!")
+            self.assert_(scene.settings.node.minimal_width == 150.0, "Scene has lost its overrides on reload!")
+            self.assert_(node.get_brush().color() == QColor(255, 0, 0), "Scene has lost its colors on reload!")
+        finally:
+            reload_settings()
+            os.remove(path)
+
+    def test_background_grid(self):
+        """
+        Checks if the grid gets sparser as the view zooms out and if the view can be painted with it.
+        """
+        self.view.setScene(GungScene(self.view))
+        self.view.set_grid_visible(True)
+        spacing = self.view.get_grid_spacing()
+        image = QImage(self.view.size(), QImage.Format_ARGB32)
+        for scale in (1.0, 0.5, 0.1):
+            self.view.resetTransform()
+            self.view.scale(scale, scale)
+            self.assert_(self.view.get_grid_spacing() * scale >= get_settings().view.grid_minimal_spacing,
+                         "Grid lines are too dense!")
+            self.view.render(image)
+        self.assert_(self.view.get_grid_spacing() > spacing, "Grid doesn't follow the zoom!")
+        tile = self.view._get_grid_tile(20.1)
+        self.assert_(tile.width() == 40 and self.view._get_grid_tile(20.2) is tile,
+                     "Grid tile is not made of two cells quantized to half a pixel!")
+
+        center = self.view.viewport().rect().center()
+        overlay = self.view.get_overlay_rects()
+        self.assert_(any(x.contains(center.x(), 0) for x in overlay) and
+                     any(x.contains(0, center.y()) for x in overlay), "Cross is not repainted while scrolling!")
+        self.assert_(not any(x.contains(center.x() / 2, center.y() / 2) for x in overlay),
+                     "Scrolling repaints more than the overlay!")
+
+    def test_item_cache(self):
+        """
+        Checks if the cached node is repainted only when its look changes.
+        """
+        class CachedNode(GungNode):
+            cache_mode = QGraphicsItem.DeviceCoordinateCache
+            paint_count = 0
+
+            def paint(self, painter, option, widget=None):
+                CachedNode.paint_count += 1
+                return GungNode.paint(self, painter, option, widget)
+
+        scene = GungScene(self.view)
+        self.view.setScene(scene)
+        node = CachedNode("a", None, scene)
+        self.assert_(node.cacheMode() == QGraphicsItem.DeviceCoordinateCache, "Cache mode has not been set!")
+        image = QImage(self.view.size(), QImage.Format_ARGB32)
+
+        def is_repainted():
+            paint_count = CachedNode.paint_count
+            self.view.render(image)
+            return CachedNode.paint_count > paint_count
+
+        is_repainted()
+        self.assert_(not is_repainted(), "Node has been repainted although nothing has changed!")
+        node.setPos(10, 10)
+        self.assert_(not is_repainted(), "Node has been repainted after a move!")
+        node.set_name("b")
+        self.assert_(is_repainted(), "Node has not been repainted after a rename!")
+        node.setSelected(True)
+        self.assert_(is_repainted(), "Node has not been repainted after a selection!")
+        node.set_disabled(True)
+        self.assert_(is_repainted(), "Node has not been repainted after it's been disabled!")
+        node.set_size(QPointF(200, 200))
+        self.assert_(is_repainted(), "Node has not been repainted after a resize!")
+
+    def test_node_label(self):
+        """
+        Checks if the labels of the node are elided and laid out again only when the text, font or width change.
+        """
+        scene = GungScene(self.view)
+        node = GungNode("a_very_long_name_of_the_node", None, scene)
+        font = QFont()
+        label = node.get_label("name", node.properties['name'], font, 40.0)
+        self.assert_(label is node.get_label("name", node.properties['name'], font, 40.0), "Label is not cached!")
+        self.assert_(len(label.text()) < len(node.properties['name']), "Label has not been elided!")
+
+        wide_label = node.get_label("name", node.properties['name'], font, 1000.0)
+        self.assert_(wide_label is not label, "Label has not been laid out again after the width has changed!")
+        self.assert_(wide_label.text() == node.properties['name'], "Label has been elided although it fits!")
+
+        font.setPointSize(font.pointSize() + 4)
+        self.assert_(node.get_label("name", node.properties['name'], font, 1000.0) is not wide_label,
+                     "Label has not been laid out again after the font has changed!")
+        self.assert_(node.get_label("type", "b", font, 1000.0).text() == "b", "Secondary label is wrong!")
+
+    def test_journal(self):
+        """
+        Checks if the changes made by the undo stack are journaled and recovered after a crash.
+        """
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "scene.json")
+        try:
+            scene = GungScene(self.view)
+            node_a = GungNode("a", None, scene)
+            plug_a = GungOutPlug(GungAttribute(node_a, scene), scene)
+            node_b = GungNode("b", None, scene)
+            plug_b = GungInPlug(GungAttribute(node_b, scene), scene)
+            journal = GungJournal(path)
+            journal.attach(scene)
+            journal.compact()
+
+            scene.create_edge_call(plug_a, plug_b)
+            command = GungMoveCommand(scene)
+            command.nodes[node_b.properties['node_id']] = [0.0, 0.0, 300.0, 50.0]
+            scene.undoStack.push(command)
+            scene.undoStack.undo()
+            scene.undoStack.redo()
+            scene.undoStack.push(GungDeleteItemsCommand(scene, [node_a]))
+            self.assert_(journal.entry_count == 5, "Wrong number of journal entries!")
+
+            # --- crash in the middle of writing an entry
+            journal.detach()
+            with open(journal.journal_path, "ab") as journal_file:
+                journal_file.write('{"put":[')
+
+            scene_b = GungScene(self.view)
+            journal_b = GungJournal(path)
+            self.assert_(journal_b.load(scene_b) == 5, "Wrong number of recovered entries!")
+            journal_b.detach()
+            self.assert_(scene_b.model.as_xml().toxml() == scene.model.as_xml().toxml(), "Scene has not been recovered!")
+            self.assert_(os.path.getsize(journal.journal_path) == 0, "Journal has not been compacted!")
+        finally:
+            shutil.rmtree(directory)
+
+    def test_lazy_groups(self):
+        """
+        Checks if the content of the groups loaded from the binary file is created only when it's needed.
+        """
+        model = GungModel()
+        upstream_plug = None
+        for i in range(10):
+            node = model.add_node("test%i" % i, i * 1000.0)
+            in_plug = model.add_plug(model.add_attribute(node.node_id).node_id, "GungInPlug")
+            out_plug = model.add_plug(model.add_attribute(node.node_id).node_id, "GungOutPlug")
+            if upstream_plug is not None:
+                model.add_edge(upstream_plug.node_id, in_plug.node_id)
+            upstream_plug = out_plug
+        near_group = model.add_group()
+        model.set_parent(0, near_group.node_id)
+        far_group = model.add_group()
+        model.set_parent(29, far_group.node_id)
+        binary_file = StringIO()
+        write_binary(model, binary_file)
+
+        scene = GungScene(self.view)
+        scene.load_binary(StringIO(binary_file.getvalue()), lazy_groups=True)
+        group = scene.get_item_by_id(far_group.node_id)
+        self.assert_(scene.get_item_by_id(29) is None, "Content of the group has been loaded!")
+        self.assert_(group.rect.width() > model.get(29).node_width, "Frame of the group has not been set!")
+        self.assert_(len(group.edges) == 2, "Edges have not been attached to the group!")
+
+        scene.update_viewport(QRectF(0, 0, 1500, 500))
+        self.assert_(scene.get_item_by_id(0) is not None, "Group near the viewport has not been loaded!")
+        self.assert_(scene.get_item_by_id(29) is None, "Group far from the viewport has been loaded!")
+
+        scene.expand_group(far_group.node_id)
+        self.assert_(not group.edges, "Edges are still attached to the group!")
+        self.assert_(all(x.item_from.scene() is scene and x.item_to.scene() is scene for x in scene.get_edges()),
+                     "Edges have not been reconnected!")
+        self.assert_(scene.model.as_xml().toxml() == model.as_xml().toxml(), "Scene doesn't match the model!")
+        self.assert_(not scene.check_item_index(), "Index is inconsistent after loading the groups!")
+
     def tearDown(self):
         self.w.close()
         self.app.quit()
 
+
+class TestGungModel(unittest.TestCase):
+    """
+    Tests of the headless model, they don't create any Qt objects.
+    """
+
+    def build(self, model, node_count):
+        upstream_plug = None
+        for i in range(node_count):
+            node = model.add_node("test%i" % i, i * 150.0)
+            in_plug = model.add_plug(model.add_attribute(node.node_id).node_id, "GungInPlug")
+            out_plug = model.add_plug(model.add_attribute(node.node_id).node_id, "GungOutPlug")
+            if upstream_plug is not None:
+                model.add_edge(upstream_plug.node_id, in_plug.node_id)
+            upstream_plug = out_plug
+
+    def test_save_load_xml(self):
+        model = GungModel()
+        self.build(model, 10)
+        model.get(0)["custom"] = "value"
+
+        model_b = GungModel()
+        model_b.from_xml(model.as_xml().toxml())
+        self.assert_(model_b.as_xml().toxml() == model.as_xml().toxml(), "Model serialization failed!")
+        self.assert_(isinstance(model_b.get(0), NodeRecord), "Wrong record class of the loaded node!")
+        self.assert_(model_b.get(0)["custom"] == "value", "Custom property has not been loaded!")
+
+        xml_file = StringIO()
+        model.write_xml(xml_file)
+        self.assert_(xml_file.getvalue() == model.as_xml().toxml().encode("utf-8"), "Streamed xml differs from as_xml!")
+
+    def test_load_xml(self):
+        """
+        Checks if the model is loaded from the path of the xml file and if the progress is reported.
+        """
+        model = GungModel()
+        self.build(model, 100)
+        xml_file, path = tempfile.mkstemp(".xml")
+        try:
+            with os.fdopen(xml_file, "w") as f:
+                f.write(model.as_xml().toxml())
+            progress = []
+            model_b = GungModel()
+            model_b.load_xml(path, progress.append)
+        finally:
+            os.remove(path)
+        self.assert_(model_b.as_xml().toxml() == model.as_xml().toxml(), "Model has not been loaded from the file!")
+        self.assert_(progress and progress[-1] == 1.0, "Progress has not been reported!")
+        self.assert_(progress == sorted(progress), "Progress has gone back!")
+
+    def test_record_schema(self):
+        """
+        Checks if the fields of every type are decoded to their types and are the same after saving and loading.
+        """
+        model = GungModel()
+        node = model.add_node(u"n\xf3de", 1 / 3.0, -2.5)
+        attribute = model.add_attribute(node.node_id)
+        attribute.inverted = True
+        model.add_attribute(node.node_id).inverted = False
+        plug_a = model.add_plug(attribute.node_id, "GungOutPlug")
+        plug_b = model.add_plug(attribute.node_id, "GungInPlug")
+        plug_b.plug_width = 1e-7
+        model.add_edge(plug_a.node_id, plug_b.node_id)
+
+        xml_file = StringIO()
+        model.write_xml(xml_file)
+        model_b = GungModel()
+        model_b.load_xml(StringIO(xml_file.getvalue()))
+        for record in model.iter_records():
+            record_b = model_b.get(record.node_id)
+            for field in record.fields:
+                value, value_b = record[field], record_b[field]
+                self.assert_(value == value_b and type(value) is type(value_b), "Field %s has not been loaded!" % field)
+
+        schema = get_record_schema(AttributeRecord)
+        self.assert_(schema is get_record_schema(AttributeRecord), "Schema has not been cached!")
+        self.assert_(schema.decode("inverted", "False") is False, "Bool has not been decoded!")
+        self.assert_(schema.decode("attr_height", "20.5") == 20.5, "Float has not been decoded!")
+        self.assert_(schema.decode("custom", "value") == "value", "Extra property has been decoded!")
+        self.assert_(schema.encode(attribute)["inverted"] == "True", "Bool has not been encoded!")
+
+        class BrokenRecord(NodeRecord):
+            __slots__ = ("color",)
+            fields = NodeRecord.fields + __slots__
+        self.assertRaises(ValueError, get_record_schema, BrokenRecord)
+
+    def test_save_load_binary(self):
+        """
+        Checks if the model is the same after saving and loading it in the binary format.
+        """
+        model = GungModel()
+        self.build(model, 10)
+        model.get(0)["custom"] = "value"
+        model.get(1)["inverted"] = True
+        model.get(2)["count"] = 7
+        model.get(5).name = u"n\xf3de"
+        model.get(5)["label"] = u"\u0161\xedpka"
+
+        binary_file = StringIO()
+        write_binary(model, binary_file)
+        model_b = GungModel()
+        header = read_binary(model_b, StringIO(binary_file.getvalue()))
+        self.assert_(model_b.as_xml().toxml() == model.as_xml().toxml(), "Binary serialization failed!")
+        self.assert_(model_b.get(1)["inverted"] is True, "Bool property has not been loaded!")
+        self.assert_(model_b.get(2)["count"] == 7, "Int property has not been loaded!")
+        self.assert_(model_b.get(5).name == u"n\xf3de" and isinstance(model_b.get(3).name, unicode),
+                     "Non-ascii name has not been decoded!")
+        self.assert_(model_b.get(5)["label"] == u"\u0161\xedpka", "Non-ascii property has not been decoded!")
+        model_b.add_node(u"n\xf3de 2")
+        model_b.as_xml().toxml()
+        self.assert_(model_b.get_edge_between(4, 7) is not None, "Connection has not been loaded!")
+        self.assert_(header.bounds == (0.0, 0.0, 9 * 150.0 + model.get(0).node_width, model.get(0).node_height),
+                     "Wrong bounds in the header!")
+        self.assertRaises(ValueError, read_binary, GungModel(), StringIO(model.as_xml().toxml()))
+
+    def test_lazy_groups(self):
+        """
+        Checks if the binary file lets the content of the groups be loaded later.
+        """
+        model = GungModel()
+        self.build(model, 10)
+        group = model.add_group()
+        group.pos_x = 100.0
+        for node_id in (11, 17):
+            model.set_parent(node_id, group.node_id)
+
+        binary_file = StringIO()
+        write_binary(model, binary_file)
+        model_b = GungModel()
+        header = read_binary(model_b, StringIO(binary_file.getvalue()), lazy_groups=True)
+        self.assert_(len(header.groups) == 1, "Wrong number of groups in the header!")
+        group_b = header.groups[0]
+        self.assert_(group_b.node_id == group.node_id and sorted(group_b.port_ids) == [13, 15, 19, 21],
+                     "Wrong ports of the group!")
+        self.assert_(group_b.bounds == (400.0, 0.0, 550.0 + model.get(17).node_width, model.get(17).node_height),
+                     "Wrong bounds of the group!")
+        self.assert_(11 not in model_b and group.node_id in model_b, "Content of the group has been loaded!")
+        self.assert_(model_b.id_allocator.allocate() == len(model), "Ids inside of the group have not been claimed!")
+
+        read_binary_group(model_b, StringIO(binary_file.getvalue()), group_b)
+        self.assert_(model_b.as_xml().toxml() == model.as_xml().toxml(), "Content of the group has not been loaded!")
+
+    def test_serializers(self):
+        """
+        Checks if the model is the same after saving and loading it with every registered serializer.
+        """
+        model = GungModel()
+        self.build(model, 10)
+        model.get(0)["custom"] = "value"
+        model.get(1)["inverted"] = True
+        model.get(5).name = u"n\xf3de"
+        model.get(5)["label"] = u"\u0161\xedpka"
+
+        for name, serializer in serializers.items():
+            model_file = StringIO()
+            serializer.write(model, model_file)
+            model_b = GungModel()
+            serializer.read(model_b, StringIO(model_file.getvalue()))
+            self.assert_(model_b.as_xml().toxml() == model.as_xml().toxml(), "%s serialization failed!" % name)
+            self.assert_(model_b.get(0)["custom"] == "value", "%s hasn't loaded the custom property!" % name)
+            self.assert_(model_b.get(1)["inverted"] is True, "%s hasn't loaded the bool property!" % name)
+            self.assert_(model_b.get(5).name == u"n\xf3de", "%s hasn't loaded the non-ascii name!" % name)
+        self.assertRaises(ValueError, get_serializer, "unknown")
+
+        class WriteOnlySerializer(GungSerializer):
+            name = "write_only"
+
+            def write(self, model, target):
+                model.write_xml(target)
+        self.assertRaises(TypeError, WriteOnlySerializer)
+        self.assertRaises(ValueError, register_serializer, object())
+
+    def test_connections(self):
+        model = GungModel()
+        self.build(model, 3)
+        edge_id = model.get_edge_between(4, 7)
+        self.assert_(edge_id is not None and model.has_connection(7, 4), "Connection has not been registered!")
+        self.assert_(model.get_plug_edge_ids(7) == [edge_id], "Wrong adjacency of the plug!")
+
+        model.remove_tree(0)
+        self.assert_(not model.has_connection(4, 7), "Connection of the removed node is still registered!")
+        self.assert_(model.get(edge_id) is None, "Edge of the removed node is still in the model!")
+        self.assert_(not model.id_allocator.is_used(0), "Id of the removed node has not been released!")
+
+    def test_spatial_index(self):
+        index = GungSpatialIndex(100.0)
+        for i in range(100):
+            index.insert(i, ((i % 10) * 100.0, (i / 10) * 100.0, 50.0, 50.0))
+        index.insert("long", (0.0, 0.0, 100000.0, 10.0))
+        self.assert_(index.query((0.0, 0.0, 120.0, 120.0)) == set([0, 1, 10, 11, "long"]), "Wrong query result!")
+
+        index.insert(0, (5000.0, 5000.0, 50.0, 50.0))
+        index.remove(1)
+        self.assert_(index.query((0.0, 0.0, 120.0, 120.0)) == set([10, 11, "long"]), "Index has not been updated!")
+        self.assert_(index.bounds() == (0.0, 0.0, 100000.0, 5050.0), "Wrong bounds of the index!")
+
 if __name__ == '__main__':
     unittest.main()